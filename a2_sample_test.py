@@ -1,4 +1,19 @@
-from prefix_tree import SimplePrefixTree
+from prefix_tree import SimplePrefixTree, CompressedPrefixTree
+from array_prefix_tree import ArrayPrefixTree
+from frozen_prefix_tree import FrozenPrefixTree
+from dawg import DawgAutocompleter
+from double_array_trie import DoubleArrayTrie
+from ternary_search_tree import TernarySearchTree
+from radix_tree import StringRadixTree
+from copy_on_write_prefix_tree import CopyOnWritePrefixTree
+from sharded_autocompleter import ShardedAutocompleter
+from autocomplete_server import AutocompleteServer
+import asyncio
+import json
+import pytest
+import sys
+import threading
+import time
 import unittest
 
 ################################################################################
@@ -125,6 +140,920 @@ def test_insert_sum_inserted() -> None:
     assert tree.subtrees[0].weight == 7
     assert tree.__len__() == 1
 
+################################################################################
+# Aggregate weights
+################################################################################
+
+
+def test_aggregates_after_insert_and_remove() -> None:
+    tree = SimplePrefixTree('average')
+    tree.insert("cat", 2, ['c', 'a', 't'])
+    tree.insert("car", 4, ['c', 'a', 'r'])
+    tree.insert("dog", 6, ['d', 'o', 'g'])
+    tree.insert("car", 2, ['c', 'a', 'r'])
+
+    assert tree._get_weight() == (3, 14)
+    assert tree.weight == 14 / 3
+    assert tree.subtrees[0].value == ['d']
+    assert tree.subtrees[1].weight == 4.0
+    assert tree.subtrees[1].subtrees[0].subtrees[0].value == ['c', 'a', 'r']
+
+    tree.remove(['c', 'a', 'r'])
+    assert tree._get_weight() == (2, 8)
+    assert tree.weight == 4.0
+    assert tree.subtrees[0].value == ['d']
+    assert tree.subtrees[1].weight == 2.0
+
+    tree.remove(['c'])
+    tree.remove(['d'])
+    assert tree._get_weight() == (0, 0.0)
+    assert tree.is_empty()
+
+
+def test_compressed_remove_merges_compressible() -> None:
+    tree = CompressedPrefixTree('sum')
+    tree.insert("cat", 2, ['c', 'a', 't'])
+    tree.insert("car", 3, ['c', 'a', 'r'])
+    tree.insert("dog", 1, ['d', 'o', 'g'])
+    assert tree.subtrees[0].value == ['c', 'a']
+
+    tree.remove(['c', 'a', 'r'])
+    assert tree.subtrees[0].value == ['c', 'a', 't']
+    assert tree.subtrees[0].subtrees[0].value == "cat"
+    tree.insert("cab", 4, ['c', 'a', 'b'])
+    assert tree.subtrees[0].value == ['c', 'a']
+
+
+def test_tombstone_remove_and_compact() -> None:
+    for cls in [SimplePrefixTree, CompressedPrefixTree]:
+        tree = cls('sum')
+        eager = cls('sum')
+        for t in [tree, eager]:
+            t.insert("cat", 2, ['c', 'a', 't'])
+            t.insert("car", 3, ['c', 'a', 'r'])
+            t.insert("dog", 4, ['d', 'o', 'g'])
+            t.insert("do", 2, ['d', 'o'])
+            t.insert("cut", 1, ['c', 'u', 't'])
+        eager.remove(['d', 'o', 'g'])
+        eager.remove(['c', 'a', 'r'])
+
+        tree.remove(['d', 'o', 'g'], tombstone=True)
+        tree.remove(['c', 'a', 'r'], tombstone=True)
+        assert len(tree) == 3
+        assert tree.count(['c', 'a']) == 1
+        assert tree.autocomplete(['c', 'a', 'r']) == []
+        assert sorted(tree.autocomplete([])) == \
+            [("cat", 2), ("cut", 1), ("do", 2)]
+
+        tree.compact()
+        assert str(tree) == str(eager)
+
+
+################################################################################
+# Counting values
+################################################################################
+
+
+def test_len_and_count() -> None:
+    for tree in [SimplePrefixTree('sum'), CompressedPrefixTree('average'),
+                 ArrayPrefixTree('sum')]:
+        tree.insert("cat", 2, ['c', 'a', 't'])
+        tree.insert("car", 4, ['c', 'a', 'r'])
+        tree.insert("cart", 1, ['c', 'a', 'r', 't'])
+        tree.insert("dog", 6, ['d', 'o', 'g'])
+        tree.insert("car", 2, ['c', 'a', 'r'])
+
+        assert len(tree) == 4
+        assert tree.count([]) == 4
+        assert tree.count(['c']) == 3
+        assert tree.count(['c', 'a', 'r']) == 2
+        assert tree.count(['c', 'a', 'r', 't', 's']) == 0
+        assert tree.count(['x']) == 0
+
+        tree.remove(['c', 'a', 'r'])
+        assert len(tree) == 2
+        assert tree.count(['c']) == 1
+
+
+################################################################################
+# Exact top-k autocomplete
+################################################################################
+
+
+def test_exact_autocomplete() -> None:
+    for tree in [SimplePrefixTree('sum'), SimplePrefixTree('average'),
+                 CompressedPrefixTree('sum'), CompressedPrefixTree('average')]:
+        tree.insert("cat", 2, ['c', 'a', 't'])
+        tree.insert("car", 3, ['c', 'a', 'r'])
+        tree.insert("cart", 1, ['c', 'a', 'r', 't'])
+        tree.insert("dog", 4, ['d', 'o', 'g'])
+        tree.insert("do", 1, ['d', 'o'])
+
+        assert tree.autocomplete([], 1, exact=True) == [("dog", 4)]
+        assert tree.autocomplete([], 2, exact=True) == [("dog", 4), ("car", 3)]
+        assert tree.autocomplete(['c'], 2, exact=True) == \
+            [("car", 3), ("cat", 2)]
+        assert [w for _, w in tree.autocomplete([], exact=True)] == \
+            [4, 3, 2, 1, 1]
+        assert tree.autocomplete(['x'], 3, exact=True) == []
+
+        tree.remove(['d', 'o', 'g'])
+        assert tree.autocomplete([], 1, exact=True) == [("car", 3)]
+        assert tree._max == 3
+
+
+def test_iter_autocomplete() -> None:
+    for cls in [SimplePrefixTree, CompressedPrefixTree, ArrayPrefixTree]:
+        tree = cls('sum')
+        tree.insert("cat", 2, ['c', 'a', 't'])
+        tree.insert("car", 3, ['c', 'a', 'r'])
+        tree.insert("cart", 1, ['c', 'a', 'r', 't'])
+        tree.insert("dog", 4, ['d', 'o', 'g'])
+        tree.insert("do", 1, ['d', 'o'])
+
+        matches = tree.iter_autocomplete([])
+        assert next(matches) == ("dog", 4)
+        assert next(matches) == ("car", 3)
+        assert [w for _, w in matches] == [2, 1, 1]
+        assert list(tree.iter_autocomplete(['c', 'a', 'r'])) == \
+            [("car", 3), ("cart", 1)]
+        assert list(tree.iter_autocomplete(['x'])) == []
+
+
+################################################################################
+# Cached completions
+################################################################################
+
+
+def test_cached_completions() -> None:
+    for tree in [SimplePrefixTree('sum'), CompressedPrefixTree('average')]:
+        plain = tree.__class__(tree.weight_type)
+        tree.set_cache_size(2)
+        words = [("cat", 2), ("car", 3), ("cart", 1), ("dog", 4), ("do", 1),
+                 ("cat", 5)]
+        for word, weight in words:
+            tree.insert(word, weight, list(word))
+            plain.insert(word, weight, list(word))
+
+        assert len(tree._cache) == 2
+        for prefix in [[], ['c'], ['c', 'a', 'r'], ['d', 'o'], ['x']]:
+            for limit in [1, 2, 3, None]:
+                assert tree.autocomplete(prefix, limit) == \
+                    plain.autocomplete(prefix, limit)
+
+        tree.remove(['c', 'a', 't'])
+        plain.remove(['c', 'a', 't'])
+        for prefix in [[], ['c']]:
+            assert tree.autocomplete(prefix, 2) == plain.autocomplete(prefix, 2)
+
+        tree.set_cache_size(0)
+        assert tree._cache is None
+        assert tree.autocomplete([], 2) == plain.autocomplete([], 2)
+
+
+################################################################################
+# Child lookup
+################################################################################
+
+
+def test_children_index_simple() -> None:
+    tree = SimplePrefixTree('sum')
+    tree.insert("cat", 2, ['c', 'a', 't'])
+    tree.insert("dog", 3, ['d', 'o', 'g'])
+    tree.insert("cow", 4, ['c', 'o', 'w'])
+
+    assert tree._child_for(['c'], 0) is tree.subtrees[0]
+    assert tree._child_for(['d'], 0) is tree.subtrees[1]
+    assert tree.autocomplete(['c', 'o']) == [('cow', 4)]
+    assert tree.autocomplete(['x']) == []
+
+    tree.remove(['c', 'o'])
+    assert tree.subtrees[0].value == ['d']
+    assert tree.subtrees[1].weight == 2
+    assert tree._child_for(['c', 'o'], 0)._child_for(['c', 'o'], 1) is None
+
+
+def test_children_index_compressed_mid_edge() -> None:
+    tree = CompressedPrefixTree('sum')
+    tree.insert("cattle", 2, ['c', 'a', 't', 't', 'l', 'e'])
+    tree.insert("dog", 3, ['d', 'o', 'g'])
+
+    assert tree.autocomplete(['c', 'a']) == [('cattle', 2)]
+    assert tree.autocomplete(['c', 'o']) == []
+
+    tree.insert("cat", 1, ['c', 'a', 't'])
+    assert tree._child_for(['c'], 0).value == ['c', 'a', 't']
+    assert tree._child_for(['c'], 0)._child_for(['c', 'a', 't', 't'], 3) \
+        .value == ['c', 'a', 't', 't', 'l', 'e']
+
+    tree.remove(['c', 'a'])
+    assert len(tree) == 1
+    assert tree._child_for(['c'], 0) is None
+    assert [sub.value for sub in tree.subtrees] == [['d', 'o', 'g']]
+
+
+def test_children_index_wide_node() -> None:
+    tree = SimplePrefixTree('sum')
+    letters = 'abcdefghijklmnop'
+    for i, letter in enumerate(letters):
+        tree.insert(letter + "x", i + 1, [letter, 'x'])
+
+    assert tree._children is not None
+    for letter in letters:
+        assert tree._child_for([letter], 0).value == [letter]
+    assert tree.autocomplete(['p']) == [('px', 16)]
+
+    tree.remove(['c'])
+    assert tree._child_for(['c'], 0) is None
+    assert len(tree) == 15
+
+################################################################################
+# Node layout
+################################################################################
+
+
+def test_compact_node_layout() -> None:
+    tree = CompressedPrefixTree('sum')
+    tree.insert("cat", 2, ['c', 'a', 't'])
+    tree.insert("car", 3, ['c', 'a', 'r'])
+
+    leaf = tree.subtrees[0].subtrees[0].subtrees[0]
+    assert leaf.value == "car"
+    assert leaf.subtrees == []
+    assert not hasattr(tree, '__dict__')
+    assert not hasattr(leaf, '__dict__')
+    with pytest.raises(TypeError):
+        leaf.subtrees.append(tree)
+    assert leaf.subtrees == []
+    assert tree.subtrees[0].subtrees[1].subtrees[0].subtrees == []
+
+
+################################################################################
+# ArrayPrefixTree
+################################################################################
+
+
+def test_array_prefix_tree_matches_simple() -> None:
+    words = [("cat", 3), ("care", 2), ("car", 5), ("door", 1), ("danger", 4),
+             ("cope", 3), ("cop", 2), ("car", 1)]
+    for weight_type in ['sum', 'average']:
+        simple = SimplePrefixTree(weight_type)
+        tree = ArrayPrefixTree(weight_type)
+        for word, weight in words:
+            simple.insert(word, weight, list(word))
+            tree.insert(word, weight, list(word))
+
+        assert len(tree) == 7
+        assert tree.weight == simple.weight
+        for prefix in [[], ['c'], ['c', 'a', 'r'], ['x']]:
+            for limit in [None, 1, 2, 4]:
+                assert tree.autocomplete(prefix, limit) == \
+                    simple.autocomplete(prefix, limit)
+
+        simple.remove(['c', 'o'])
+        tree.remove(['c', 'o'])
+        assert len(tree) == 5
+        assert tree.autocomplete([]) == simple.autocomplete([])
+        tree.remove([])
+        assert len(tree) == 0
+        assert tree.autocomplete([]) == []
+
+
+def test_array_prefix_tree_reuses_nodes() -> None:
+    tree = ArrayPrefixTree('sum')
+    tree.insert("dog", 1, ['d', 'o', 'g'])
+    nodes = tree._node_count()
+    tree.remove(['d'])
+    assert tree._node_count() == 1
+    tree.insert("dig", 2, ['d', 'i', 'g'])
+    assert tree._node_count() == nodes
+    assert len(tree._parent) == nodes
+    assert tree.autocomplete(['d']) == [("dig", 2)]
+
+
+################################################################################
+# Bulk loading
+################################################################################
+
+
+def test_from_items_matches_insert() -> None:
+    items = [("cat", 2, ['c', 'a', 't']), ("car", 3, ['c', 'a', 'r']),
+             ("cart", 1, ['c', 'a', 'r', 't']), ("dog", 3, ['d', 'o', 'g']),
+             ("do", 1, ['d', 'o']), ("cat", 1, ['c', 'a', 't']),
+             ("", 2, []), ("care", 1, ['c', 'a', 'r', 'e'])]
+    for cls in [SimplePrefixTree, CompressedPrefixTree, ArrayPrefixTree]:
+        for weight_type in ['sum', 'average']:
+            inserted = cls(weight_type)
+            for value, weight, prefix in items:
+                inserted.insert(value, weight, prefix)
+            built = cls.from_items(weight_type, iter(items))
+            if cls is not ArrayPrefixTree:
+                assert str(built) == str(inserted)
+            assert len(built) == len(inserted) == 7
+            assert built.weight == inserted.weight
+            for prefix in [[], ['c'], ['c', 'a', 'r'], ['d', 'o'], ['x']]:
+                assert built.autocomplete(prefix) == \
+                    inserted.autocomplete(prefix)
+            built.insert("dot", 5, ['d', 'o', 't'])
+            assert built.autocomplete(['d'], 1) == [("dot", 5)]
+
+    assert len(CompressedPrefixTree.from_items('sum', [])) == 0
+
+
+def test_insert_many_matches_insert() -> None:
+    first = [("cat", 2, ['c', 'a', 't']), ("car", 2, ['c', 'a', 'r']),
+             ("dog", 3, ['d', 'o', 'g'])]
+    batch = [("cart", 1, ['c', 'a', 'r', 't']), ("cat", 1, ['c', 'a', 't']),
+             ("do", 4, ['d', 'o']), ("car", 1, ['c', 'a', 'r']),
+             ("cab", 3, ['c', 'a', 'b']), ("", 1, [])]
+    for cls in [SimplePrefixTree, CompressedPrefixTree]:
+        for weight_type in ['sum', 'average']:
+            one_by_one = cls.from_items(weight_type, first)
+            batched = cls.from_items(weight_type, first)
+            batched.set_cache_size(2)
+            for value, weight, prefix in batch:
+                one_by_one.insert(value, weight, prefix)
+            batched.insert_many(batch)
+            assert str(batched) == str(one_by_one)
+            assert len(batched) == 7
+            assert batched.autocomplete(['c'], 2) == \
+                one_by_one.autocomplete(['c'], 2)
+
+
+################################################################################
+# Deep trees
+################################################################################
+
+
+def test_deep_prefix_without_recursion() -> None:
+    depth = 2 * sys.getrecursionlimit()
+    prefix = [i % 2 for i in range(depth)]
+    for tree in [SimplePrefixTree('sum'), CompressedPrefixTree('sum')]:
+        tree.insert("long", 2, prefix)
+        tree.insert("short", 1, prefix[:depth // 2])
+        assert tree.autocomplete(prefix[:10]) == [("long", 2), ("short", 1)]
+        assert tree.autocomplete(prefix[:10], exact=True, limit=1) == \
+            [("long", 2)]
+        assert tree.count(prefix[:depth // 2]) == 2
+        assert str(tree).endswith("short (1)\n")
+        tree.remove(prefix)
+        assert tree.autocomplete([]) == [("short", 1)]
+        assert tree.weight == 1
+
+
+################################################################################
+# Snapshots
+################################################################################
+
+
+def test_save_load_round_trip(tmp_path) -> None:
+    items = [("cat", 2, ['c', 'a', 't']), ("car", 3, ['c', 'a', 'r']),
+             ("cart", 1.5, ['c', 'a', 'r', 't']), ("", 2, [])]
+    items += [(letter, 1, ['w', letter]) for letter in 'abcdefghijk']
+    path = str(tmp_path / 'tree.bin')
+    for cls in [SimplePrefixTree, CompressedPrefixTree, ArrayPrefixTree]:
+        for weight_type in ['sum', 'average']:
+            tree = cls.from_items(weight_type, items)
+            tree.save(path)
+            loaded = cls.load(path)
+            if cls is not ArrayPrefixTree:
+                assert str(loaded) == str(tree)
+            assert len(loaded) == len(tree)
+            assert loaded.weight == tree.weight
+            for prefix in [[], ['c', 'a'], ['w'], ['w', 'k'], ['x']]:
+                assert loaded.autocomplete(prefix) == tree.autocomplete(prefix)
+            for changed in [tree, loaded]:
+                changed.insert("wk", 4, ['w', 'k'])
+                changed.remove(['c', 'a', 't'])
+            assert loaded.autocomplete([]) == tree.autocomplete([])
+
+
+def test_load_checks_snapshot(tmp_path) -> None:
+    path = tmp_path / 'tree.bin'
+    tree = SimplePrefixTree('sum')
+    tree.set_cache_size(2)
+    tree.insert("cat", 2, ['c', 'a', 't'])
+    tree.save(str(path))
+    loaded = SimplePrefixTree.load(str(path))
+    assert loaded.autocomplete(['c'], 1) == [("cat", 2)]
+    assert loaded._cache is not None and loaded._cache.size == 2
+    for cls in [CompressedPrefixTree, ArrayPrefixTree]:
+        try:
+            cls.load(str(path))
+        except ValueError:
+            pass
+        else:
+            assert False
+    data = path.read_bytes()
+    for bad in [b'not a snapshot', data[:-1]]:
+        path.write_bytes(bad)
+        try:
+            SimplePrefixTree.load(str(path))
+        except ValueError:
+            pass
+        else:
+            assert False
+
+
+################################################################################
+# Frozen trees
+################################################################################
+
+
+def test_frozen_matches_tree(tmp_path) -> None:
+    items = [("cat", 2, ['c', 'a', 't']), ("car", 3, ['c', 'a', 'r']),
+             ("cart", 1.5, ['c', 'a', 'r', 't']), ("", 2, [])]
+    items += [(letter, 1, ['w', letter]) for letter in 'abcdefghijk']
+    path = str(tmp_path / 'tree.frozen')
+    for cls in [SimplePrefixTree, CompressedPrefixTree]:
+        for weight_type in ['sum', 'average']:
+            tree = cls.from_items(weight_type, items)
+            frozen = tree.freeze(path)
+            assert len(frozen) == len(tree)
+            assert frozen.weight == tree.weight
+            for prefix in [[], ['c'], ['c', 'a', 'r'], ['w', 'k'], ['x'],
+                           ['c', 'x']]:
+                for limit in [None, 1, 2]:
+                    assert frozen.autocomplete(prefix, limit) == \
+                        tree.autocomplete(prefix, limit)
+                    assert frozen.autocomplete(prefix, limit, exact=True) == \
+                        tree.autocomplete(prefix, limit, exact=True)
+                assert list(frozen.iter_autocomplete(prefix)) == \
+                    list(tree.iter_autocomplete(prefix))
+                assert frozen.count(prefix) == tree.count(prefix)
+            frozen.close()
+
+
+def test_frozen_is_read_only(tmp_path) -> None:
+    path = tmp_path / 'tree.frozen'
+    tree = CompressedPrefixTree('sum')
+    tree.insert("cat", 2, ['c', 'a', 't'])
+    tree.freeze(str(path)).close()
+    frozen = FrozenPrefixTree(str(path))
+    assert frozen.autocomplete(['c', 'a']) == [("cat", 2)]
+    for change in [lambda: frozen.insert("car", 1, ['c', 'a', 'r']),
+                   lambda: frozen.remove(['c'])]:
+        try:
+            change()
+        except TypeError:
+            pass
+        else:
+            assert False
+    frozen.close()
+    path.write_bytes(b'not a frozen tree')
+    try:
+        FrozenPrefixTree(str(path))
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+################################################################################
+# DAWG
+################################################################################
+
+
+def test_dawg_matches_tree() -> None:
+    items = [("cat", 2, ['c', 'a', 't']), ("Cat", 1, ['c', 'a', 't']),
+             ("car", 4, ['c', 'a', 'r']), ("cart", 3, ['c', 'a', 'r', 't']),
+             ("bat", 5, ['b', 'a', 't']), ("", 1, []),
+             ("cat", 2, ['c', 'a', 't'])]
+    for weight_type in ['sum', 'average']:
+        tree = SimplePrefixTree.from_items(weight_type, items)
+        dawg = DawgAutocompleter.from_items(weight_type, items)
+        assert len(dawg) == len(tree) == 6
+        assert dawg.weight == tree.weight
+        for prefix in [[], ['c'], ['c', 'a', 't'], ['b', 'a'], ['x']]:
+            assert dawg.count(prefix) == tree.count(prefix)
+            assert sorted(dawg.autocomplete(prefix)) == \
+                sorted(tree.autocomplete(prefix))
+        assert dawg.autocomplete(['c'], 2) == [("car", 4), ("cat", 4)]
+        assert list(dawg.iter_autocomplete(['c'])) == \
+            dawg.autocomplete(['c'])
+
+
+def test_dawg_shares_endings() -> None:
+    words = ['cat', 'bat', 'rat', 'cats', 'bats', 'rats']
+    dawg = DawgAutocompleter.from_items(
+        'sum', [(word, 1, list(word)) for word in words])
+    tree = CompressedPrefixTree.from_items(
+        'sum', [(word, 1, list(word)) for word in words])
+    assert dawg._state_count() < len(str(tree).splitlines())
+    dawg.insert("cat", 2, list("cat"))
+    dawg.insert("cab", 1, list("cab"))
+    dawg.remove(list("ra"))
+    assert dawg.autocomplete(list("ca")) == [("cat", 3), ("cab", 1),
+                                             ("cats", 1)]
+    assert len(dawg) == 5
+
+
+################################################################################
+# Double-array trie
+################################################################################
+
+
+def test_double_array_trie_matches_tree() -> None:
+    items = [("cat", 2, ['c', 'a', 't']), ("car", 4, ['c', 'a', 'r']),
+             ("cart", 3, ['c', 'a', 'r', 't']), ("bat", 5, ['b', 'a', 't']),
+             ("", 1, []), ("cat", 2, ['c', 'a', 't'])]
+    for weight_type in ['sum', 'average']:
+        tree = SimplePrefixTree.from_items(weight_type, items)
+        trie = DoubleArrayTrie.from_items(weight_type, items)
+        assert len(trie) == len(tree) == 5
+        assert trie.weight == tree.weight
+        for prefix in [[], ['c'], ['c', 'a', 'r'], ['b'], ['x'], ['c', 'x']]:
+            assert trie.count(prefix) == tree.count(prefix)
+            assert sorted(trie.autocomplete(prefix)) == \
+                sorted(tree.autocomplete(prefix))
+            assert [weight for _, weight in trie.autocomplete(prefix, 2)] == \
+                [weight for _, weight in
+                 tree.autocomplete(prefix, 2, exact=True)]
+
+
+def test_double_array_trie_moves_children() -> None:
+    trie = DoubleArrayTrie('sum')
+    words = ['ab', 'ba', 'abc', 'bab', 'c', 'ca', 'cb', 'abab', 'bc']
+    for i, word in enumerate(words):
+        trie.insert(word, i + 1, list(word))
+    for i, word in enumerate(words):
+        assert trie.count(list(word)) >= 1
+        assert (word, i + 1) in trie.autocomplete(list(word))
+    trie.remove(['a', 'b'])
+    assert trie.count(['a']) == 0
+    assert len(trie) == 6
+    trie.insert("ax", 10, ['a', 'x'])
+    assert trie.autocomplete([], 2) == [("ax", 10), ("bc", 9)]
+
+
+################################################################################
+# Ternary search tree
+################################################################################
+
+
+def test_ternary_search_tree_matches_tree() -> None:
+    items = [("how to cook", 4, ['how', 'to', 'cook']),
+             ("how to code", 3, ['how', 'to', 'code']),
+             ("how are you", 5, ['how', 'are', 'you']),
+             ("what is", 2, ['what', 'is']), ("", 1, []),
+             ("how to code", 3, ['how', 'to', 'code'])]
+    for weight_type in ['sum', 'average']:
+        tree = SimplePrefixTree.from_items(weight_type, items)
+        built = TernarySearchTree.from_items(weight_type, items)
+        inserted = TernarySearchTree(weight_type)
+        for item in items:
+            inserted.insert(*item)
+        for tst in [built, inserted]:
+            assert len(tst) == len(tree) == 5
+            assert tst.weight == tree.weight
+            for prefix in [[], ['how'], ['how', 'to'], ['what', 'is'],
+                           ['who'], ['how', 'is']]:
+                assert tst.count(prefix) == tree.count(prefix)
+                assert tst.autocomplete(prefix) == \
+                    tree.autocomplete(prefix, exact=True)
+                assert tst.autocomplete(prefix, 2) == \
+                    tree.autocomplete(prefix, 2, exact=True)
+
+
+def test_ternary_search_tree_remove() -> None:
+    tst = TernarySearchTree('sum')
+    words = ['m', 'f', 't', 'b', 'h', 'p', 'w', 'mo', 'ma']
+    for i, word in enumerate(words):
+        tst.insert(word, i + 1, list(word))
+    tst.remove(['m'])
+    assert len(tst) == 6
+    assert tst.count(['m']) == 0
+    assert tst.autocomplete([], 3) == [("w", 7), ("p", 6), ("h", 5)]
+    tst.remove(['f'])
+    tst.remove(['x'])
+    assert sorted(tst.autocomplete([])) == \
+        [("b", 4), ("h", 5), ("p", 6), ("t", 3), ("w", 7)]
+    tst.insert("f", 10, ['f'])
+    assert tst.autocomplete([], 1) == [("f", 10)]
+    assert tst.weight == 35
+
+
+################################################################################
+# String radix tree
+################################################################################
+
+
+def test_string_radix_tree_matches_tree() -> None:
+    words = ['car', 'cart', 'cat', 'care', 'dog', 'do', 'car', '']
+    items = [(word, i + 1, word) for i, word in enumerate(words)]
+    tree = CompressedPrefixTree.from_items(
+        'sum', [(value, weight, list(prefix))
+                for value, weight, prefix in items])
+    built = StringRadixTree.from_items('sum', items)
+    inserted = StringRadixTree('sum')
+    inserted.insert_many(items)
+    for radix in [built, inserted]:
+        assert len(radix) == len(tree) == 7
+        assert radix.weight == tree.weight
+        for prefix in ['', 'c', 'ca', 'car', 'cart', 'd', 'x', 'cx', 'carts']:
+            assert radix.count(prefix) == tree.count(list(prefix))
+            assert radix.autocomplete(prefix) == \
+                tree.autocomplete(list(prefix), exact=True)
+        radix.remove('cat')
+        radix.remove('do')
+        assert sorted(radix.autocomplete('')) == \
+            [('', 8), ('car', 8), ('care', 4), ('cart', 2)]
+
+
+def test_string_radix_tree_splits_and_merges() -> None:
+    radix = StringRadixTree('average')
+    radix.insert("hello there", 1, 'hello there')
+    assert radix._root.children['h'].edge == 'hello there'
+    radix.insert("help", 2, 'help')
+    radix.insert("help", 2, 'help')
+    assert radix._root.children['h'].edge == 'hel'
+    assert radix.autocomplete('hel') == [("help", 4), ("hello there", 1)]
+    assert radix.autocomplete('hello t') == [("hello there", 1)]
+    assert radix.weight == 2.5
+    radix.remove('help')
+    assert radix._root.children['h'].edge == 'hello there'
+    assert radix.count('he') == 1
+    assert radix.autocomplete('help') == []
+
+
+################################################################################
+# Leaf values
+################################################################################
+
+
+def test_leaves_store_any_value() -> None:
+    values = [(1, 2), ['c', 'a'], None, 0, frozenset(), 'cat']
+    for cls in [SimplePrefixTree, CompressedPrefixTree]:
+        tree = cls('sum')
+        for i, value in enumerate(values):
+            tree.insert(value, i + 1, ['c', 'a'][:i % 3])
+        tree.insert(['c', 'a'], 10, ['c'])
+        assert len(tree) == len(values)
+        assert tree.autocomplete(['c']) == [(['c', 'a'], 12), ('cat', 6),
+                                            (frozenset(), 5), (None, 3)]
+        tree.remove(['c', 'a'])
+        assert tree.autocomplete([]) == [(['c', 'a'], 12), (frozenset(), 5),
+                                         (0, 4), ((1, 2), 1)]
+
+
+################################################################################
+# Copy-on-write
+################################################################################
+
+
+def test_copy_on_write_keeps_snapshots() -> None:
+    for cls in [SimplePrefixTree, CompressedPrefixTree]:
+        tree = CopyOnWritePrefixTree(cls('sum'))
+        tree.insert("cat", 2, ['c', 'a', 't'])
+        tree.insert("car", 3, ['c', 'a', 'r'])
+        first = tree.snapshot()
+        tree.insert("cab", 4, ['c', 'a', 'b'])
+        tree.insert("cat", 5, ['c', 'a', 't'])
+        tree.insert_many([("dog", 1, ['d', 'o', 'g']),
+                          ("do", 6, ['d', 'o'])])
+        second = tree.snapshot()
+        tree.remove(['c', 'a', 'r'])
+        assert first.autocomplete([]) == [("car", 3), ("cat", 2)]
+        assert second.autocomplete(['c']) == [("cat", 7), ("cab", 4),
+                                              ("car", 3)]
+        assert tree.autocomplete([]) == [("cat", 7), ("do", 6), ("cab", 4),
+                                         ("dog", 1)]
+        assert len(first) == 2 and len(second) == 5 and len(tree) == 4
+
+
+def test_insert_many_splits_edges_in_one_batch() -> None:
+    batch = [("bbcbc", 1, ['b', 'b', 'c', 'b', 'c']),
+             ("bac", 2, ['b', 'a', 'c']), ("ab", 2, ['a', 'b']),
+             ("a", 2, ['a']), ("bbc", 3, ['b', 'b', 'c'])]
+    for weight_type in ['sum', 'average']:
+        one_by_one = CompressedPrefixTree(weight_type)
+        batched = CompressedPrefixTree(weight_type)
+        batched.set_cache_size(5)
+        for value, weight, prefix in batch:
+            one_by_one.insert(value, weight, prefix)
+        batched.insert_many(batch)
+        copied = CopyOnWritePrefixTree(CompressedPrefixTree(weight_type))
+        copied.insert_many(batch)
+        assert str(batched) == str(one_by_one)
+        assert str(copied.snapshot()) == str(one_by_one)
+        assert batched.autocomplete(['a', 'b'], 3) == [("ab", 2)]
+        assert batched.autocomplete(['b'], 3) == \
+            one_by_one.autocomplete(['b'], 3)
+
+
+def test_copy_on_write_concurrent_reads() -> None:
+    tree = CopyOnWritePrefixTree(CompressedPrefixTree('sum'))
+    words = [str(i) for i in range(300)]
+    errors = []
+
+    def read() -> None:
+        while len(tree) < len(words):
+            snapshot = tree.snapshot()
+            results = snapshot.autocomplete([])
+            weights = [weight for _, weight in results]
+            if len(results) != len(snapshot) or \
+                    weights != sorted(weights, reverse=True):
+                errors.append(results)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    for word in words:
+        tree.insert(word, int(word) % 7 + 1, list(word))
+    for reader in readers:
+        reader.join()
+    assert errors == []
+    assert tree.count(['1']) == 111
+
+
+################################################################################
+# Sharding
+################################################################################
+
+
+def test_sharded_matches_tree() -> None:
+    items = [("cat", 2, ['c', 'a', 't']), ("car", 4, ['c', 'a', 'r']),
+             ("dog", 3, ['d', 'o', 'g']), ("bat", 5, ['b', 'a', 't']),
+             ("", 1, []), ("cat", 2, ['c', 'a', 't'])]
+    tree = SimplePrefixTree.from_items('average', items)
+    sharded = ShardedAutocompleter('average', 3, SimplePrefixTree, items)
+    try:
+        sharded.insert("ant", 6, ['a', 'n', 't'])
+        tree.insert("ant", 6, ['a', 'n', 't'])
+        assert len(sharded) == len(tree) == 6
+        assert sharded.weight == tree.weight
+        assert [weight for _, weight in sharded.autocomplete([], 3)] == \
+            [6, 5, 4]
+        for prefix in [['c'], ['c', 'a', 'r'], ['x']]:
+            assert sharded.count(prefix) == tree.count(prefix)
+            assert sharded.autocomplete(prefix) == tree.autocomplete(prefix)
+        sharded.remove(['c'])
+        assert sorted(sharded.autocomplete([])) == \
+            [("", 1), ("ant", 6), ("bat", 5), ("dog", 3)]
+    finally:
+        sharded.close()
+
+
+def test_sharded_empty_prefix_finds_heaviest() -> None:
+    # Greedy autocomplete would go into the heavier subtree for 'a' first.
+    items = [("a" + str(i), 1, ['a', str(i)]) for i in range(4)]
+    items += [("b", 3, ['b'])]
+    for shards in [1, 2]:
+        sharded = ShardedAutocompleter('sum', shards, items=items)
+        try:
+            assert sharded.autocomplete([], 1) == [("b", 3)]
+            assert sharded.autocomplete([], 2)[0] == ("b", 3)
+        finally:
+            sharded.close()
+
+
+def test_sharded_raises_worker_errors() -> None:
+    sharded = ShardedAutocompleter('sum', 2)
+    try:
+        sharded.insert_many([("a", 1, ['a']), ("b", 1, ['b'])])
+        try:
+            sharded._request(sharded._shard(['a']), 'missing', ())
+        except AttributeError:
+            pass
+        else:
+            assert False
+        assert sharded.autocomplete([]) in [[("a", 1), ("b", 1)],
+                                            [("b", 1), ("a", 1)]]
+    finally:
+        sharded.close()
+
+
+################################################################################
+# Parallel build
+################################################################################
+
+
+def test_from_items_parallel_matches_from_items() -> None:
+    words = ['car', 'cat', 'care', 'dog', 'door', 'do', 'eat', 'ear', 'fig',
+             'figs', 'go', 'gone', 'hat', 'ham', 'ice', 'jam', 'kit', 'cat',
+             '', 'dot', 'ears']
+    items = [(word, len(word) % 3 + 1, list(word)) for word in words]
+    for cls in [SimplePrefixTree, CompressedPrefixTree]:
+        tree = cls.from_items('average', items)
+        built = cls.from_items_parallel('average', items, 3)
+        assert str(built) == str(tree)
+        assert built._children.keys() == tree._children.keys()
+        assert built.autocomplete(['d'], 2) == tree.autocomplete(['d'], 2)
+        built.insert("dots", 5, ['d', 'o', 't', 's'])
+        assert built.autocomplete(['d', 'o', 't']) == [("dots", 5),
+                                                       ("dot", 1)]
+
+
+################################################################################
+# Batch autocomplete
+################################################################################
+def test_autocomplete_many_matches_autocomplete() -> None:
+    words = ['car', 'cart', 'care', 'cat', 'dog', 'do', 'door']
+    items = [(word, i + 1, list(word)) for i, word in enumerate(words)]
+    prefixes = [list('cart'[:k]) for k in range(5)] + \
+        [list('doors'), list('do'), list('x'), list('ca'), list('c')]
+    for cls in [SimplePrefixTree, CompressedPrefixTree]:
+        tree = cls.from_items('sum', items)
+        tree.remove(list('care'), tombstone=True)
+        for limit in [None, 1, 2]:
+            for exact in [False, True]:
+                assert tree.autocomplete_many(prefixes, limit, exact) == \
+                    [tree.autocomplete(prefix, limit, exact)
+                     for prefix in prefixes]
+        assert tree.autocomplete_many([]) == []
+
+
+def test_string_radix_tree_autocomplete_many() -> None:
+    words = ['car', 'cart', 'care', 'cat', 'dog', 'do', 'door']
+    tree = StringRadixTree.from_items(
+        'sum', [(word, i + 1, word) for i, word in enumerate(words)])
+    tree.remove('care')
+    prefixes = ['door', 'ca', '', 'c', 'cat', 'ca', 'dx', 'doors']
+    for limit in [None, 2]:
+        assert tree.autocomplete_many(prefixes, limit) == \
+            [tree.autocomplete(prefix, limit) for prefix in prefixes]
+
+
+################################################################################
+# Autocomplete server
+################################################################################
+
+
+async def _client(address: tuple, requests: list) -> list:
+    """Send every request in <requests> on one connection without waiting,
+    and return each answer with the seconds it took to arrive.
+    """
+    reader, writer = await asyncio.open_connection(*address)
+    start = time.perf_counter()
+    writer.write(b''.join(json.dumps(request).encode() + b'\n'
+                          for request in requests))
+    await writer.drain()
+    answers = []
+    for _ in requests:
+        answer = json.loads(await reader.readline())
+        answers.append((answer, time.perf_counter() - start))
+    writer.close()
+    return answers
+
+
+def test_server_coalesces_and_removes() -> None:
+    async def run() -> None:
+        tree = SimplePrefixTree('sum')
+        for word, weight in [('cat', 3), ('car', 5), ('dog', 2)]:
+            tree.insert(word, weight, list(word))
+        server = AutocompleteServer(tree)
+        address = await server.start()
+        query = {'op': 'autocomplete', 'prefix': ['c'], 'limit': 1}
+        answers = await _client(address, [query] * 5 + [
+            {'op': 'remove', 'prefix': ['c', 'a', 'r']}, query,
+            {'op': 'autocomplete', 'prefix': 'x', 'limit': -1},
+            {'op': 'autocomplete', 'prefix': ['c'], 'limit': True},
+            {'op': 'nothing'}])
+        await server.close()
+        assert [answer for answer, _ in answers] == \
+            [{'results': [['car', 5]]}] * 5 + [
+                {'removed': True}, {'results': [['cat', 3]]},
+                {'error': 'limit must be null or a positive integer'},
+                {'error': 'limit must be null or a positive integer'},
+                {'error': "unknown op 'nothing'"}]
+        assert server.coalesced == 4
+        assert server.batches == 1
+
+    asyncio.run(run())
+
+
+def test_server_latency_throughput_and_shedding() -> None:
+    async def run(max_queue: int) -> tuple:
+        tree = SimplePrefixTree.from_items(
+            'sum', [(str(i), i, list(str(i))) for i in range(1, 2000)])
+        server = AutocompleteServer(tree, max_queue=max_queue)
+        address = await server.start()
+        # Ten clients each type out a number, one request per keystroke.
+        requests = [[{'op': 'autocomplete', 'prefix': list(str(n)[:k]),
+                      'limit': 5} for k in range(1, 5)] * 25
+                    for n in range(1000, 2000, 100)]
+        start = time.perf_counter()
+        answers = await asyncio.gather(*[_client(address, sent)
+                                         for sent in requests])
+        elapsed = time.perf_counter() - start
+        await server.close()
+        return server, [answer for sent in answers for answer in sent], \
+            elapsed
+
+    server, answers, elapsed = asyncio.run(run(1024))
+    latencies = sorted(latency for _, latency in answers)
+    assert all('results' in answer for answer, _ in answers)
+    assert len(answers) / elapsed > 200
+    assert latencies[len(latencies) // 2] < 1.0
+    assert server.coalesced > 0 and server.shed == 0
+    assert server.batches < len(answers)
+
+    server, answers, _ = asyncio.run(run(4))
+    assert server.shed > 0
+    assert all(answer == {'error': 'overloaded'} or 'results' in answer
+               for answer, _ in answers)
+
+
 ################################################################################
 # Unlimited Autocomplete
 ################################################################################
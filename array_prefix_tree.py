@@ -0,0 +1,448 @@
+"""CSC148 Assignment 2: Array-backed prefix tree
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains ArrayPrefixTree, an implementation of the Autocompleter
+interface with the same behaviour as SimplePrefixTree. Instead of one Python
+object per node, every node is a row in a set of parallel arrays, so that a
+tree with millions of nodes takes tens of bytes per node rather than hundreds.
+"""
+from __future__ import annotations
+import heapq
+from array import array
+from itertools import count
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from prefix_tree import Autocompleter, _read_snapshot, _write_snapshot
+
+# The id of the root node, and the id used for "no node", "no token" and
+# "no value" in the node columns.
+_ROOT = 0
+_NONE = -1
+
+
+class ArrayPrefixTree(Autocompleter):
+    """A simple prefix tree whose nodes are stored in parallel arrays.
+
+    Node i of the tree is described by entry i of each of the node columns.
+    Like in a SimplePrefixTree, every prefix token gets its own node and each
+    value is stored in a leaf below the node for its whole prefix, and the
+    children of each node are kept in non-increasing order of weight.
+
+    === Attributes ===
+    weight_type:
+        A string representing the way to calculate the tree's weight.
+
+    === Private Attributes ===
+    _parent:
+        The id of the parent of each node, or _NONE for the root.
+    _first:
+        The id of the first (heaviest) child of each node, or _NONE.
+    _next:
+        The id of the next (lighter) sibling of each node, or _NONE.
+    _token:
+        The token id on the edge leading to each non-leaf node, or _NONE for
+        the root and for leaves.
+    _total:
+        The sum of the leaf weights below each node.
+    _num:
+        The number of leaves below each node (1 for a leaf).
+    _max:
+        The largest leaf weight below each node, or 0.0 if there is none.
+    _value:
+        The value id stored in each leaf, or _NONE for non-leaf nodes.
+    _token_ids:
+        A mapping from each prefix token seen so far to its token id.
+    _tokens:
+        The token for each token id.
+    _values:
+        The value for each value id, or None if that id is free.
+    _free_nodes:
+        Ids of removed nodes that can be reused.
+    _free_values:
+        Ids of removed values that can be reused.
+
+    === Representation invariants ===
+    - weight_type == 'sum' or weight_type == 'average'
+    - All node columns have the same length.
+    - Node _ROOT is never freed, and self._num[_ROOT] is the number of values.
+    - Every non-root node that is not free has at least one leaf below it.
+    - The children of each node, in _first/_next order, are sorted in
+      non-increasing order of weight.
+    """
+    weight_type: str
+    _parent: array
+    _first: array
+    _next: array
+    _token: array
+    _total: array
+    _num: array
+    _max: array
+    _value: array
+    _token_ids: Dict[Any, int]
+    _tokens: List[Any]
+    _values: List[Any]
+    _free_nodes: array
+    _free_values: array
+
+    def __init__(self, weight_type: str) -> None:
+        """Initialize an empty array prefix tree.
+
+        Precondition: weight_type == 'sum' or weight_type == 'average'.
+        """
+        self.weight_type = weight_type
+        self._parent = array('i')
+        self._first = array('i')
+        self._next = array('i')
+        self._token = array('i')
+        self._total = array('d')
+        self._num = array('i')
+        self._max = array('d')
+        self._value = array('i')
+        self._token_ids = {}
+        self._tokens = []
+        self._values = []
+        self._free_nodes = array('i')
+        self._free_values = array('i')
+        self._new_node(_NONE, _NONE, _NONE)
+
+    @property
+    def weight(self) -> float:
+        """The aggregate weight of this tree, or 0.0 if it is empty."""
+        return self._weight(_ROOT)
+
+    def is_empty(self) -> bool:
+        """Return whether this tree is empty."""
+        return self._num[_ROOT] == 0
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this tree."""
+        return self._num[_ROOT]
+
+    def count(self, prefix: List) -> int:
+        """Return the number of values that match the given prefix."""
+        path = self._descend(prefix)
+        if path == []:
+            return 0
+        return self._num[path[-1]]
+
+    def _node_count(self) -> int:
+        """Return the number of nodes in use, including the root."""
+        return len(self._parent) - len(self._free_nodes)
+
+    def _new_node(self, parent: int, token: int, value: int) -> int:
+        """Return the id of a new node with no children, reusing a freed id
+        if there is one.
+        """
+        if self._free_nodes:
+            i = self._free_nodes.pop()
+            self._parent[i] = parent
+            self._first[i] = _NONE
+            self._next[i] = _NONE
+            self._token[i] = token
+            self._total[i] = 0.0
+            self._num[i] = 0
+            self._max[i] = 0.0
+            self._value[i] = value
+            return i
+        self._parent.append(parent)
+        self._first.append(_NONE)
+        self._next.append(_NONE)
+        self._token.append(token)
+        self._total.append(0.0)
+        self._num.append(0)
+        self._max.append(0.0)
+        self._value.append(value)
+        return len(self._parent) - 1
+
+    def _new_value(self, value: Any) -> int:
+        """Return a value id for <value>, reusing a freed id if there is one.
+        """
+        if self._free_values:
+            i = self._free_values.pop()
+            self._values[i] = value
+            return i
+        self._values.append(value)
+        return len(self._values) - 1
+
+    def _weight(self, node: int) -> float:
+        """Return the weight of <node>, following self.weight_type."""
+        num = self._num[node]
+        if num == 0:
+            return 0.0
+        elif self.weight_type == 'sum':
+            return self._total[node]
+        else:
+            return self._total[node] / num
+
+    def _children(self, node: int) -> List[int]:
+        """Return the children of <node> in non-increasing order of weight."""
+        children = []
+        child = self._first[node]
+        while child != _NONE:
+            children.append(child)
+            child = self._next[child]
+        return children
+
+    def _find_child(self, node: int, token: int) -> int:
+        """Return the non-leaf child of <node> on the edge labelled <token>,
+        or _NONE if there is none.
+        """
+        child = self._first[node]
+        while child != _NONE and self._token[child] != token:
+            child = self._next[child]
+        return child
+
+    def _link(self, child: int) -> None:
+        """Add <child> to the children of its parent, after every sibling
+        whose weight is at least the weight of <child>.
+        """
+        parent = self._parent[child]
+        weight = self._weight(child)
+        prev = _NONE
+        cur = self._first[parent]
+        while cur != _NONE and self._weight(cur) >= weight:
+            prev = cur
+            cur = self._next[cur]
+        self._next[child] = cur
+        if prev == _NONE:
+            self._first[parent] = child
+        else:
+            self._next[prev] = child
+
+    def _unlink(self, child: int) -> None:
+        """Remove <child> from the children of its parent."""
+        parent = self._parent[child]
+        cur = self._first[parent]
+        if cur == child:
+            self._first[parent] = self._next[child]
+        else:
+            while self._next[cur] != child:
+                cur = self._next[cur]
+            self._next[cur] = self._next[child]
+        self._next[child] = _NONE
+
+    def _descend(self, prefix: List) -> List[int]:
+        """Return the ids of the nodes on the path from the root to the node
+        for <prefix>, or an empty list if <prefix> is not in this tree.
+        """
+        path = [_ROOT]
+        node = _ROOT
+        for token in prefix:
+            token_id = self._token_ids.get(token)
+            if token_id is None:
+                return []
+            node = self._find_child(node, token_id)
+            if node == _NONE:
+                return []
+            path.append(node)
+        return path
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value into this Autocompleter.
+
+        The value is inserted with the given weight, and is associated with
+        the prefix sequence <prefix>.
+
+        If the value has already been inserted into this prefix tree
+        (compare values using ==), then the given weight should be *added* to
+        the existing weight of this value.
+
+        Preconditions:
+            weight > 0
+            The given value is either:
+                1) not in this Autocompleter
+                2) was previously inserted with the SAME prefix sequence
+        """
+        path = [_ROOT]
+        node = _ROOT
+        for token in prefix:
+            token_id = self._token_ids.get(token)
+            if token_id is None:
+                token_id = len(self._tokens)
+                self._token_ids[token] = token_id
+                self._tokens.append(token)
+            child = self._find_child(node, token_id)
+            if child == _NONE:
+                child = self._new_node(node, token_id, _NONE)
+            path.append(child)
+            node = child
+
+        leaf = self._first[node]
+        while leaf != _NONE and (self._value[leaf] == _NONE or
+                                 self._values[self._value[leaf]] != value):
+            leaf = self._next[leaf]
+        added = 0
+        if leaf == _NONE:
+            leaf = self._new_node(node, _NONE, self._new_value(value))
+            added = 1
+        else:
+            self._unlink(leaf)
+        path.append(leaf)
+
+        for node in path:
+            self._num[node] += added
+            self._total[node] += weight
+        for node in path:
+            if self._total[leaf] > self._max[node]:
+                self._max[node] = self._total[leaf]
+        for node in reversed(path[1:]):
+            if node != leaf and added and self._num[node] == 1:
+                # a node created by this insertion is not linked yet
+                self._link(node)
+            else:
+                if node != leaf:
+                    self._unlink(node)
+                self._link(node)
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        The return value is a list of tuples (value, weight), and must be
+        ordered in non-increasing weight. Like SimplePrefixTree, this visits
+        the children of each node from heaviest to lightest and stops once
+        <limit> values have been found.
+
+        If limit is None, return *every* match for the given prefix.
+
+        Precondition: limit is None or limit > 0.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        path = self._descend(prefix)
+        if path == []:
+            return []
+
+        autocompleted = []
+        stack = [path[-1]]
+        while stack and (limit is None or len(autocompleted) < limit):
+            node = stack.pop()
+            if self._value[node] != _NONE:
+                autocompleted.append((self._values[self._value[node]],
+                                      self._total[node]))
+            else:
+                stack.extend(reversed(self._children(node)))
+        autocompleted.sort(key=lambda item: item[1], reverse=True)
+        return autocompleted
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a tuple (value, weight),
+        in non-increasing weight order.
+
+        Like SimplePrefixTree, nodes are explored in order of their largest
+        leaf weight, so only as much of the tree is visited as is needed for
+        the matches yielded. This tree must not be changed while the matches
+        are being yielded.
+        """
+        path = self._descend(prefix)
+        if path == []:
+            return
+        # Ties go to the most recently pushed node, so that equally heavy
+        # nodes are searched depth-first, in order of weight.
+        order = count(0, -1)
+        heap = [(-self._max[path[-1]], next(order), path[-1])]
+        while heap:
+            node = heapq.heappop(heap)[2]
+            if self._value[node] != _NONE:
+                yield self._values[self._value[node]], self._total[node]
+            else:
+                for child in reversed(self._children(node)):
+                    heapq.heappush(heap, (-self._max[child], next(order),
+                                          child))
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix.
+        """
+        path = self._descend(prefix)
+        if path == []:
+            return
+        node = path[-1]
+        if node == _ROOT:
+            for child in self._children(_ROOT):
+                self._free(child)
+            self._first[_ROOT] = _NONE
+            self._num[_ROOT] = 0
+            self._total[_ROOT] = 0.0
+            self._max[_ROOT] = 0.0
+            return
+
+        num, total = self._num[node], self._total[node]
+        for ancestor in path[:-1]:
+            self._num[ancestor] -= num
+            if self._num[ancestor] == 0:
+                self._total[ancestor] = 0.0
+            else:
+                self._total[ancestor] -= total
+
+        i = len(path) - 1
+        while i > 0 and (i == len(path) - 1 or self._num[path[i]] == 0):
+            self._unlink(path[i])
+            self._free(path[i])
+            i -= 1
+        for node in reversed(path[:i + 1]):
+            self._max[node] = max((self._max[child]
+                                   for child in self._children(node)),
+                                  default=0.0)
+        while i > 0:
+            self._unlink(path[i])
+            self._link(path[i])
+            i -= 1
+
+    def save(self, path: str) -> None:
+        """Write this tree to a snapshot file at <path>, which load can read
+        back.
+
+        The node columns are written out as they are, so that load does no
+        per-node work. The tokens and values are stored with pickle, and so
+        must be picklable.
+        """
+        header = (self.weight_type, self._tokens, self._values)
+        _write_snapshot(path, self, header,
+                        [self._parent, self._first, self._next, self._token,
+                         self._total, self._num, self._max, self._value,
+                         self._free_nodes, self._free_values])
+
+    @classmethod
+    def load(cls, path: str) -> ArrayPrefixTree:
+        """Return the tree stored in the snapshot file at <path>, which
+        must have been written by save on an ArrayPrefixTree.
+
+        Raise ValueError if <path> is not such a snapshot.
+        """
+        header, columns = _read_snapshot(path, cls, 'iiiididiii')
+        weight_type, tokens, values = header
+        tree = cls(weight_type)
+        tree._parent, tree._first, tree._next, tree._token, tree._total, \
+            tree._num, tree._max, tree._value, tree._free_nodes, \
+            tree._free_values = columns
+        tree._tokens = tokens
+        tree._token_ids = {token: i for i, token in enumerate(tokens)}
+        tree._values = values
+        return tree
+
+    def _free(self, node: int) -> None:
+        """Free <node> and every node below it, along with their values.
+
+        Precondition: <node> has already been unlinked from its parent.
+        """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            stack.extend(self._children(node))
+            if self._value[node] != _NONE:
+                self._values[self._value[node]] = None
+                self._free_values.append(self._value[node])
+            self._free_nodes.append(node)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4,
+        'extra-imports': ['heapq', 'array', 'itertools', 'prefix_tree']
+    })
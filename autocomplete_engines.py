@@ -15,10 +15,47 @@ top-level functions to this file.
 """
 from __future__ import annotations
 import csv
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from melody import Melody
-from prefix_tree import SimplePrefixTree, CompressedPrefixTree
+from prefix_tree import Autocompleter, SimplePrefixTree, CompressedPrefixTree
+from array_prefix_tree import ArrayPrefixTree
+from dawg import DawgAutocompleter
+from double_array_trie import DoubleArrayTrie
+from ternary_search_tree import TernarySearchTree
+from radix_tree import StringRadixTree
+
+# The Autocompleter subclass for each value of the 'autocompleter' config key.
+_AUTOCOMPLETERS = {
+    'simple': SimplePrefixTree,
+    'compressed': CompressedPrefixTree,
+    'array': ArrayPrefixTree,
+    'dawg': DawgAutocompleter,
+    'double_array': DoubleArrayTrie,
+    'ternary': TernarySearchTree
+}
+
+
+def make_autocompleter(config: Dict[str, Any],
+                       items: Iterable[Tuple[Any, float, List]] = ()
+                       ) -> Autocompleter:
+    """Return a new Autocompleter as specified by the 'autocompleter' and
+    'weight_type' keys of <config>, storing the (value, weight, prefix)
+    triples in <items>.
+
+    Any unrecognized 'autocompleter' value gives a CompressedPrefixTree. If
+    <config> has a 'workers' key greater than 1, and the Autocompleter is a
+    SimplePrefixTree or CompressedPrefixTree, it is built by that many
+    processes at once.
+    """
+    autocompleter_class = _AUTOCOMPLETERS.get(config['autocompleter'],
+                                              CompressedPrefixTree)
+    if config.get('workers', 1) > 1 and \
+            issubclass(autocompleter_class, SimplePrefixTree):
+        return autocompleter_class.from_items_parallel(
+            config['weight_type'], items, config['workers'])
+    return autocompleter_class.from_items(config['weight_type'], items)
 
 
 ################################################################################
@@ -66,18 +103,29 @@ class LetterAutocompleteEngine:
 
     === Attributes ===
     autocompleter: An Autocompleter used by this engine.
+
+    === Private Attributes ===
+    _string_prefixes:
+        Whether the autocompleter takes prefix strings as they are, rather
+        than as lists of letters.
     """
     autocompleter: Autocompleter
+    _string_prefixes: bool
 
     def __init__(self, config: Dict[str, Any]) -> None:
         """Initialize this engine with the given configuration.
 
         <config> is a dictionary consisting of the following keys:
             - 'file': the path to a text file
-            - 'autocompleter': either the string 'simple' or 'compressed',
-              specifying which subclass of Autocompleter to use.
+            - 'autocompleter': one of the strings 'simple', 'compressed',
+              'array', 'dawg', 'double_array' or 'ternary', specifying which
+              subclass of Autocompleter to use, or 'radix', for a
+              StringRadixTree that takes prefix strings without splitting
+              them into letters.
             - 'weight_type': either 'sum' or 'average', which specifies the
               weight type for the prefix tree.
+            - 'workers' (optional): the number of processes to build a
+              'simple' or 'compressed' prefix tree with, 1 by default.
 
         Each line of the specified file counts as one input string.
         Note that the line may or may not contain spaces.
@@ -96,25 +144,35 @@ class LetterAutocompleteEngine:
         # lines of the file and process them according to the description in
         # this method's docstring.
 
+        self._string_prefixes = config['autocompleter'] == 'radix'
         string_data = {}  # type: Dict[str, [float, List[str]]]
         with open(config['file'], encoding='utf8') as f:
             for line in f.read().splitlines():
                 if any(ch.isalnum() for ch in line):
                     # if there is an alphanumeric character in the line
                     str_input, prefix = get_value_prefix_letter(line)
+                    if self._string_prefixes:
+                        prefix = ''.join(prefix)
                     if str_input in string_data:
                         string_data[str_input][0] += 1
                     else:
                         string_data[str_input] = [1]
                         string_data[str_input].append(prefix)
 
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
+        items = ((string, data[0], data[1])
+                 for string, data in string_data.items())
+        if self._string_prefixes:
+            self.autocompleter = StringRadixTree.from_items(
+                config['weight_type'], items)
         else:
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
+            self.autocompleter = make_autocompleter(config, items)
 
-        for string, data in string_data.items():
-            self.autocompleter.insert(string, data[0], data[1])
+    def _prefix(self, prefix: str) -> Any:
+        """Return <prefix> in the form this engine's autocompleter takes.
+        """
+        if self._string_prefixes:
+            return prefix
+        return list(prefix)
 
     def autocomplete(self, prefix: str,
                      limit: Optional[int] = None) -> List[Tuple[str, float]]:
@@ -126,32 +184,53 @@ class LetterAutocompleteEngine:
         If limit is None, return *every* match for the given prefix.
 
         Note that the given prefix string must be transformed into a list
-        of letters before being passed to the Autocompleter.
+        of letters before being passed to the Autocompleter, unless it is a
+        StringRadixTree.
 
         Preconditions:
             limit is None or limit > 0
             <prefix> contains only lowercase alphanumeric characters and spaces
         """
-        prefix_list = []
-        for ch in prefix:
-            prefix_list.append(ch)
+        return self.autocompleter.autocomplete(self._prefix(prefix), limit)
 
-        return self.autocompleter.autocomplete(prefix_list, limit)
+    def iter_autocomplete(self, prefix: str) -> Iterator[Tuple[str, float]]:
+        """Yield every match for the given prefix string as a tuple
+        (string, weight), in non-increasing weight order, finding each
+        match only when it is needed.
+
+        Precondition: <prefix> contains only lowercase alphanumeric characters
+                      and spaces.
+        """
+        return self.autocompleter.iter_autocomplete(self._prefix(prefix))
+
+    def autocomplete_many(self, prefixes: List[str],
+                          limit: Optional[int] = None
+                          ) -> List[List[Tuple[str, float]]]:
+        """Return the result of autocomplete with <limit> for each prefix
+        string in <prefixes>, in the same order as <prefixes>.
+
+        The prefixes are looked up together, so that the part of the tree
+        they share, such as for every prefix of one word, is descended once.
+
+        Preconditions:
+            limit is None or limit > 0
+            every prefix contains only lowercase alphanumeric characters and
+            spaces
+        """
+        return self.autocompleter.autocomplete_many(
+            [self._prefix(prefix) for prefix in prefixes], limit)
 
     def remove(self, prefix: str) -> None:
         """Remove all strings that match the given prefix string.
 
         Note that the given prefix string must be transformed into a list
-        of letters before being passed to the Autocompleter.
+        of letters before being passed to the Autocompleter, unless it is a
+        StringRadixTree.
 
         Precondition: <prefix> contains only lowercase alphanumeric characters
                       and spaces.
         """
-        prefix_list = []
-        for ch in prefix:
-            prefix_list.append(ch)
-
-        self.autocompleter.remove(prefix_list)
+        self.autocompleter.remove(self._prefix(prefix))
 
 
 class SentenceAutocompleteEngine:
@@ -175,10 +254,13 @@ class SentenceAutocompleteEngine:
 
         <config> is a dictionary consisting of the following keys:
             - 'file': the path to a CSV file
-            - 'autocompleter': either the string 'simple' or 'compressed',
-              specifying which subclass of Autocompleter to use.
+            - 'autocompleter': one of the strings 'simple', 'compressed',
+              'array', 'dawg', 'double_array' or 'ternary', specifying which
+              subclass of Autocompleter to use.
             - 'weight_type': either 'sum' or 'average', which specifies the
               weight type for the prefix tree.
+            - 'workers' (optional): the number of processes to build a
+              'simple' or 'compressed' prefix tree with, 1 by default.
 
         Precondition:
         The given file is a *CSV file* where each line has two entries:
@@ -214,15 +296,9 @@ class SentenceAutocompleteEngine:
                         csv_data[val] = [float(line[1])]
                         csv_data[val].append(prefix)
 
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
-        else:
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
-
-        for words in csv_data:
-            self.autocompleter.insert(words,
-                                      csv_data[words][0],
-                                      csv_data[words][1])
+        self.autocompleter = make_autocompleter(
+            config, ((words, data[0], data[1])
+                     for words, data in csv_data.items()))
 
     def autocomplete(self, prefix: str,
                      limit: Optional[int] = None) -> List[Tuple[str, float]]:
@@ -242,6 +318,33 @@ class SentenceAutocompleteEngine:
         """
         return self.autocompleter.autocomplete(prefix.split(), limit)
 
+    def iter_autocomplete(self, prefix: str) -> Iterator[Tuple[str, float]]:
+        """Yield every match for the given prefix string as a tuple
+        (string, weight), in non-increasing weight order, finding each
+        match only when it is needed.
+
+        Precondition: <prefix> contains only lowercase alphanumeric characters
+                      and spaces.
+        """
+        return self.autocompleter.iter_autocomplete(prefix.split())
+
+    def autocomplete_many(self, prefixes: List[str],
+                          limit: Optional[int] = None
+                          ) -> List[List[Tuple[str, float]]]:
+        """Return the result of autocomplete with <limit> for each prefix
+        string in <prefixes>, in the same order as <prefixes>.
+
+        The prefixes are looked up together, so that the part of the tree
+        they share is descended once.
+
+        Preconditions:
+            limit is None or limit > 0
+            every prefix contains only lowercase alphanumeric characters and
+            spaces
+        """
+        return self.autocompleter.autocomplete_many(
+            [prefix.split() for prefix in prefixes], limit)
+
     def remove(self, prefix: str) -> None:
         """Remove all strings that match the given prefix.
 
@@ -277,10 +380,13 @@ class MelodyAutocompleteEngine:
 
         <config> is a dictionary consisting of the following keys:
             - 'file': the path to a CSV file
-            - 'autocompleter': either the string 'simple' or 'compressed',
-              specifying which subclass of Autocompleter to use.
+            - 'autocompleter': one of the strings 'simple', 'compressed',
+              'array', 'dawg', 'double_array' or 'ternary', specifying which
+              subclass of Autocompleter to use.
             - 'weight_type': either 'sum' or 'average', which specifies the
               weight type for the prefix tree.
+            - 'workers' (optional): the number of processes to build a
+              'simple' or 'compressed' prefix tree with, 1 by default.
 
         Precondition:
         The given file is a *CSV file* where each line has the following format:
@@ -313,13 +419,8 @@ class MelodyAutocompleteEngine:
                     prefix.append(interval)
                 csv_data.append([Melody(name, notes), prefix])
 
-        if config['autocompleter'] == 'simple':
-            self.autocompleter = SimplePrefixTree(config['weight_type'])
-        else:
-            self.autocompleter = CompressedPrefixTree(config['weight_type'])
-
-        for data in csv_data:
-            self.autocompleter.insert(data[0], 1, data[1])
+        self.autocompleter = make_autocompleter(
+            config, ((data[0], 1, data[1]) for data in csv_data))
 
     def autocomplete(self, prefix: List[int],
                      limit: Optional[int] = None) -> List[Tuple[Melody, float]]:
@@ -335,6 +436,25 @@ class MelodyAutocompleteEngine:
         """
         return self.autocompleter.autocomplete(prefix, limit)
 
+    def iter_autocomplete(self,
+                          prefix: List[int]) -> Iterator[Tuple[Melody, float]]:
+        """Yield every match for the given interval sequence as a tuple
+        (melody, weight), in non-increasing weight order, finding each
+        match only when it is needed.
+        """
+        return self.autocompleter.iter_autocomplete(prefix)
+
+    def autocomplete_many(self, prefixes: List[List[int]],
+                          limit: Optional[int] = None
+                          ) -> List[List[Tuple[Melody, float]]]:
+        """Return the result of autocomplete with <limit> for each interval
+        sequence in <prefixes>, in the same order as <prefixes>.
+
+        Precondition:
+            limit is None or limit > 0
+        """
+        return self.autocompleter.autocomplete_many(prefixes, limit)
+
     def remove(self, prefix: List[int]) -> None:
         """Remove all melodies that match the given interval sequence.
         """
@@ -377,20 +497,52 @@ def sample_melody_autocomplete() -> None:
         melody.play()
 
 
+###############################################################################
+# Benchmarks
+###############################################################################
+def benchmark_sentence_autocomplete(file: str = 'data/google_searches.csv',
+                                    limit: int = 10
+                                    ) -> Dict[str, Tuple[float, float]]:
+    """Time every kind of Autocompleter in the sentence autocomplete engine.
+
+    Return a dictionary mapping each value of the 'autocompleter' config key
+    to a tuple (build seconds, query microseconds): the time taken to build
+    the engine from <file>, and the average time taken to autocomplete each
+    one- and two-word prefix of the sentences in <file>, with <limit>.
+    """
+    results = {}
+    for name in _AUTOCOMPLETERS:
+        start = time.perf_counter()
+        engine = SentenceAutocompleteEngine({
+            'file': file,
+            'autocompleter': name,
+            'weight_type': 'sum'
+        })
+        built = time.perf_counter() - start
+
+        prefixes = set()
+        for value, _ in engine.autocomplete('', None):
+            words = value.split()
+            prefixes.update(' '.join(words[:i]) for i in (1, 2))
+        start = time.perf_counter()
+        for prefix in prefixes:
+            engine.autocomplete(prefix, limit)
+        queried = time.perf_counter() - start
+        results[name] = (built, queried / max(len(prefixes), 1) * 1e6)
+    return results
+
+
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-io': ['__init__'],
-        'extra-imports': ['csv', 'prefix_tree', 'melody']
+        'extra-imports': ['csv', 'time', 'prefix_tree', 'array_prefix_tree',
+                          'dawg', 'double_array_trie', 'ternary_search_tree',
+                          'radix_tree', 'melody']
     })
 
     # import doctest
     # doctest.testmod()
-    # This is used to increase the recursion limit so that your sample runs
-    # work even for fairly tall simple prefix trees.
-    # import sys
-    # sys.setrecursionlimit(5000)
-
     print(sample_letter_autocomplete())
     # print(sample_sentence_autocomplete())
     # sample_melody_autocomplete()
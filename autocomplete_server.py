@@ -0,0 +1,357 @@
+"""CSC148 Assignment 2: Autocomplete server
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains AutocompleteServer, which serves the autocomplete and
+remove methods of an autocomplete engine over TCP, with asyncio.
+
+Each request is one line of JSON, and is answered by one line of JSON, in
+the order the requests were sent on the connection:
+    {"op": "autocomplete", "prefix": <prefix>, "limit": <limit or null>}
+        -> {"results": [[<value>, <weight>], ...]}
+    {"op": "remove", "prefix": <prefix>}
+        -> {"removed": true}
+Any request can instead be answered with {"error": <message>}, and is
+answered with {"error": "overloaded"} when the server has too many requests
+waiting already. Prefixes are strings for the letter and sentence engines,
+and lists of intervals for the melody engine.
+
+Run this file to serve an engine, for example:
+    python autocomplete_server.py letter data/google_no_swears.txt
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class AutocompleteServer:
+    """A server for the autocomplete and remove requests of one engine.
+
+    Requests are put in a queue of bounded size, which is served by a
+    single task, so the engine is only ever used by one request at a time.
+    The task takes every request that has arrived by the time it runs, up
+    to a limit, as one batch, so that a burst of requests, such as one per
+    keystroke, costs one wake-up of the task rather than one per request.
+    The autocomplete requests of a batch that have the same limit, and no
+    remove between them, are answered by one call to autocomplete_many, so
+    the prefixes they share are looked up once.
+
+    An autocomplete request that is the same as one already waiting is not
+    queued again, but is given the answer to the one waiting. When the
+    queue is full, new requests are refused rather than queued, so that a
+    server that cannot keep up stays responsive.
+
+    === Attributes ===
+    engine:
+        The engine served. Any object with the autocomplete,
+        autocomplete_many and remove methods of the autocomplete engines
+        can be served.
+    coalesced:
+        The number of autocomplete requests that were answered with the
+        answer to an identical request already waiting.
+    shed:
+        The number of requests refused because the queue was full.
+    batches:
+        The number of batches of requests served.
+
+    === Private Attributes ===
+    _queue:
+        The requests waiting to be served, as tuples (op, prefix, limit,
+        key, future), where key is the key of the request in _waiting, and
+        future is set to the answer.
+    _waiting:
+        A mapping from (prefix, limit) keys to the answer futures of the
+        autocomplete requests waiting in _queue since the last remove.
+    _max_batch:
+        The largest number of requests served in one batch.
+    _server:
+        The asyncio server accepting connections, or None if this server
+        has not been started.
+    _worker:
+        The task serving _queue, or None if this server has not been
+        started.
+    _connections:
+        A mapping from the writer of each open connection to the task
+        serving it.
+
+    === Representation invariants ===
+    - _max_batch > 0
+    """
+    engine: Any
+    coalesced: int
+    shed: int
+    batches: int
+    _queue: asyncio.Queue
+    _waiting: Dict[Tuple[str, Optional[int]], asyncio.Future]
+    _max_batch: int
+    _server: Optional[asyncio.AbstractServer]
+    _worker: Optional[asyncio.Task]
+    _connections: Dict[asyncio.StreamWriter, asyncio.Task]
+
+    def __init__(self, engine: Any, max_queue: int = 1024,
+                 max_batch: int = 64) -> None:
+        """Initialize a server for <engine>, which queues at most
+        <max_queue> requests, and serves at most <max_batch> of them at a
+        time.
+
+        Precondition: max_queue > 0 and max_batch > 0.
+        """
+        self.engine = engine
+        self.coalesced = 0
+        self.shed = 0
+        self.batches = 0
+        self._queue = asyncio.Queue(max_queue)
+        self._waiting = {}
+        self._max_batch = max_batch
+        self._server = None
+        self._worker = None
+        self._connections = {}
+
+    async def start(self, host: str = '127.0.0.1',
+                    port: int = 0) -> Tuple[str, int]:
+        """Start accepting connections on <host> and <port>, and return the
+        address accepted on. A <port> of 0 picks any free port.
+        """
+        self._worker = asyncio.ensure_future(self._serve_batches())
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self) -> None:
+        """Stop accepting connections and serving requests.
+
+        Every open connection is closed once the answers to the requests
+        already read from it have been sent.
+        """
+        self._server.close()
+        await self._server.wait_closed()
+        handlers = list(self._connections.values())
+        for writer in list(self._connections):
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        self._worker.cancel()
+
+    async def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the answer to <request>, a request as described in the
+        module docstring, once it has been served.
+        """
+        op = request.get('op')
+        if op not in ('autocomplete', 'remove'):
+            return {'error': f'unknown op {op!r}'}
+        prefix = request.get('prefix')
+        limit = request.get('limit')
+        if not isinstance(prefix, (str, list)):
+            return {'error': 'prefix must be a string or a list'}
+        elif limit is not None and (isinstance(limit, bool) or
+                                    not isinstance(limit, int) or limit <= 0):
+            # JSON true and false are read as bools, which are ints too.
+            return {'error': 'limit must be null or a positive integer'}
+
+        key = (json.dumps(prefix), limit)
+        if op == 'autocomplete' and key in self._waiting:
+            self.coalesced += 1
+            return await asyncio.shield(self._waiting[key])
+        elif self._queue.full():
+            self.shed += 1
+            return {'error': 'overloaded'}
+
+        future = asyncio.get_running_loop().create_future()
+        if op == 'autocomplete':
+            self._waiting[key] = future
+        else:
+            # Requests after this remove must not be given answers found
+            # before it.
+            self._waiting.clear()
+        self._queue.put_nowait((op, prefix, limit, key, future))
+        # A client that goes away must not cancel the answer for others.
+        return await asyncio.shield(future)
+
+    async def _serve_batches(self) -> None:
+        """Serve the requests in the queue, in batches, forever."""
+        while True:
+            batch = [await self._queue.get()]
+            # Let every request that arrived on this tick of the event loop
+            # be queued before the batch is taken.
+            await asyncio.sleep(0)
+            while len(batch) < self._max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self.batches += 1
+            run = []
+            for request in batch:
+                if request[0] == 'autocomplete':
+                    run.append(request)
+                else:
+                    self._answer_run(run)
+                    run = []
+                    self._settle(request, self._answer(*request[:3]))
+            self._answer_run(run)
+
+    def _answer_run(self, run: List[tuple]) -> None:
+        """Answer the autocomplete requests in <run>, with one call to
+        autocomplete_many for the requests with each limit.
+
+        If the call fails, for example because one of the prefixes is not
+        valid, each of its requests is answered on its own instead.
+        """
+        by_limit = {}
+        for request in run:
+            by_limit.setdefault(request[2], []).append(request)
+        for limit, requests in by_limit.items():
+            try:
+                results = self.engine.autocomplete_many(
+                    [request[1] for request in requests], limit)
+            except Exception:  # pylint: disable=broad-except
+                results = None
+            for i, request in enumerate(requests):
+                if results is None:
+                    answer = self._answer(*request[:3])
+                else:
+                    answer = {'results': [[_encode(value), weight]
+                                          for value, weight in results[i]]}
+                self._settle(request, answer)
+
+    def _settle(self, request: tuple, answer: Dict[str, Any]) -> None:
+        """Give <answer> to the waiting <request>."""
+        _, _, _, key, future = request
+        future.set_result(answer)
+        if self._waiting.get(key) is future:
+            del self._waiting[key]
+
+    def _answer(self, op: str, prefix: Any,
+                limit: Optional[int]) -> Dict[str, Any]:
+        """Return the answer to the request <op> for <prefix> and <limit>.
+        """
+        try:
+            if op == 'remove':
+                self.engine.remove(prefix)
+                return {'removed': True}
+            return {'results': [[_encode(value), weight] for value, weight
+                                in self.engine.autocomplete(prefix, limit)]}
+        except Exception as error:  # pylint: disable=broad-except
+            return {'error': f'{type(error).__name__}: {error}'}
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        """Serve the requests sent on one connection.
+
+        Every request is submitted as soon as it is read, so that requests
+        sent without waiting for answers are served together, and the
+        answers are sent back in order by a separate task.
+        """
+        self._connections[writer] = asyncio.current_task()
+        answers = asyncio.Queue()
+        sender = asyncio.ensure_future(_send_answers(answers, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = {'op': None}
+                if not isinstance(request, dict):
+                    request = {'op': None}
+                answers.put_nowait(asyncio.ensure_future(
+                    self.submit(request)))
+        finally:
+            answers.put_nowait(None)
+            await sender
+            writer.close()
+            del self._connections[writer]
+
+
+async def _send_answers(answers: asyncio.Queue,
+                        writer: asyncio.StreamWriter) -> None:
+    """Write the answer of each future put in <answers> to <writer>, in
+    order, until None is put in <answers>. Answers that can no longer be
+    sent, because the connection was lost, are dropped.
+    """
+    while True:
+        answer = await answers.get()
+        if answer is None:
+            break
+        answer = await answer
+        if not writer.is_closing():
+            writer.write(json.dumps(answer).encode() + b'\n')
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+
+def _encode(value: Any) -> Any:
+    """Return <value> in a form that can be sent as JSON. Melodies are sent
+    as their names.
+    """
+    if isinstance(value, (str, int, float)):
+        return value
+    return getattr(value, 'name', repr(value))
+
+
+def load_engine(kind: str, config: Dict[str, Any]) -> Any:
+    """Return a new autocomplete engine of the given <kind>, 'letter',
+    'sentence' or 'melody', with the given <config>.
+    """
+    # The engines are imported here, since the melody engine needs the
+    # music libraries, which serving a text engine does not.
+    from autocomplete_engines import (LetterAutocompleteEngine,
+                                      SentenceAutocompleteEngine,
+                                      MelodyAutocompleteEngine)
+    engines = {'letter': LetterAutocompleteEngine,
+               'sentence': SentenceAutocompleteEngine,
+               'melody': MelodyAutocompleteEngine}
+    return engines[kind](config)
+
+
+async def serve(engine: Any, host: str, port: int) -> None:
+    """Serve <engine> on <host> and <port> until cancelled."""
+    server = AutocompleteServer(engine)
+    host, port = await server.start(host, port)
+    print(f'Serving on {host}:{port}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Serve the engine described by the command line <args>."""
+    parser = argparse.ArgumentParser(
+        description='Serve an autocomplete engine over TCP.')
+    parser.add_argument('engine', choices=['letter', 'sentence', 'melody'])
+    parser.add_argument('file')
+    parser.add_argument('--autocompleter', default='compressed')
+    parser.add_argument('--weight-type', default='sum',
+                        choices=['sum', 'average'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8148)
+    options = parser.parse_args(args)
+    engine = load_engine(options.engine, {
+        'file': options.file,
+        'autocompleter': options.autocompleter,
+        'weight_type': options.weight_type
+    })
+    try:
+        asyncio.run(serve(engine, options.host, options.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4,
+        'allowed-io': ['serve'],
+        'extra-imports': ['argparse', 'asyncio', 'json',
+                          'autocomplete_engines']
+    })
+    main()
@@ -0,0 +1,175 @@
+"""CSC148 Assignment 2: Copy-on-write prefix tree
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains CopyOnWritePrefixTree, an Autocompleter that can answer
+queries from any number of threads while another thread changes it.
+Readers never take a lock: every change is made to a new version of the
+tree, which shares all of its subtrees off the path to the changed prefix
+with the version before it, and only then becomes the version that new
+queries read.
+"""
+from __future__ import annotations
+import threading
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from prefix_tree import Autocompleter, SimplePrefixTree, CompressedPrefixTree
+
+
+class CopyOnWritePrefixTree(Autocompleter):
+    """A SimplePrefixTree or CompressedPrefixTree that changes by path
+    copying.
+
+    Each query reads the current version once, in a single attribute
+    access, and then reads only that version, which is never changed, so
+    it never sees a change half made. Each change copies the trees on the
+    path to its prefix, so it costs time proportional to the depth of that
+    path and the number of subtrees along it, not to the size of the tree.
+
+    === Private Attributes ===
+    _tree:
+        The current version of the tree. It is never changed once it is the
+        current version.
+    _lock:
+        Held while a change is made, so that changes made by different
+        threads are each made to the version left by the one before.
+
+    === Representation invariants ===
+    - _tree has no tombstones.
+    """
+    _tree: SimplePrefixTree
+    _lock: threading.Lock
+
+    def __init__(self, tree: SimplePrefixTree) -> None:
+        """Initialize this tree with the contents of <tree>, a
+        SimplePrefixTree or CompressedPrefixTree.
+
+        <tree> becomes the first version of this tree, so it must not be
+        changed directly afterwards.
+        """
+        tree.compact()
+        self._tree = tree
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_items(cls, weight_type: str,
+                   items: Iterable[Tuple[Any, float, List]]
+                   ) -> CopyOnWritePrefixTree:
+        """Return a new CopyOnWritePrefixTree over a CompressedPrefixTree
+        with the given <weight_type>, storing every (value, weight, prefix)
+        triple in <items> as if they were inserted one at a time, in order.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        return cls(CompressedPrefixTree.from_items(weight_type, items))
+
+    def snapshot(self) -> SimplePrefixTree:
+        """Return the current version of this tree.
+
+        The version returned is not affected by later changes to this tree,
+        and must not be changed.
+        """
+        return self._tree
+
+    @property
+    def weight_type(self) -> str:
+        """The way the weight of this tree is calculated."""
+        return self._tree.weight_type
+
+    @property
+    def weight(self) -> float:
+        """The aggregate weight of this tree, or 0.0 if it is empty."""
+        return self._tree.weight
+
+    def is_empty(self) -> bool:
+        """Return whether this tree is empty."""
+        return self._tree.is_empty()
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this tree."""
+        return len(self._tree)
+
+    def count(self, prefix: List) -> int:
+        """Return the number of values that match the given prefix."""
+        return self._tree.count(prefix)
+
+    def autocomplete(self, prefix: List, limit: Optional[int] = None,
+                     exact: bool = False) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix, from the
+        current version of this tree, as SimplePrefixTree.autocomplete does.
+
+        Precondition: limit is None or limit > 0.
+        """
+        return self._tree.autocomplete(prefix, limit, exact)
+
+    def autocomplete_many(self, prefixes: List[List],
+                          limit: Optional[int] = None, exact: bool = False
+                          ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete with <limit> and <exact> for
+        each prefix in <prefixes>, in the same order, as
+        SimplePrefixTree.autocomplete_many does.
+
+        Every prefix is answered from the same version of this tree.
+        """
+        return self._tree.autocomplete_many(prefixes, limit, exact)
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a tuple (value, weight),
+        in non-increasing weight order.
+
+        The matches are those of the version of this tree that was current
+        when this was called, so this tree may be changed while they are
+        being yielded.
+        """
+        return self._tree.iter_autocomplete(prefix)
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value into this Autocompleter, as
+        SimplePrefixTree.insert does, in a new version of this tree.
+        """
+        with self._lock:
+            tree = self._tree._copy()
+            tree._copy_path(prefix, {tree})
+            tree.insert(value, weight, prefix)
+            self._tree = tree
+
+    def insert_many(self, items: Iterable[Tuple[Any, float, List]]) -> None:
+        """Insert every (value, weight, prefix) triple in <items> into this
+        Autocompleter, as if insert were called on each of them in order.
+
+        All of the triples are inserted into one new version of this tree,
+        so readers see either none of them or all of them, and a tree on
+        the paths of several triples is only copied once.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        items = list(items)
+        with self._lock:
+            tree = self._tree._copy()
+            copies = {tree}
+            for _, _, prefix in items:
+                tree._copy_path(prefix, copies)
+            tree.insert_many(items)
+            self._tree = tree
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix, in a new version
+        of this tree.
+        """
+        with self._lock:
+            tree = self._tree._copy()
+            tree._copy_path(prefix, {tree})
+            tree.remove(prefix)
+            self._tree = tree
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4,
+        'extra-imports': ['threading', 'prefix_tree']
+    })
@@ -0,0 +1,556 @@
+"""CSC148 Assignment 2: Directed acyclic word graph
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains DawgAutocompleter, an implementation of the Autocompleter
+interface that stores its prefix sequences in a minimized directed acyclic
+word graph. Like a prefix tree, the graph shares the common beginnings of its
+prefix sequences; unlike a prefix tree, it also shares their common endings,
+so corpora of natural-language text take far fewer nodes.
+"""
+from __future__ import annotations
+import gc
+import heapq
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from prefix_tree import Autocompleter
+
+
+class DawgAutocompleter(Autocompleter):
+    """An Autocompleter that stores its prefix sequences in a minimized
+    directed acyclic word graph (DAWG).
+
+    Each state of the graph stands for every prefix sequence that leads to
+    it from the root, and no two states have the same values ending at them
+    and the same transitions, so states are shared by all prefix sequences
+    with the same set of possible endings. Like the edges of a
+    CompressedPrefixTree, each transition is labelled with a sequence of
+    tokens, so that there is no state with no values ending at it and only
+    one transition out of it. Because shared states belong to
+    many different prefix sequences, weights are not kept in the graph.
+    Instead, the values are numbered in lexicographic order of their prefix
+    sequences, which makes the values matching any prefix a consecutive
+    range of numbers, or *ranks*, and weights are kept by rank.
+
+    The graph is built in one pass from the sorted prefix sequences, so it
+    suits corpora that change rarely. Adding weight to a value that is
+    already stored is done in place, but other insertions and all removals
+    are recorded and applied together, by rebuilding the graph, the next
+    time this Autocompleter is read.
+
+    === Attributes ===
+    weight_type:
+        A string representing the way to calculate the weight of this
+        Autocompleter.
+
+    === Private Attributes ===
+    _tokens:
+        The token for each token id, in increasing order.
+    _token_ids:
+        A mapping from each token to its token id.
+    _root:
+        The state for the empty prefix sequence.
+    _final:
+        The number of values whose prefix sequence ends at each state.
+    _count:
+        The number of values whose prefix sequence passes through or ends
+        at each state.
+    _edges:
+        The transitions out of state i are _edges[i] to _edges[i + 1] - 1,
+        in increasing order of the first token id of their labels.
+    _edge_token:
+        The first token id of the label of each transition.
+    _edge_label:
+        The token ids of the label of transition i are
+        _label_tokens[_edge_label[i]:_edge_label[i] + _edge_length[i]].
+    _edge_length:
+        The number of tokens in the label of each transition.
+    _label_tokens:
+        The token ids of every distinct label, label after label.
+    _edge_target:
+        The state each transition leads to.
+    _edge_rank:
+        For each transition, the number of values below its state that are
+        ranked before the values below its target.
+    _values:
+        The value with each rank.
+    _weights:
+        The weight of the value with each rank.
+    _best:
+        A segment tree over _weights: entry i, for 1 <= i < len(_values),
+        is the rank of the heaviest value in the range that entry covers,
+        and entry len(_values) + r is rank r itself.
+    _total:
+        The sum of the weights of all values.
+    _pending:
+        The changes not applied yet, in order: (prefix, (value, weight)) for
+        an insertion and (prefix, None) for a removal.
+
+    === Representation invariants ===
+    - weight_type == 'sum' or weight_type == 'average'
+    - Every token is comparable with every other token using <.
+    - The values whose prefix sequence starts with the one leading to a
+      state have consecutive ranks, from the rank reached on the way to the
+      state to that rank plus the _count of the state.
+    - Between values with the same weight, the one with the lower rank is
+      the heavier in _best.
+    """
+    weight_type: str
+    _tokens: List[Any]
+    _token_ids: Dict[Any, int]
+    _root: int
+    _final: array
+    _count: array
+    _edges: array
+    _edge_token: array
+    _edge_label: array
+    _edge_length: array
+    _label_tokens: array
+    _edge_target: array
+    _edge_rank: array
+    _values: List[Any]
+    _weights: array
+    _best: array
+    _total: float
+    _pending: List[Tuple[List, Optional[Tuple[Any, float]]]]
+
+    def __init__(self, weight_type: str) -> None:
+        """Initialize an empty DawgAutocompleter.
+
+        Precondition: weight_type == 'sum' or weight_type == 'average'.
+        """
+        self.weight_type = weight_type
+        self._pending = []
+        self._build({})
+
+    @classmethod
+    def from_items(cls, weight_type: str,
+                   items: Iterable[Tuple[Any, float, List]]
+                   ) -> DawgAutocompleter:
+        """Return a new DawgAutocompleter with the given <weight_type>,
+        storing every (value, weight, prefix) triple in <items> as if they
+        were inserted one at a time, in order.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        dawg = cls(weight_type)
+        entries = {}
+        for value, weight, prefix in items:
+            _add_entry(entries, value, weight, prefix)
+        dawg._build(entries)
+        return dawg
+
+    @property
+    def weight(self) -> float:
+        """The aggregate weight of this Autocompleter, or 0.0 if it is
+        empty.
+        """
+        self._flush()
+        if not self._values:
+            return 0.0
+        elif self.weight_type == 'sum':
+            return self._total
+        else:
+            return self._total / len(self._values)
+
+    def is_empty(self) -> bool:
+        """Return whether this Autocompleter is empty."""
+        return len(self) == 0
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this Autocompleter."""
+        self._flush()
+        return len(self._values)
+
+    def count(self, prefix: List) -> int:
+        """Return the number of values that match the given prefix."""
+        self._flush()
+        lo, hi = self._ranks(prefix)
+        return hi - lo
+
+    def _state_count(self) -> int:
+        """Return the number of states in the graph."""
+        self._flush()
+        return len(self._final)
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value into this Autocompleter.
+
+        The value is inserted with the given weight, and is associated with
+        the prefix sequence <prefix>.
+
+        If the value has already been inserted into this Autocompleter
+        (compare values using ==), then the given weight should be *added*
+        to the existing weight of this value.
+
+        Preconditions:
+            weight > 0
+            The given value is either:
+                1) not in this Autocompleter
+                2) was previously inserted with the SAME prefix sequence
+        """
+        if not self._pending:
+            state, rank = self._descend(prefix)
+            if state >= 0:
+                for r in range(rank, rank + self._final[state]):
+                    if self._values[r] == value:
+                        self._weights[r] += weight
+                        self._total += weight
+                        self._update_best(r)
+                        return
+        self._pending.append((prefix, (value, weight)))
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix.
+        """
+        if not self._pending and self.count(prefix) == 0:
+            return
+        self._pending.append((prefix, None))
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        The return value is a list of tuples (value, weight), and must be
+        ordered in non-increasing weight. The <limit> heaviest matches are
+        returned, with ties going to the value whose prefix sequence comes
+        first.
+
+        If limit is None, return *every* match for the given prefix.
+
+        Precondition: limit is None or limit > 0.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        self._flush()
+        lo, hi = self._ranks(prefix)
+        if limit is None or hi - lo <= limit:
+            # A stable sort keeps equally heavy values in order of rank.
+            ranks = sorted(range(lo, hi), key=self._weights.__getitem__,
+                           reverse=True)
+        else:
+            ranks = []
+            for rank in self._heaviest(lo, hi):
+                ranks.append(rank)
+                if len(ranks) == limit:
+                    break
+        return [(self._values[rank], self._weights[rank]) for rank in ranks]
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a tuple (value, weight),
+        in non-increasing weight order.
+
+        Matches are found as they are needed, so a caller that stops early
+        does not pay for the rest. This Autocompleter must not be changed
+        while the matches are being yielded.
+        """
+        self._flush()
+        for rank in self._heaviest(*self._ranks(prefix)):
+            yield self._values[rank], self._weights[rank]
+
+    def _descend(self, prefix: List) -> Tuple[int, int]:
+        """Return the highest state whose values all match <prefix>, and the
+        lowest rank of those values, or (-1, 0) if no value matches
+        <prefix>.
+
+        Precondition: there are no pending changes.
+        """
+        state = self._root
+        rank = 0
+        depth = 0
+        while depth < len(prefix):
+            token = self._token_ids.get(prefix[depth])
+            if token is None:
+                return -1, 0
+            start, end = self._edges[state], self._edges[state + 1]
+            i = bisect_left(self._edge_token, token, start, end)
+            if i == end or self._edge_token[i] != token:
+                return -1, 0
+            # <prefix> may end partway along the label of the transition.
+            label, length = self._edge_label[i], self._edge_length[i]
+            for j in range(1, min(length, len(prefix) - depth)):
+                if self._label_tokens[label + j] != \
+                        self._token_ids.get(prefix[depth + j]):
+                    return -1, 0
+            depth += length
+            rank += self._edge_rank[i]
+            state = self._edge_target[i]
+        return state, rank
+
+    def _ranks(self, prefix: List) -> Tuple[int, int]:
+        """Return (lo, hi), where the values that match <prefix> are those
+        with ranks lo to hi - 1.
+
+        Precondition: there are no pending changes.
+        """
+        state, rank = self._descend(prefix)
+        if state < 0:
+            return 0, 0
+        return rank, rank + self._count[state]
+
+    def _heavier(self, a: int, b: int) -> int:
+        """Return whichever of the ranks <a> and <b> has the heavier value,
+        or the lower rank if their values are equally heavy. A rank of -1
+        loses to any other.
+        """
+        if a < 0:
+            return b
+        elif b < 0:
+            return a
+        elif self._weights[a] > self._weights[b] or \
+                (self._weights[a] == self._weights[b] and a < b):
+            return a
+        return b
+
+    def _heaviest_in(self, lo: int, hi: int) -> int:
+        """Return the rank of the heaviest value with rank lo to hi - 1.
+
+        Precondition: lo < hi
+        """
+        weights = self._weights
+        best_of = self._best
+        best = -1
+        most = 0.0
+        lo += len(self._values)
+        hi += len(self._values)
+        # This is _heavier, written out, since it runs for every level of
+        # the segment tree.
+        while lo < hi:
+            if lo & 1:
+                rank = best_of[lo]
+                if best < 0 or weights[rank] > most or \
+                        (weights[rank] == most and rank < best):
+                    best, most = rank, weights[rank]
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                rank = best_of[hi]
+                if best < 0 or weights[rank] > most or \
+                        (weights[rank] == most and rank < best):
+                    best, most = rank, weights[rank]
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def _heaviest(self, lo: int, hi: int) -> Iterator[int]:
+        """Yield the ranks lo to hi - 1 in order from the heaviest value to
+        the lightest, finding each only when it is needed.
+        """
+        heap = []
+        if lo < hi:
+            best = self._heaviest_in(lo, hi)
+            heap.append((-self._weights[best], best, lo, hi))
+        while heap:
+            _, best, lo, hi = heapq.heappop(heap)
+            yield best
+            # The rest of the range is split around the rank just yielded.
+            for lo, hi in [(lo, best), (best + 1, hi)]:
+                if lo < hi:
+                    rank = self._heaviest_in(lo, hi)
+                    heapq.heappush(heap,
+                                   (-self._weights[rank], rank, lo, hi))
+
+    def _update_best(self, rank: int) -> None:
+        """Update _best after the weight of the value with rank <rank> has
+        changed.
+        """
+        i = (rank + len(self._values)) >> 1
+        while i > 0:
+            self._best[i] = self._heavier(self._best[2 * i],
+                                          self._best[2 * i + 1])
+            i >>= 1
+
+    def _flush(self) -> None:
+        """Apply the pending changes by rebuilding the graph."""
+        if not self._pending:
+            return
+        entries = self._entries()
+        for prefix, item in self._pending:
+            if item is not None:
+                _add_entry(entries, item[0], item[1], prefix)
+            else:
+                n = len(prefix)
+                prefix = tuple(prefix)
+                for key in [key for key in entries if key[:n] == prefix]:
+                    del entries[key]
+        self._pending = []
+        self._build(entries)
+
+    def _entries(self) -> Dict[tuple, List[List]]:
+        """Return every prefix sequence in the graph, as a tuple, mapped to a
+        list of [value, weight] pairs for the values with that prefix
+        sequence, in order of rank.
+
+        Precondition: there are no pending changes.
+        """
+        entries = {}
+        rank = 0
+        stack = [(self._root, ())]
+        while stack:
+            state, key = stack.pop()
+            if self._final[state] > 0:
+                entries[key] = [[self._values[r], self._weights[r]] for r in
+                                range(rank, rank + self._final[state])]
+                rank += self._final[state]
+            for i in range(self._edges[state + 1] - 1, self._edges[state] - 1,
+                           -1):
+                label = self._edge_label[i]
+                stack.append((self._edge_target[i], key + tuple(
+                    self._tokens[token] for token in
+                    self._label_tokens[label:label + self._edge_length[i]])))
+        return entries
+
+    def _build(self, entries: Dict[tuple, List[List]]) -> None:
+        """Replace the graph with one for <entries>, which maps each prefix
+        sequence, as a tuple, to a list of [value, weight] pairs for the
+        values with that prefix sequence.
+        """
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._build_graph(entries)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self._total = sum(self._weights)
+        n = len(self._values)
+        self._best = array('i', [-1]) * n + array('i', range(n))
+        for i in range(n - 1, 0, -1):
+            self._best[i] = self._heavier(self._best[2 * i],
+                                          self._best[2 * i + 1])
+
+    def _build_graph(self, entries: Dict[tuple, List[List]]) -> None:
+        """
+        Helper method for _build.
+        Replace the states, transitions and values with those for
+        <entries>, adding the prefix sequences in sorted order and
+        registering each state once no more prefix sequences can pass
+        through it.
+        """
+        self._tokens = sorted({token for key in entries for token in key})
+        self._token_ids = {token: i for i, token in enumerate(self._tokens)}
+        keys = sorted((tuple(self._token_ids[token] for token in key), key)
+                      for key in entries)
+        self._final = array('i')
+        self._count = array('i')
+        self._edges = array('i')
+        self._edge_token = array('i')
+        self._edge_label = array('i')
+        self._edge_length = array('i')
+        self._label_tokens = array('i')
+        self._edge_target = array('i')
+        self._edge_rank = array('i')
+        self._values = []
+        self._weights = array('d')
+
+        # The states for the last prefix sequence added, which may still
+        # turn out to be equivalent to registered states, as
+        # [final, token ids, rest of labels, targets]. The rest of the last
+        # label and the last target of each are filled in once the next
+        # state is registered.
+        register = {}
+        labels = {}
+        path = [[0, [], [], []]]
+        last = ()
+        for ids, key in keys:
+            shared = 0
+            while shared < min(len(last), len(ids)) and \
+                    last[shared] == ids[shared]:
+                shared += 1
+            while len(path) > shared + 1:
+                state = path.pop()
+                path[-1][2][-1], path[-1][3][-1] = \
+                    self._register(state, register, labels)
+            for token in ids[shared:]:
+                path[-1][1].append(token)
+                path[-1][2].append(None)
+                path[-1][3].append(-1)
+                path.append([0, [], [], []])
+            path[-1][0] = len(entries[key])
+            for value, weight in entries[key]:
+                self._values.append(value)
+                self._weights.append(weight)
+            last = ids
+        while len(path) > 1:
+            state = path.pop()
+            path[-1][2][-1], path[-1][3][-1] = \
+                self._register(state, register, labels)
+        self._root = self._register(path[0], register, labels, True)[1]
+        self._edges.append(len(self._edge_token))
+
+    def _register(self, state: List, register: Dict[tuple, int],
+                  labels: Dict[tuple, int],
+                  keep: bool = False) -> Tuple[List[int], int]:
+        """
+        Helper method for _build_graph.
+        Return (rest, target) for the transition into <state>, where target
+        is the registered state equivalent to <state>, and rest holds the
+        tokens after the first on the label of the transition, in reverse.
+
+        Unless <keep> is True, a state with no values ending at it and only
+        one transition out of it is not registered, and its transition is
+        made part of the label instead. Otherwise, <state> is registered as
+        a new state if no equivalent state is registered yet, and <labels>
+        maps each label already stored to its position in _label_tokens.
+        """
+        final, tokens, rests, targets = state
+        if final == 0 and len(tokens) == 1 and not keep:
+            rests[0].append(tokens[0])
+            return rests[0], targets[0]
+
+        label_positions = []
+        for token, rest in zip(tokens, rests):
+            label = (token,) + tuple(reversed(rest))
+            position = labels.get(label)
+            if position is None:
+                position = len(self._label_tokens)
+                labels[label] = position
+                self._label_tokens.extend(label)
+            label_positions.append(position)
+        signature = (final, tuple(label_positions), tuple(targets))
+        registered = register.get(signature)
+        if registered is not None:
+            return [], registered
+
+        registered = len(self._final)
+        register[signature] = registered
+        self._final.append(final)
+        self._edges.append(len(self._edge_token))
+        below = final
+        for token, rest, position, target in zip(tokens, rests,
+                                                 label_positions, targets):
+            self._edge_token.append(token)
+            self._edge_label.append(position)
+            self._edge_length.append(len(rest) + 1)
+            self._edge_target.append(target)
+            self._edge_rank.append(below)
+            below += self._count[target]
+        self._count.append(below)
+        return [], registered
+
+
+def _add_entry(entries: Dict[tuple, List[List]], value: Any, weight: float,
+               prefix: List) -> None:
+    """Add <value> with <weight> to <entries> under <prefix>, adding the
+    weight to that of the value if it is already there.
+    """
+    pairs = entries.setdefault(tuple(prefix), [])
+    for pair in pairs:
+        if pair[0] == value:
+            pair[1] += weight
+            return
+    pairs.append([value, weight])
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4,
+        'extra-imports': ['gc', 'heapq', 'array', 'bisect', 'prefix_tree']
+    })
@@ -0,0 +1,548 @@
+"""CSC148 Assignment 2: Double-array trie
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains DoubleArrayTrie, an implementation of the Autocompleter
+interface in which every prefix token is first turned into an integer code,
+and the transitions of the trie are stored in two integer arrays, BASE and
+CHECK, so that following a token takes two array lookups. The codes can be
+characters for the letter engine, interned words for the sentence engine or
+intervals for the melody engine; any hashable token works.
+"""
+from __future__ import annotations
+import heapq
+from array import array
+from itertools import count
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from prefix_tree import Autocompleter
+
+# The cell of the root state, and the marker in _check for a free cell and
+# for the root, which has no parent.
+_ROOT = 0
+_FREE = -1
+_NO_PARENT = -2
+
+
+class DoubleArrayTrie(Autocompleter):
+    """A prefix tree stored as a double-array trie.
+
+    Every state of the trie occupies one cell of a set of parallel arrays.
+    Each token is given a positive integer code the first time it is seen,
+    and the child of state s for the token with code c is the state in cell
+    _base[s] + c, as long as _check of that cell is s. Values are not states
+    of their own: each state keeps a list of the values whose prefix sequence
+    ends there.
+
+    === Attributes ===
+    weight_type:
+        A string representing the way to calculate the tree's weight.
+
+    === Private Attributes ===
+    _codes:
+        A mapping from each token seen so far to its code.
+    _base:
+        For each cell in use, the number the codes of its children are added
+        to, to give the cells of those children.
+    _check:
+        The cell of the parent of each state, or _FREE for a free cell, or
+        _NO_PARENT for the root.
+    _child:
+        The code of the first child of each state, or 0 if it has none.
+    _sibling:
+        The code of the next child of the parent of each state, or 0 if it is
+        the last one.
+    _num:
+        The number of values at or below each state.
+    _total:
+        The sum of the weights of the values at or below each state.
+    _max:
+        The largest weight of a value at or below each state, or 0.0 if
+        there is none.
+    _value:
+        The id of the first value at each state, or -1 if there is none.
+    _values:
+        The value for each value id, or None if that id is free.
+    _weights:
+        The weight of the value for each value id.
+    _next_value:
+        The id of the next value at the same state for each value id, or -1.
+    _free_values:
+        Ids of removed values that can be reused.
+    _search_start:
+        No cell before this one is free.
+
+    === Representation invariants ===
+    - weight_type == 'sum' or weight_type == 'average'
+    - All cell columns have the same length, and all value columns have the
+      same length.
+    - Every state other than the root has at least one value at or below
+      it.
+    - Every code is at least 1, and _base[s] + c is a cell for every child
+      code c of every state s.
+    """
+    weight_type: str
+    _codes: Dict[Any, int]
+    _base: array
+    _check: array
+    _child: array
+    _sibling: array
+    _num: array
+    _total: array
+    _max: array
+    _value: array
+    _values: List[Any]
+    _weights: array
+    _next_value: array
+    _free_values: array
+    _search_start: int
+
+    def __init__(self, weight_type: str) -> None:
+        """Initialize an empty double-array trie.
+
+        Precondition: weight_type == 'sum' or weight_type == 'average'.
+        """
+        self.weight_type = weight_type
+        self._codes = {}
+        self._base = array('i')
+        self._check = array('i')
+        self._child = array('i')
+        self._sibling = array('i')
+        self._num = array('i')
+        self._total = array('d')
+        self._max = array('d')
+        self._value = array('i')
+        self._values = []
+        self._weights = array('d')
+        self._next_value = array('i')
+        self._free_values = array('i')
+        self._search_start = 0
+        self._grow(1)
+        self._check[_ROOT] = _NO_PARENT
+        self._search_start = 1
+
+    @classmethod
+    def from_items(cls, weight_type: str,
+                   items: Iterable[Tuple[Any, float, List]]
+                   ) -> DoubleArrayTrie:
+        """Return a new DoubleArrayTrie with the given <weight_type>,
+        storing every (value, weight, prefix) triple in <items> as if they
+        were inserted one at a time, in order.
+
+        The prefix sequences are sorted first, and the trie is laid out one
+        state at a time in breadth-first order, so that the children of
+        every state are placed together once, and never have to be moved.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        trie = cls(weight_type)
+        entries = {}
+        for value, weight, prefix in items:
+            key = tuple(trie._code(token) for token in prefix)
+            pairs = entries.setdefault(key, [])
+            for pair in pairs:
+                if pair[0] == value:
+                    pair[1] += weight
+                    break
+            else:
+                pairs.append([value, weight])
+        trie._build(sorted(entries), entries)
+        return trie
+
+    def _build(self, keys: List[tuple], entries: Dict[tuple, List]) -> None:
+        """
+        Helper method for from_items.
+        Lay out the states for the sorted code sequences <keys>, with the
+        values in <entries>, below the root of this empty trie.
+        """
+        # Each state still to be laid out, with the range of <keys> below it
+        # and its depth.
+        queue = [(_ROOT, 0, len(keys), 0)]
+        for state, lo, hi, depth in queue:
+            if lo < hi and len(keys[lo]) == depth:
+                for value, weight in reversed(entries[keys[lo]]):
+                    self._add_value(state, value, weight)
+                    self._num[state] += 1
+                    self._total[state] += weight
+                    self._max[state] = max(self._max[state], weight)
+                lo += 1
+            groups = []
+            while lo < hi:
+                code = keys[lo][depth]
+                end = lo + 1
+                while end < hi and keys[end][depth] == code:
+                    end += 1
+                groups.append((code, lo, end))
+                lo = end
+            if not groups:
+                continue
+            self._grow(self._search_start + 1)
+            if len(groups) == 1 and groups[0][0] <= self._search_start:
+                # The first free cell fits a single child.
+                base = self._search_start - groups[0][0]
+            else:
+                base = self._find_base([code for code, _, _ in groups])
+            self._base[state] = base
+            for code, lo, end in reversed(groups):
+                self._claim(base + code, state, code)
+                queue.append((base + code, lo, end, depth + 1))
+
+        # Every state comes after its parent in <queue>.
+        for state, _, _, _ in reversed(queue[1:]):
+            parent = self._check[state]
+            self._num[parent] += self._num[state]
+            self._total[parent] += self._total[state]
+            if self._max[state] > self._max[parent]:
+                self._max[parent] = self._max[state]
+
+    def _code(self, token: Any) -> int:
+        """Return the code for <token>, giving it the next code if it has
+        none yet.
+        """
+        code = self._codes.get(token)
+        if code is None:
+            code = len(self._codes) + 1
+            self._codes[token] = code
+        return code
+
+    @property
+    def weight(self) -> float:
+        """The aggregate weight of this tree, or 0.0 if it is empty."""
+        num = self._num[_ROOT]
+        if num == 0:
+            return 0.0
+        elif self.weight_type == 'sum':
+            return self._total[_ROOT]
+        else:
+            return self._total[_ROOT] / num
+
+    def is_empty(self) -> bool:
+        """Return whether this tree is empty."""
+        return self._num[_ROOT] == 0
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this tree."""
+        return self._num[_ROOT]
+
+    def count(self, prefix: List) -> int:
+        """Return the number of values that match the given prefix."""
+        state = self._descend(prefix)
+        if state < 0:
+            return 0
+        return self._num[state]
+
+    def _descend(self, prefix: List) -> int:
+        """Return the state for <prefix>, or -1 if <prefix> is not in this
+        tree.
+        """
+        base = self._base
+        check = self._check
+        state = _ROOT
+        # A token with no code gives None, which cannot be added to a base,
+        # and a child past the last cell is out of range; both mean that
+        # <prefix> is not in this tree.
+        try:
+            for code in map(self._codes.get, prefix):
+                child = base[state] + code
+                if check[child] != state:
+                    return -1
+                state = child
+        except (TypeError, IndexError):
+            return -1
+        return state
+
+    def _children(self, state: int) -> List[int]:
+        """Return the cells of the children of <state>."""
+        children = []
+        code = self._child[state]
+        while code != 0:
+            child = self._base[state] + code
+            children.append(child)
+            code = self._sibling[child]
+        return children
+
+    def _grow(self, size: int) -> None:
+        """Add free cells until there are at least <size> cells."""
+        extra = size - len(self._check)
+        if extra <= 0:
+            return
+        # Grow geometrically, so that growing one cell at a time is cheap.
+        extra = max(extra, len(self._check) // 2)
+        for column, default in [(self._base, 0), (self._check, _FREE),
+                                (self._child, 0), (self._sibling, 0),
+                                (self._num, 0), (self._total, 0.0),
+                                (self._max, 0.0), (self._value, -1)]:
+            column.extend(array(column.typecode, [default]) * extra)
+
+    def _find_base(self, codes: List[int]) -> int:
+        """Return a base for which the cells for all of <codes> are free,
+        adding cells if needed.
+
+        Precondition: <codes> is not empty.
+        """
+        check = self._check
+        first = min(codes)
+        base = max(self._search_start - first, 0)
+        while True:
+            self._grow(base + max(codes) + 1)
+            check = self._check
+            if all(check[base + code] == _FREE for code in codes):
+                return base
+            base += 1
+
+    def _claim(self, cell: int, parent: int, code: int) -> None:
+        """Make the free <cell> a new childless state, the child of <parent>
+        for <code>, and the first of the children of <parent>.
+        """
+        self._check[cell] = parent
+        self._base[cell] = 0
+        self._child[cell] = 0
+        self._value[cell] = -1
+        self._num[cell] = 0
+        self._total[cell] = 0.0
+        self._max[cell] = 0.0
+        self._sibling[cell] = self._child[parent]
+        self._child[parent] = code
+        while self._search_start < len(self._check) and \
+                self._check[self._search_start] != _FREE:
+            self._search_start += 1
+
+    def _release(self, cell: int) -> None:
+        """Make <cell> free."""
+        self._check[cell] = _FREE
+        self._value[cell] = -1
+        self._search_start = min(self._search_start, cell)
+
+    def _add_child(self, state: int, code: int) -> int:
+        """Return the cell of a new child of <state> for <code>, moving the
+        other children of <state> to make room if needed.
+        """
+        cell = self._base[state] + code
+        self._grow(cell + 1)
+        if self._check[cell] != _FREE:
+            codes = [child - self._base[state]
+                     for child in self._children(state)]
+            self._move_children(state, self._find_base(codes + [code]))
+            cell = self._base[state] + code
+        self._claim(cell, state, code)
+        return cell
+
+    def _move_children(self, state: int, base: int) -> None:
+        """Move the children of <state> to the cells for <base>.
+
+        Precondition: the cells for the codes of the children of <state>
+                      with <base> are free.
+        """
+        for child in self._children(state):
+            moved = base + child - self._base[state]
+            for column in [self._base, self._child, self._sibling, self._num,
+                           self._total, self._max, self._value]:
+                column[moved] = column[child]
+            self._check[moved] = state
+            for grandchild in self._children(child):
+                self._check[grandchild] = moved
+            self._release(child)
+        self._base[state] = base
+        while self._search_start < len(self._check) and \
+                self._check[self._search_start] != _FREE:
+            self._search_start += 1
+
+    def _add_value(self, state: int, value: Any, weight: float) -> None:
+        """Add <value> with <weight> to the front of the values at <state>.
+        """
+        if self._free_values:
+            i = self._free_values.pop()
+            self._values[i] = value
+            self._weights[i] = weight
+            self._next_value[i] = self._value[state]
+        else:
+            i = len(self._values)
+            self._values.append(value)
+            self._weights.append(weight)
+            self._next_value.append(self._value[state])
+        self._value[state] = i
+
+    def _refresh(self, state: int) -> None:
+        """Recompute the aggregates of <state> from its values and those of
+        its children.
+        """
+        num = 0
+        total = 0.0
+        most = 0.0
+        i = self._value[state]
+        while i >= 0:
+            num += 1
+            total += self._weights[i]
+            most = max(most, self._weights[i])
+            i = self._next_value[i]
+        for child in self._children(state):
+            num += self._num[child]
+            total += self._total[child]
+            most = max(most, self._max[child])
+        self._num[state] = num
+        self._total[state] = total
+        self._max[state] = most
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value into this Autocompleter.
+
+        The value is inserted with the given weight, and is associated with
+        the prefix sequence <prefix>.
+
+        If the value has already been inserted into this prefix tree
+        (compare values using ==), then the given weight should be *added* to
+        the existing weight of this value.
+
+        Preconditions:
+            weight > 0
+            The given value is either:
+                1) not in this Autocompleter
+                2) was previously inserted with the SAME prefix sequence
+        """
+        path = [_ROOT]
+        state = _ROOT
+        for token in prefix:
+            code = self._code(token)
+            child = self._base[state] + code
+            if child >= len(self._check) or self._check[child] != state:
+                child = self._add_child(state, code)
+            path.append(child)
+            state = child
+
+        i = self._value[state]
+        while i >= 0 and self._values[i] != value:
+            i = self._next_value[i]
+        added = 0
+        if i < 0:
+            self._add_value(state, value, weight)
+            i = self._value[state]
+            added = 1
+        else:
+            self._weights[i] += weight
+        for state in path:
+            self._num[state] += added
+            self._total[state] += weight
+            if self._weights[i] > self._max[state]:
+                self._max[state] = self._weights[i]
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        The return value is a list of tuples (value, weight), and must be
+        ordered in non-increasing weight. The <limit> heaviest matches are
+        returned.
+
+        If limit is None, return *every* match for the given prefix.
+
+        Precondition: limit is None or limit > 0.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        autocompleted = []
+        for item in self.iter_autocomplete(prefix):
+            autocompleted.append(item)
+            if len(autocompleted) == limit:
+                break
+        return autocompleted
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a tuple (value, weight),
+        in non-increasing weight order.
+
+        States are explored in order of their largest weight, so only as
+        much of the trie is visited as is needed for the matches yielded.
+        This tree must not be changed while the matches are being yielded.
+        """
+        state = self._descend(prefix)
+        if state < 0 or self._num[state] == 0:
+            return
+        # States are pushed as their cell, and values as the complement
+        # (~) of their id, which is negative. Ties go to the most recently
+        # pushed entry.
+        order = count(0, -1)
+        heap = [(-self._max[state], next(order), state)]
+        while heap:
+            entry = heapq.heappop(heap)[2]
+            if entry < 0:
+                yield self._values[~entry], self._weights[~entry]
+                continue
+            i = self._value[entry]
+            while i >= 0:
+                heapq.heappush(heap, (-self._weights[i], next(order), ~i))
+                i = self._next_value[i]
+            code = self._child[entry]
+            while code != 0:
+                child = self._base[entry] + code
+                heapq.heappush(heap, (-self._max[child], next(order), child))
+                code = self._sibling[child]
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix.
+        """
+        if self._descend(prefix) < 0:
+            return
+        path = [_ROOT]
+        for token in prefix:
+            path.append(self._base[path[-1]] + self._codes[token])
+
+        # Remove the state for <prefix>, and every state above it that is
+        # left with no values, but never the root.
+        top = len(path) - 1
+        while top > 1 and self._num[path[top - 1]] == self._num[path[top]]:
+            top -= 1
+        if top == 0:
+            for child in self._children(_ROOT):
+                self._free(child)
+            self._child[_ROOT] = 0
+            self._free_value_list(_ROOT)
+            self._refresh(_ROOT)
+            return
+        self._unlink(path[top - 1], path[top])
+        self._free(path[top])
+        for state in reversed(path[:top]):
+            self._refresh(state)
+
+    def _unlink(self, parent: int, child: int) -> None:
+        """Remove <child> from the list of children of <parent>."""
+        code = child - self._base[parent]
+        if self._child[parent] == code:
+            self._child[parent] = self._sibling[child]
+            return
+        prev = self._base[parent] + self._child[parent]
+        while self._sibling[prev] != code:
+            prev = self._base[parent] + self._sibling[prev]
+        self._sibling[prev] = self._sibling[child]
+
+    def _free(self, state: int) -> None:
+        """Free <state> and every state below it, along with their values.
+
+        Precondition: <state> has already been unlinked from its parent.
+        """
+        stack = [state]
+        while stack:
+            state = stack.pop()
+            stack.extend(self._children(state))
+            self._free_value_list(state)
+            self._release(state)
+
+    def _free_value_list(self, state: int) -> None:
+        """Free the values at <state>."""
+        i = self._value[state]
+        while i >= 0:
+            self._values[i] = None
+            self._free_values.append(i)
+            i = self._next_value[i]
+        self._value[state] = -1
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4,
+        'extra-imports': ['heapq', 'array', 'itertools', 'prefix_tree']
+    })
@@ -0,0 +1,377 @@
+"""CSC148 Assignment 2: Frozen prefix tree
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains FrozenPrefixTree, a read-only Autocompleter that answers
+queries straight from a file written by SimplePrefixTree.freeze or
+CompressedPrefixTree.freeze. The file is memory-mapped rather than read,
+and the nodes are never turned into Python objects, so opening a frozen
+tree takes about as long as reading its token table, and every process that
+opens the same file shares one copy of it in memory.
+"""
+from __future__ import annotations
+import heapq
+import mmap
+import pickle
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import count
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from prefix_tree import Autocompleter
+
+# Frozen files start with this magic string and format version, followed by
+# the offset and size of the pickled header, which is at the end of the file.
+_FROZEN_MAGIC = b'PREFIXFROZ'
+_FROZEN_VERSION = 1
+_FROZEN_START = struct.Struct('<10sHQQ')
+
+# The name and array typecode of each column of a frozen file, in order.
+_COLUMNS = [('first', 'i'), ('edge', 'i'), ('index', 'i'), ('num', 'i'),
+            ('total', 'd'), ('max', 'd'), ('value', 'i'),
+            ('edge_tokens', 'i'), ('keys', 'i'), ('key_nodes', 'i'),
+            ('value_offsets', 'q')]
+
+
+class FrozenPrefixTree(Autocompleter):
+    """A read-only prefix tree stored in a memory-mapped file.
+
+    Nodes are numbered in breadth-first order from the root, node 0, so that
+    the children of each node are numbered consecutively, in the order of
+    the subtrees of the tree that was frozen. Entry i of each node column
+    describes node i, and the columns that give a range of another column
+    have one more entry, so that the range for node i ends where the range
+    for node i + 1 starts.
+
+    === Attributes ===
+    weight_type:
+        A string representing the way the tree's weight is calculated.
+
+    === Private Attributes ===
+    _file:
+        The open frozen file.
+    _map:
+        The memory map of the frozen file.
+    _first:
+        The children of node i are nodes _first[i] to _first[i + 1] - 1.
+    _edge:
+        The ids of the tokens on the edge leading to node i are
+        _edge_tokens[_edge[i]:_edge[i + 1]].
+    _index:
+        The first tokens of the edges leading to the non-leaf children of
+        node i are _keys[_index[i]:_index[i + 1]], in increasing order, and
+        those children are the nodes in the same range of _key_nodes.
+    _num:
+        The number of leaves below each node (1 for a leaf).
+    _total:
+        The sum of the leaf weights below each node.
+    _max:
+        The largest leaf weight below each node, or 0.0 if there is none.
+    _value:
+        The value id stored in each leaf, or -1 for non-leaf nodes.
+    _edge_tokens:
+        The token ids on every edge, edge after edge.
+    _keys:
+        The token ids that index the children of every node.
+    _key_nodes:
+        The child for each entry of _keys.
+    _values_offset:
+        The position in the file of the pickled values.
+    _value_offsets:
+        The value with id i is pickled from byte _value_offsets[i] to byte
+        _value_offsets[i + 1] of the pickled values.
+    _tokens:
+        The token for each token id.
+    _token_ids:
+        A mapping from each token to its token id.
+
+    === Representation invariants ===
+    - weight_type == 'sum' or weight_type == 'average'
+    - The children of each node are sorted in non-increasing order of
+      weight.
+    - Every node other than the root has at least one leaf below it.
+    """
+    weight_type: str
+    _file: Any
+    _map: mmap.mmap
+    _first: memoryview
+    _edge: memoryview
+    _index: memoryview
+    _num: memoryview
+    _total: memoryview
+    _max: memoryview
+    _value: memoryview
+    _edge_tokens: memoryview
+    _keys: memoryview
+    _key_nodes: memoryview
+    _values_offset: int
+    _value_offsets: memoryview
+    _tokens: List[Any]
+    _token_ids: Dict[Any, int]
+
+    def __init__(self, path: str) -> None:
+        """Open the frozen prefix tree in the file at <path>, which must have
+        been written by the freeze method of a prefix tree.
+
+        Raise ValueError if <path> is not a frozen prefix tree.
+        """
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f'{path} is not a frozen prefix tree')
+        try:
+            self._open(path)
+        except ValueError:
+            self.close()
+            raise
+
+    def _open(self, path: str) -> None:
+        """
+        Helper method for __init__.
+        Read the header of the frozen file at <path> and set up the columns.
+        """
+        if len(self._map) < _FROZEN_START.size:
+            raise ValueError(f'{path} is not a frozen prefix tree')
+        magic, version, header_offset, header_size = \
+            _FROZEN_START.unpack_from(self._map)
+        if magic != _FROZEN_MAGIC:
+            raise ValueError(f'{path} is not a frozen prefix tree')
+        elif version != _FROZEN_VERSION:
+            raise ValueError(f'{path} has frozen format version {version}, '
+                             f'not {_FROZEN_VERSION}')
+        elif header_offset + header_size > len(self._map):
+            raise ValueError(f'{path} is a truncated frozen prefix tree')
+        self.weight_type, self._tokens, sections, self._values_offset = \
+            pickle.loads(self._map[header_offset:header_offset + header_size])
+        self._token_ids = {token: i for i, token in enumerate(self._tokens)}
+
+        data = memoryview(self._map)
+        for (name, typecode), (offset, length) in zip(_COLUMNS, sections):
+            end = offset + length * array(typecode).itemsize
+            if end > header_offset:
+                raise ValueError(f'{path} is a truncated frozen prefix tree')
+            if sys.byteorder == 'little':
+                column = data[offset:end].cast(typecode)
+            else:
+                # The file is little-endian, so it can only be read in place
+                # on little-endian machines.
+                column = array(typecode)
+                column.frombytes(data[offset:end])
+                column.byteswap()
+            setattr(self, '_' + name, column)
+        data.release()
+
+    def close(self) -> None:
+        """Close the file this tree is read from. The tree can no longer be
+        used afterwards.
+        """
+        for name, _ in _COLUMNS:
+            column = getattr(self, '_' + name, None)
+            if isinstance(column, memoryview):
+                column.release()
+        self._map.close()
+        self._file.close()
+
+    @property
+    def weight(self) -> float:
+        """The aggregate weight of this tree, or 0.0 if it is empty."""
+        num = self._num[0]
+        if num == 0:
+            return 0.0
+        elif self.weight_type == 'sum':
+            return self._total[0]
+        else:
+            return self._total[0] / num
+
+    def is_empty(self) -> bool:
+        """Return whether this tree is empty."""
+        return self._num[0] == 0
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this tree."""
+        return self._num[0]
+
+    def count(self, prefix: List) -> int:
+        """Return the number of values that match the given prefix."""
+        node = self._find(prefix)
+        if node < 0:
+            return 0
+        return self._num[node]
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Refuse to insert into this read-only tree."""
+        raise TypeError('a frozen prefix tree cannot be changed')
+
+    def remove(self, prefix: List) -> None:
+        """Refuse to remove from this read-only tree."""
+        raise TypeError('a frozen prefix tree cannot be changed')
+
+    def _find(self, prefix: List) -> int:
+        """Return the highest node whose values all match <prefix>, or -1 if
+        no value in this tree matches <prefix>.
+        """
+        node = 0
+        depth = 0
+        while depth < len(prefix):
+            token = self._token_ids.get(prefix[depth])
+            if token is None:
+                return -1
+            start, end = self._index[node], self._index[node + 1]
+            i = bisect_left(self._keys, token, start, end)
+            if i == end or self._keys[i] != token:
+                return -1
+            node = self._key_nodes[i]
+            # Like in a CompressedPrefixTree, <prefix> may end partway along
+            # the edge to <node>.
+            start, end = self._edge[node], self._edge[node + 1]
+            for i in range(1, min(end - start, len(prefix) - depth)):
+                if self._tokens[self._edge_tokens[start + i]] != \
+                        prefix[depth + i]:
+                    return -1
+            depth += end - start
+        return node
+
+    def _leaf_value(self, node: int) -> Any:
+        """Return the value stored in the leaf <node>."""
+        i = self._value[node]
+        start = self._values_offset + self._value_offsets[i]
+        end = self._values_offset + self._value_offsets[i + 1]
+        return pickle.loads(self._map[start:end])
+
+    def autocomplete(self, prefix: List, limit: Optional[int] = None,
+                     exact: bool = False) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        The return value is a list of tuples (value, weight), and must be
+        ordered in non-increasing weight.
+
+        If limit is None, return *every* match for the given prefix.
+
+        Like SimplePrefixTree, this visits the children of each node from
+        heaviest to lightest until <limit> values are found, unless <exact>
+        is True, in which case the <limit> heaviest matches are returned.
+
+        Precondition: limit is None or limit > 0.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        node = self._find(prefix)
+        if node < 0 or self._num[node] == 0:
+            return []
+        elif exact:
+            leaves = []
+            for leaf in self._best_first(node):
+                leaves.append(leaf)
+                if len(leaves) == limit:
+                    break
+        else:
+            leaves = self._collect(node, limit)
+        return [(self._leaf_value(leaf), self._total[leaf])
+                for leaf in leaves]
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a tuple (value, weight),
+        in non-increasing weight order.
+
+        Matches are found as they are needed, so a caller that stops early
+        does not pay for the rest.
+        """
+        node = self._find(prefix)
+        if node >= 0 and self._num[node] > 0:
+            for leaf in self._best_first(node):
+                yield self._leaf_value(leaf), self._total[leaf]
+
+    def _best_first(self, node: int) -> Iterator[int]:
+        """
+        Helper for autocomplete and iter_autocomplete.
+        Yield the leaves below <node> in non-increasing weight order,
+        exploring nodes in order of their largest leaf weight.
+        """
+        # Ties go to the most recently pushed node, so that equally heavy
+        # nodes are searched depth-first, in order of weight.
+        order = count(0, -1)
+        heap = [(-self._max[node], next(order), node)]
+        while heap:
+            node = heapq.heappop(heap)[2]
+            if self._value[node] >= 0:
+                yield node
+            else:
+                for child in range(self._first[node + 1] - 1,
+                                   self._first[node] - 1, -1):
+                    heapq.heappush(heap, (-self._max[child], next(order),
+                                          child))
+
+    def _collect(self, node: int, limit: Optional[int]) -> List[int]:
+        """
+        Helper for autocomplete.
+        Return up to <limit> leaves below <node>, taking children in order,
+        in non-increasing weight order.
+        """
+        leaves = []
+        stack = [node]
+        while stack and (limit is None or len(leaves) < limit):
+            node = stack.pop()
+            if self._value[node] >= 0:
+                leaves.append(node)
+            else:
+                stack.extend(range(self._first[node + 1] - 1,
+                                   self._first[node] - 1, -1))
+        # A stable sort keeps equally heavy leaves in the order visited.
+        leaves.sort(key=self._total.__getitem__, reverse=True)
+        return leaves
+
+
+def _write_frozen(path: str, weight_type: str, tokens: List[Any],
+                  columns: Dict[str, array], values: List[bytes]) -> None:
+    """Write a frozen prefix tree to the file at <path>.
+
+    <columns> maps the name of each column to its contents, except for
+    value_offsets, which is empty and is filled in here. <tokens> is the
+    token for each token id, and <values> is the pickled value for each
+    value id.
+    """
+    value_offsets = columns['value_offsets']
+    value_offsets.append(0)
+    for value in values:
+        value_offsets.append(value_offsets[-1] + len(value))
+    with open(path, 'wb') as f:
+        f.write(bytes(_FROZEN_START.size))
+        sections = []
+        for name, typecode in _COLUMNS:
+            column = columns[name]
+            # Align every column, so that it can be read in place.
+            f.write(bytes(-f.tell() % 8))
+            sections.append((f.tell(), len(column)))
+            if sys.byteorder == 'big':
+                column = array(typecode, column)
+                column.byteswap()
+            f.write(column.tobytes())
+        values_offset = f.tell()
+        for value in values:
+            f.write(value)
+        header_offset = f.tell()
+        header = pickle.dumps((weight_type, tokens, sections, values_offset),
+                              pickle.HIGHEST_PROTOCOL)
+        f.write(header)
+        f.seek(0)
+        f.write(_FROZEN_START.pack(_FROZEN_MAGIC, _FROZEN_VERSION,
+                                   header_offset, len(header)))
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4,
+        'allowed-io': ['__init__', '_write_frozen'],
+        'extra-imports': ['heapq', 'mmap', 'pickle', 'struct', 'sys', 'array',
+                          'bisect', 'itertools', 'prefix_tree']
+    })
@@ -15,7 +15,32 @@ testing directly! You may, however, add new private attributes, methods, and
 top-level functions to this file.
 """
 from __future__ import annotations
-from typing import Any, List, Optional, Tuple
+import gc
+import heapq
+import os
+import pickle
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count, islice
+from typing import (TYPE_CHECKING, Any, Dict, Iterable, Iterator, List,
+                    Optional, Set, Tuple)
+
+if TYPE_CHECKING:
+    # frozen_prefix_tree imports this module, so FrozenPrefixTree is only
+    # imported here for annotations, and by freeze when it is called.
+    from frozen_prefix_tree import FrozenPrefixTree
+
+# A node builds a dict index of its non-leaf subtrees once it has more than
+# this many subtrees; smaller nodes are searched directly.
+_INDEX_THRESHOLD = 8
+
+# Snapshot files written by save start with this magic string and format
+# version, followed by the pickled snapshot header and the node arrays.
+_SNAPSHOT_MAGIC = b'PREFIXTREE'
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_START = struct.Struct('<10sHQ')
 
 
 ################################################################################
@@ -24,6 +49,7 @@ from typing import Any, List, Optional, Tuple
 class Autocompleter:
     """An abstract class representing the Autocompleter Abstract Data Type.
     """
+    __slots__ = ()
 
     def __len__(self) -> int:
         """Return the number of values stored in this Autocompleter."""
@@ -60,11 +86,58 @@ class Autocompleter:
         """
         raise NotImplementedError
 
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a tuple (value, weight),
+        in non-increasing weight order.
+
+        Matches are found as they are needed, so a caller that stops early
+        does not pay for the rest. This Autocompleter must not be changed
+        while the matches are being yielded.
+        """
+        yield from self.autocomplete(prefix)
+
+    def autocomplete_many(self, prefixes: List[List],
+                          limit: Optional[int] = None
+                          ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete with <limit> for each prefix in
+        <prefixes>, in the same order as <prefixes>.
+
+        Precondition: limit is None or limit > 0.
+        """
+        return [self.autocomplete(prefix, limit) for prefix in prefixes]
+
     def remove(self, prefix: List) -> None:
         """Remove all values that match the given prefix.
         """
         raise NotImplementedError
 
+    def count(self, prefix: List) -> int:
+        """Return the number of values that match the given prefix.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def from_items(cls, weight_type: str,
+                   items: Iterable[Tuple[Any, float, List]]) -> Autocompleter:
+        """Return a new Autocompleter of this class with the given
+        <weight_type>, storing every (value, weight, prefix) triple in <items>
+        as if they were inserted one at a time, in order.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        autocompleter = cls(weight_type)
+        autocompleter.insert_many(items)
+        return autocompleter
+
+    def insert_many(self, items: Iterable[Tuple[Any, float, List]]) -> None:
+        """Insert every (value, weight, prefix) triple in <items> into this
+        Autocompleter, as if insert were called on each of them in order.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        for value, weight, prefix in items:
+            self.insert(value, weight, prefix)
+
 
 ################################################################################
 # SimplePrefixTree (Tasks 1-3)
@@ -90,15 +163,56 @@ class SimplePrefixTree(Autocompleter):
     weight_type:
         A string representing the way to calculate the tree's weight.
 
+    === Private Attributes ===
+    _num:
+        The number of leaves in this tree.
+    _total:
+        The sum of the weights of the leaves in this tree.
+    _children:
+        A mapping from the next prefix token to the non-leaf subtree in
+        self.subtrees whose prefix continues with that token, or None if
+        this tree has too few subtrees to be worth indexing.
+    _value:
+        If this tree is a leaf, the value stored in it. Otherwise, the
+        prefix of this tree as a chain of (parent prefix, token) pairs that
+        ends in None, so that each tree only stores the token on the edge
+        leading to it. self.value is rebuilt from this chain when read.
+    _max:
+        The largest weight of a leaf in this tree, or 0.0 if it is empty.
+    _cache:
+        None if completions are not cached. Otherwise (for non-leaf trees),
+        the first _cache.size (value, weight) leaves of this tree in the
+        order autocomplete visits them: subtrees from heaviest to lightest.
+    _tombstones:
+        None, unless remove was called on this tree with tombstone=True and
+        compact has not been called since, in which case it records the
+        trees below this tree that are still to be compacted.
+
     === Representation invariants ===
     - self.weight >= 0
     - weight_type == 'sum' or weight_type == 'average'
+    - self._num == 0 if and only if this tree is empty
+    - self._total == the sum of the leaf weights in this tree
+    - self.weight == self._total if weight_type == 'sum', and
+      self.weight == self._total / self._num otherwise (for a non-empty tree)
+    - if self._children is not None, then self._children[x] is subtree if
+      and only if subtree is a non-leaf subtree in self.subtrees and
+      subtree.value[len(self.value)] == x
+    - self._children is None if len(self.subtrees) <= _INDEX_THRESHOLD
+      has always held
+    - if self._tombstones is None, then no tree below this tree has
+      self._num == 0 (*tombstone*); otherwise tombstones are skipped by
+      every search, and the trees above them may not be sorted yet
 
     - (EMPTY TREE):
-        If self.weight == 0, then self.value == [] and self.subtrees == [].
+        If self.weight == 0, then self.value == [] and self.subtrees == [],
+        where self.subtrees is a list of this tree's own, not _NO_SUBTREES.
         This represents an empty simple prefix tree.
     - (LEAF):
-        If self.subtrees == [] and self.weight > 0, this tree is a leaf.
+        This tree is a leaf if and only if self.subtrees is _NO_SUBTREES,
+        the read-only empty list shared by every leaf, and then
+        self.weight > 0. Every leaf must use _NO_SUBTREES: a tree whose
+        subtrees are any other empty list is not a leaf.
         (self.value is a value that was inserted into this tree.)
     - (NON-EMPTY, NON-LEAF):
         If len(self.subtrees) > 0, then self.value is a list (*common prefix*),
@@ -117,10 +231,19 @@ class SimplePrefixTree(Autocompleter):
       both can appear in the same self.subtrees list, and both have a `weight`
       attribute.
     """
+    __slots__ = ('_value', 'weight', 'weight_type', 'subtrees', '_num',
+                 '_total', '_children', '_max', '_cache', '_tombstones')
     value: Any
     weight: float
     weight_type: str
     subtrees: List[SimplePrefixTree]
+    _num: int
+    _total: float
+    _children: Dict[Any, SimplePrefixTree]
+    _value: Any
+    _max: float
+    _cache: Optional[_TopK]
+    _tombstones: Optional[_Tombstones]
 
     def __init__(self, weight_type: str) -> None:
         """Initialize an empty simple prefix tree.
@@ -131,18 +254,107 @@ class SimplePrefixTree(Autocompleter):
         of non-leaf trees should be calculated (see the assignment handout
         for details).
         """
-        self.value = []
+        self._value = None
         self.subtrees = []
         self.weight = 0.0
         self.weight_type = weight_type
+        self._num = 0
+        self._total = 0.0
+        self._children = None
+        self._max = 0.0
+        self._cache = None
+        self._tombstones = None
+
+    @property
+    def value(self) -> Any:
+        """The value stored in this leaf, or the prefix of this tree if it is
+        not a leaf.
+        """
+        if self.is_leaf():
+            return self._value
+        return self._unpack(self._value)
+
+    @value.setter
+    def value(self, value: Any) -> None:
+        """Set the value stored in this leaf, or the prefix of this tree."""
+        if isinstance(value, list) and not self.is_leaf():
+            self._value = self._pack(value)
+        else:
+            self._value = value
+
+    def _pack(self, prefix: List) -> Optional[tuple]:
+        """Return <prefix> as a chain of (parent prefix, token) pairs."""
+        cell = None
+        for token in prefix:
+            cell = (cell, token)
+        return cell
+
+    def _unpack(self, cell: Optional[tuple]) -> List:
+        """Return the prefix list for the chain <cell> built by _pack."""
+        prefix = []
+        while cell is not None:
+            prefix.append(cell[1])
+            cell = cell[0]
+        prefix.reverse()
+        return prefix
+
+    def _edge_length(self) -> int:
+        """Return the number of tokens on the edge leading to this tree."""
+        return 1
+
+    def _new_node(self) -> SimplePrefixTree:
+        """Return a new empty non-leaf tree to go below this tree, caching
+        completions if this tree does.
+        """
+        node = self.__class__(self.weight_type)
+        if self._cache is not None:
+            node._cache = _TopK(self._cache.size)
+        return node
+
+    def _first_token(self) -> Any:
+        """Return the first token on the edge leading to this non-leaf tree.
+        """
+        return self._value[1]
+
+    def _get_child(self, token: Any) -> Optional[SimplePrefixTree]:
+        """Return the non-leaf subtree whose edge starts with <token>, or None.
+        """
+        if self._children is not None:
+            return self._children.get(token)
+        for sub in self.subtrees:
+            if not sub.is_leaf() and sub._first_token() == token:
+                return sub
+        return None
+
+    def _set_child(self, token: Any, sub: SimplePrefixTree) -> None:
+        """Record <sub> as the non-leaf subtree whose edge starts with <token>.
+        """
+        if self._children is None:
+            if len(self.subtrees) < _INDEX_THRESHOLD:
+                return
+            self._children = {}
+            for other in self.subtrees:
+                if not other.is_leaf():
+                    self._children[other._first_token()] = other
+        self._children[token] = sub
+
+    def _del_child(self, token: Any) -> None:
+        """Forget the non-leaf subtree whose edge starts with <token>."""
+        if self._children is not None:
+            del self._children[token]
 
     def is_empty(self) -> bool:
         """Return whether this simple prefix tree is empty."""
         return self.weight == 0.0
 
     def is_leaf(self) -> bool:
-        """Return whether this simple prefix tree is a leaf."""
-        return self.weight > 0 and self.subtrees == []
+        """Return whether this simple prefix tree is a leaf.
+
+        Every leaf is made with _new_leaf, which gives it the shared
+        _NO_SUBTREES list, so leaves are told apart by that list alone,
+        whatever kind of value they store.
+        """
+        return self.subtrees is _NO_SUBTREES
 
     def __str__(self) -> str:
         """Return a string representation of this tree.
@@ -156,76 +368,518 @@ class SimplePrefixTree(Autocompleter):
 
         The indentation level is specified by the <depth> parameter.
         """
-        if self.is_empty():
-            return ''
-        else:
-            s = '  ' * depth + f'{self.value} ({self.weight})\n'
-            for subtree in self.subtrees:
-                s += subtree._str_indented(depth + 1)
-            return s
+        lines = []
+        stack = [(self, depth)]
+        while stack:
+            tree, depth = stack.pop()
+            if not tree.is_empty():
+                lines.append('  ' * depth + f'{tree.value} ({tree.weight})\n')
+                for subtree in reversed(tree.subtrees):
+                    stack.append((subtree, depth + 1))
+        return ''.join(lines)
 
     def __len__(self) -> int:
         """Return the number of values stored in this simple prefix tree.
         """
-        if self.is_empty():
+        return self._num
+
+    def count(self, prefix: List) -> int:
+        """Return the number of values that match the given prefix.
+        """
+        node = self._find(prefix, len(self.value))
+        if node is None:
             return 0
-        elif self.is_leaf():
-            return 1
-        else:
-            length = 0
-            for subtree in self.subtrees:
-                length += subtree.__len__()
-            return length
+        return node._num
 
     def insert(self, value: Any, weight: float, prefix: List) -> None:
         """Insert the given value into this Autocompleter.
         """
-        if self.value == prefix:
-            for sub in self.subtrees:
-                if sub.value == value:
-                    sub.weight += weight
-                    self._update_weight()
-                    return
-            new_node = SimplePrefixTree(self.weight_type)
-            new_node.value = value
-            new_node.weight = weight
-            self._insert_helper(new_node)
-            self._update_weight()
+        self.compact()
+        self._insert(value, weight, prefix, len(self.value))
+
+    def _insert(self, value: Any, weight: float, prefix: List,
+                depth: int) -> None:
+        """
+        Helper method for insert.
+        Insert <value> below this tree, whose prefix is prefix[:depth].
+        """
+        path = []
+        tree = self
+        while depth < len(prefix):
+            sub, depth, is_new = tree._insert_step(prefix, depth)
+            path.append((tree, sub, is_new))
+            tree = sub
+        added = tree._insert_leaf(value, weight)
+
+        for tree, sub, is_new in reversed(path):
+            if not is_new:
+                tree.subtrees.remove(sub)
+            tree._insert_helper(sub)
+            tree._add_leaf_weight(added, weight)
+            tree._refresh_cache()
+
+    def _insert_step(self, prefix: List,
+                     depth: int) -> Tuple[SimplePrefixTree, int, bool]:
+        """
+        Helper method for insert.
+        Return the subtree that prefix[depth:] continues into, creating it if
+        there is none, as a tuple (subtree, subtree depth, is new), where
+        "is new" is True if subtree is not in self.subtrees yet.
+        Precondition: this tree's prefix is prefix[:depth], and
+                      depth < len(prefix)
+        """
+        sub = self._get_child(prefix[depth])
+        if sub is not None:
+            return sub, depth + 1, False
+        new_node = self._new_node()
+        new_node._value = (self._value, prefix[depth])
+        self._set_child(prefix[depth], new_node)
+        return new_node, depth + 1, True
+
+    def _insert_leaf(self, value: Any, weight: float) -> int:
+        """
+        Helper method for insert.
+        Add <weight> to the leaf storing <value> in self.subtrees, or add a
+        new leaf if there is none, and return the number of leaves added.
+        Precondition: self.value is the prefix that <value> was inserted with.
+        """
+        leaf, added = self._add_to_leaf(value, weight)
+        self.subtrees.remove(leaf)
+        self._insert_helper(leaf)
+        self._add_leaf_weight(added, weight)
+        self._refresh_cache()
+        return added
+
+    def _add_to_leaf(self, value: Any,
+                     weight: float) -> Tuple[SimplePrefixTree, int]:
+        """
+        Helper method for insert.
+        Add <weight> to the leaf storing <value> in self.subtrees, or append
+        a new leaf if there is none, without sorting self.subtrees or
+        updating the aggregates of this tree. Return the leaf and the number
+        of leaves added.
+
+        An existing leaf is replaced by a new, heavier leaf rather than
+        changed, so that insert only changes the trees on its path.
+        """
+        for i, sub in enumerate(self.subtrees):
+            if sub.is_leaf() and sub.value == value:
+                leaf = self._new_leaf(sub._value, sub.weight + weight)
+                self.subtrees[i] = leaf
+                return leaf, 0
+        leaf = self._new_leaf(value, weight)
+        self.subtrees.append(leaf)
+        return leaf, 1
+
+    def insert_many(self, items: Iterable[Tuple[Any, float, List]]) -> None:
+        """Insert every (value, weight, prefix) triple in <items> into this
+        tree, as if insert were called on each of them in order.
+
+        The leaf counts and totals on each path are updated as the triples
+        are inserted, but each tree whose subtrees changed only has its
+        weight updated and its subtrees sorted once, at the end.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        self.compact()
+        # The position of the last triple inserted below each subtree that
+        # was touched, and each tree whose subtrees need sorting, with the
+        # length of its prefix.
+        touched = {}
+        dirty = {}
+        start = len(self.value)
+        for i, (value, weight, prefix) in enumerate(items):
+            path = [self]
+            depth = start
+            while depth < len(prefix):
+                dirty[path[-1]] = depth
+                old = path[-1]._get_child(prefix[depth])
+                sub, depth, is_new = path[-1]._insert_step(prefix, depth)
+                if is_new:
+                    path[-1].subtrees.append(sub)
+                    if old is not None:
+                        # A compressed edge was split, and the tree below
+                        # the split replaced by a copy, which takes over
+                        # what has been recorded for the tree.
+                        _replace_key(dirty, old, sub.subtrees[0])
+                        _replace_key(touched, old, sub.subtrees[0])
+                touched[sub] = i
+                path.append(sub)
+            dirty[path[-1]] = depth
+            leaf, added = path[-1]._add_to_leaf(value, weight)
+            touched[leaf] = i
+            for tree in path:
+                tree._num += added
+                tree._total += weight
+                if leaf._max > tree._max:
+                    tree._max = leaf._max
+
+        # Subtrees are finished before the trees above them, so that their
+        # weights are up to date when the trees above them are sorted.
+        for tree in sorted(dirty, key=lambda tree: dirty[tree], reverse=True):
+            tree._update_weight()
+            tree._sort_touched(touched)
+            tree._refresh_cache()
+
+    def _sort_touched(self, touched: Dict[SimplePrefixTree, int]) -> None:
+        """
+        Helper method for insert_many.
+        Sort self.subtrees as a series of inserts would have: a subtree is
+        moved after all other subtrees at least as heavy whenever a value is
+        inserted below it. <touched> maps each subtree that had a value
+        inserted below it to the position of the last such value.
+        Precondition: self.subtrees was sorted before those inserts.
+        """
+        untouched = [sub for sub in self.subtrees if sub not in touched]
+        moved = [sub for sub in self.subtrees if sub in touched]
+        moved.sort(key=lambda sub: touched[sub])
+        self.subtrees[:] = untouched + moved
+        self.subtrees.sort(key=lambda sub: sub.weight, reverse=True)
+
+    def _new_leaf(self, value: Any, weight: float) -> SimplePrefixTree:
+        """Return a new leaf storing <value> with the given <weight>.
+
+        Leaves share one read-only empty subtrees list.
+        """
+        leaf = self.__class__(self.weight_type)
+        leaf.subtrees = _NO_SUBTREES
+        leaf._value = value
+        leaf.weight = weight
+        leaf._num = 1
+        leaf._total = weight
+        leaf._max = weight
+        return leaf
+
+    def _copy(self) -> SimplePrefixTree:
+        """Return a copy of this tree with its own subtrees list and index,
+        sharing its subtrees, so that the copy can be changed without
+        changing this tree.
+        """
+        tree = object.__new__(self.__class__)
+        tree._value = self._value
+        tree.weight = self.weight
+        tree.weight_type = self.weight_type
+        if self.is_leaf():
+            tree.subtrees = _NO_SUBTREES
         else:
-            for sub in self.subtrees:
-                if sub.value == prefix[:len(sub.value)]:
-                    sub.insert(value, weight, prefix)
-                    self._update_weight()
-                    self.subtrees.remove(sub)
-                    self._insert_helper(sub)
-                    return
-            new_node = SimplePrefixTree(self.weight_type)
-            new_node.weight = weight
-            new_node.value = prefix[:len(self.value) + 1]
-            new_node.insert(value, weight, prefix)
-            self._insert_helper(new_node)
+            tree.subtrees = list(self.subtrees)
+        tree._num = self._num
+        tree._total = self._total
+        if self._children is None:
+            tree._children = None
+        else:
+            tree._children = dict(self._children)
+        tree._max = self._max
+        tree._cache = self._cache
+        tree._tombstones = self._tombstones
+        return tree
+
+    def _copy_path(self, prefix: List,
+                   copies: Set[SimplePrefixTree]) -> None:
+        """
+        Helper method for CopyOnWritePrefixTree.
+        Replace each subtree on the path below this tree towards <prefix>
+        that is not in <copies> with a copy of it, and add the copies to
+        <copies>, so that insert or remove with <prefix> changes no tree
+        outside of <copies>.
+        Precondition: this tree is in <copies>, and has no tombstones.
+        """
+        tree = self
+        depth = len(self.value)
+        while depth < len(prefix):
+            sub = tree._child_for(prefix, depth)
+            if sub is None:
+                return
+            if sub not in copies:
+                copy = sub._copy()
+                copies.add(copy)
+                tree.subtrees[tree.subtrees.index(sub)] = copy
+                if tree._children is not None:
+                    tree._children[prefix[depth]] = copy
+                sub = copy
+            depth += sub._edge_length()
+            tree = sub
+
+    @classmethod
+    def from_items(cls, weight_type: str,
+                   items: Iterable[Tuple[Any, float, List]]
+                   ) -> SimplePrefixTree:
+        """Return a new tree of this class with the given <weight_type>,
+        storing every (value, weight, prefix) triple in <items>.
+
+        The result is the same tree that inserting the triples one at a time,
+        in order, would give, but it is built bottom-up in a single pass over
+        the triples sorted by prefix: every subtree is finished, aggregated
+        and sorted once, when the sorted prefixes move past it.
+
+        Precondition: every triple satisfies the preconditions of insert,
+                      and the tokens of all prefixes can be compared.
+        """
+        # None of the trees built here are garbage, so running the cycle
+        # collector while they are built only slows the build down.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return cls._build_from_items(weight_type, list(items))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    @classmethod
+    def _build_from_items(cls, weight_type: str,
+                          items: List[Tuple[Any, float, List]]
+                          ) -> SimplePrefixTree:
+        """
+        Helper method for from_items.
+        Return a new tree storing the triples in <items>, visiting them
+        in order of prefix.
+        """
+        root = cls(weight_type)
+        # The open trees on the path to the previous prefix, as tuples
+        # (tree, depth at the start of its edge, depth at its end, finished
+        # subtrees). Each finished subtree is paired with the position in
+        # <items> of the last triple below it, since equally heavy subtrees
+        # end up in the order they were last inserted into.
+        path = [(root, 0, 0, [])]
+        last = []
+        for i in sorted(range(len(items)), key=lambda j: items[j][2]):
+            value, weight, prefix = items[i]
+            shared = 0
+            while shared < min(len(last), len(prefix)) and \
+                    last[shared] == prefix[shared]:
+                shared += 1
+
+            while path[-1][1] >= shared and len(path) > 1:
+                tree, _, _, subtrees = path.pop()
+                path[-1][3].append(tree._build(subtrees))
+            tree, start, end, subtrees = path[-1]
+            if end > shared:
+                # The open tree's edge runs past the shared prefix, so it
+                # is split there, and the lower part is finished. As in
+                # insert, the subtrees of the lower part keep the old chain.
+                edge = tree._value[1]
+                lower = cls(weight_type)
+                tree._value = (tree._value[0], edge[:shared - start])
+                lower._value = (tree._value, edge[shared - start:])
+                path[-1] = (tree, start, shared, [lower._build(subtrees)])
+
+            for edge, end in root._build_edges(prefix, shared):
+                new_node = cls(weight_type)
+                new_node._value = (path[-1][0]._value, edge)
+                path.append((new_node, shared, end, []))
+                shared = end
+            path[-1][0]._build_leaf(value, weight, i, path[-1][3])
+            last = prefix
+
+        while len(path) > 1:
+            tree, _, _, subtrees = path.pop()
+            path[-1][3].append(tree._build(subtrees))
+        if path[0][3] != []:
+            root._build(path[0][3])
+        return root
+
+    @classmethod
+    def from_items_parallel(cls, weight_type: str,
+                            items: Iterable[Tuple[Any, float, List]],
+                            workers: Optional[int] = None
+                            ) -> SimplePrefixTree:
+        """Return the same tree as from_items, building the subtrees for
+        different first prefix tokens at the same time, in up to <workers>
+        processes, or one for each CPU if <workers> is None.
+
+        The triples are split by the first token of their prefix into
+        parts of about the same size, and each process builds the tree for
+        one part with from_items and sends back a snapshot of it. The
+        subtrees of those trees are then put under one root, which is
+        sorted and aggregated as from_items would.
+
+        Precondition: every triple satisfies the preconditions of insert,
+                      the tokens of all prefixes can be compared and
+                      hashed, and the tokens and values can be pickled.
+        """
+        items = list(items)
+        # The positions in <items> of the triples with each first token.
+        groups = {}
+        for i, (_, _, prefix) in enumerate(items):
+            if len(prefix) > 0:
+                groups.setdefault(prefix[0], []).append(i)
+        parts = [[] for _ in range(min(workers or os.cpu_count() or 1,
+                                       len(groups)))]
+        if len(parts) < 2:
+            return cls.from_items(weight_type, items)
+        # The largest groups are placed first, each in the smallest part.
+        for group in sorted(groups.values(), key=len, reverse=True):
+            min(parts, key=len).extend(group)
+
+        with ProcessPoolExecutor(len(parts)) as executor:
+            snapshots = executor.map(
+                _build_snapshot, [cls] * len(parts),
+                [weight_type] * len(parts),
+                [[items[i] for i in sorted(part)] for part in parts])
+            snapshots = list(snapshots)
+
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            root = cls(weight_type)
+            # As in from_items, each subtree of the root is paired with the
+            # position of the last triple below it.
+            subtrees = []
+            for header, columns in snapshots:
+                _, _, values, weights, edges = header
+                part = cls._from_snapshot(weight_type, values, weights,
+                                          edges, columns)
+                for sub in part.subtrees:
+                    subtrees.append([groups[sub._first_token()][-1], sub])
+            for i, (value, weight, prefix) in enumerate(items):
+                if len(prefix) == 0:
+                    root._build_leaf(value, weight, i, subtrees)
+            root._build(subtrees)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return root
+
+    def _build_edges(self, prefix: List, depth: int) -> List[Tuple[Any, int]]:
+        """
+        Helper method for from_items.
+        Return the edges of the new trees needed below the tree for
+        prefix[:depth] to reach the tree for <prefix>, each paired with the
+        length of the prefix at the end of the edge.
+        """
+        return [(prefix[i], i + 1) for i in range(depth, len(prefix))]
+
+    def _build_leaf(self, value: Any, weight: float, i: int,
+                    subtrees: List[List]) -> None:
+        """
+        Helper method for from_items.
+        Add <weight> to the leaf storing <value> in <subtrees>, the finished
+        subtrees of this tree, or add a new leaf if there is none. <i> is
+        the position of the triple being added.
+        """
+        for pair in subtrees:
+            if pair[1].is_leaf() and pair[1].value == value:
+                pair[0] = i
+                pair[1].weight += weight
+                pair[1]._total += weight
+                pair[1]._max = pair[1].weight
+                return
+        subtrees.append([i, self._new_leaf(value, weight)])
+
+    def _build(self, subtrees: List[List]) -> List:
+        """
+        Helper method for from_items.
+        Make <subtrees>, a list of [last position, subtree] pairs, the
+        subtrees of this tree in sorted order, and set its aggregates.
+        Return the [last position, tree] pair for this tree.
+        """
+        if len(subtrees) == 1:
+            # Most trees below a long prefix have just one subtree.
+            pair = subtrees[0]
+            sub = pair[1]
+            self.subtrees.append(sub)
+            self._num = sub._num
+            self._total += sub._total
+            self._max = sub._max
             self._update_weight()
+            pair[1] = self
+            return pair
+
+        subtrees.sort(key=lambda pair: (-pair[1].weight, pair[0]))
+        self.subtrees.extend(pair[1] for pair in subtrees)
+        for sub in self.subtrees:
+            self._num += sub._num
+            self._total += sub._total
+            if sub._max > self._max:
+                self._max = sub._max
+        self._update_weight()
+        if len(self.subtrees) > _INDEX_THRESHOLD:
+            self._children = {}
+            for sub in self.subtrees:
+                if not sub.is_leaf():
+                    self._children[sub._first_token()] = sub
+        return [max(pair[0] for pair in subtrees), self]
 
     def _insert_helper(self, new_node: SimplePrefixTree) -> None:
         """
         Heper method for insert.
-        Inserts the new_node into the correct position
+        Inserts the new_node into the correct position, after any subtrees
+        that have the same weight.
         """
+        if new_node._max > self._max:
+            self._max = new_node._max
         for i, subtree in enumerate(self.subtrees):
-            if subtree.weight <= new_node.weight:
+            if subtree.weight < new_node.weight:
                 self.subtrees.insert(i, new_node)
                 return
         self.subtrees.append(new_node)
 
+    def _refresh_cache(self) -> None:
+        """
+        Rebuild the cached completions of this tree from those of its
+        subtrees, if completions are cached.
+        Precondition: the caches of all non-leaf subtrees are up to date.
+        """
+        if self._cache is None:
+            return
+        cache = _TopK(self._cache.size)
+        for sub in self.subtrees:
+            if len(cache) >= cache.size:
+                break
+            elif sub._num == 0:
+                continue
+            elif sub.is_leaf():
+                cache.append((sub.value, sub.weight))
+            else:
+                cache.extend(sub._cache[:cache.size - len(cache)])
+        self._cache = cache
+
+    def set_cache_size(self, size: int) -> None:
+        """Cache the first <size> completions of every non-leaf tree in this
+        tree, so that autocomplete with a limit of at most <size> only needs
+        to find the tree for its prefix. A <size> of 0 turns caching off.
+
+        The caches are kept up to date by insert and remove.
+        """
+        self.compact()
+        trees = []
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if not tree.is_leaf():
+                trees.append(tree)
+                stack.extend(tree.subtrees)
+        # Every tree comes after its subtrees in reversed(trees).
+        for tree in reversed(trees):
+            if size == 0:
+                tree._cache = None
+            else:
+                tree._cache = _TopK(size)
+                tree._refresh_cache()
+
+    def _add_leaf_weight(self, num: int, weight: float) -> None:
+        """
+        Add <num> leaves with a total weight of <weight> to the aggregates
+        of this tree, and update its weight. <num> and <weight> may be
+        negative when leaves have been removed.
+        """
+        self._num += num
+        if self._num == 0:
+            self._total = 0.0
+        else:
+            self._total += weight
+        self._update_weight()
+
     def _update_weight(self) -> float:
         """
-        Update the weight of the tree itself after insertion.
+        Update the weight of the tree itself from its stored aggregates.
         """
-        num, weight = self._get_weight()
-        if self.weight_type == "sum":
-            self.weight = weight
+        if self._num == 0:
+            self.weight = 0.0
+        elif self.weight_type == "sum":
+            self.weight = self._total
         else:
-            self.weight = weight / num
+            self.weight = self._total / self._num
         return self.weight
 
     def _get_weight(self) -> Tuple[int, float]:
@@ -234,19 +888,39 @@ class SimplePrefixTree(Autocompleter):
         Returns in format (a, b) where
         a is the number of leaves in this tree and b is their total weight.
         """
-        if self.is_leaf():
-            return 1, self.weight
-        else:
-            num = 0
-            weight = 0.0
-            for subtree in self.subtrees:
-                d = subtree._get_weight()
-                num += d[0]
-                weight += d[1]
-            return num, weight
+        return self._num, self._total
 
-    def autocomplete(self, prefix: List,
-                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+    def _child_for(self, prefix: List,
+                   depth: int) -> Optional[SimplePrefixTree]:
+        """
+        Return the subtree of this tree whose prefix agrees with <prefix>
+        on the next token, or None if there is no such subtree or it is a
+        tombstone.
+        Precondition: this tree's prefix is prefix[:depth], and
+                      depth < len(prefix)
+        """
+        sub = self._get_child(prefix[depth])
+        if sub is None or sub._num == 0:
+            return None
+        return sub
+
+    def _find(self, prefix: List, depth: int) -> Optional[SimplePrefixTree]:
+        """
+        Return the highest subtree of this tree whose values all match
+        <prefix>, or None if no value in this tree matches <prefix>.
+        Precondition: this tree's prefix agrees with <prefix> on its first
+                      <depth> tokens, and <depth> is the length of that prefix.
+        """
+        tree = self
+        while depth < len(prefix):
+            tree = tree._child_for(prefix, depth)
+            if tree is None:
+                return None
+            depth += tree._edge_length()
+        return tree
+
+    def autocomplete(self, prefix: List, limit: Optional[int] = None,
+                     exact: bool = False) -> List[Tuple[Any, float]]:
         """Return up to <limit> matches for the given prefix.
 
         The return value is a list of tuples (value, weight), and must be
@@ -254,73 +928,606 @@ class SimplePrefixTree(Autocompleter):
 
         If limit is None, return *every* match for the given prefix.
 
+        By default, subtrees are visited from heaviest to lightest until
+        <limit> values are found, so the values returned are not always
+        the <limit> heaviest matches. If <exact> is True, the <limit>
+        heaviest matches are returned instead.
+
         Precondition: limit is None or limit > 0.
         """
 
         if limit is not None and limit <= 0:
             return []
 
+        node = self._find(prefix, len(self.value))
+        if node is None:
+            return []
+        return node._matches(limit, exact)
+
+    def _matches(self, limit: Optional[int],
+                 exact: bool) -> List[Tuple[Any, float]]:
+        """
+        Helper method for autocomplete and autocomplete_many.
+        Return up to <limit> values in this tree, as autocomplete does for
+        the prefix of this tree, with <exact>.
+        """
+        if exact:
+            return list(islice(self._best_first(), limit))
+        elif limit is not None and self._cache is not None and \
+                limit <= self._cache.size:
+            return sorted(self._cache[:limit], key=lambda item: item[1],
+                          reverse=True)
+        return self._collect(limit)
+
+    def autocomplete_many(self, prefixes: List[List],
+                          limit: Optional[int] = None, exact: bool = False
+                          ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete with <limit> and <exact> for
+        each prefix in <prefixes>, in the same order as <prefixes>.
+
+        The prefixes are taken in sorted order, and the subtrees on the way
+        to the last prefix are kept, so the descent to the part a prefix
+        shares with the one before it is not made again. For every prefix
+        of a word, the tree is descended once in all.
+
+        Precondition: limit is None or limit > 0, and the tokens of the
+                      prefixes can be compared with each other using <.
+        """
+        if limit is not None and limit <= 0:
+            return [[] for _ in prefixes]
+
+        answers = [[] for _ in prefixes]
+        # Each subtree on the way to the last prefix, with the length of its
+        # prefix, from this tree down.
+        path = [(len(self.value), self)]
+        previous = None
+        for i in sorted(range(len(prefixes)), key=prefixes.__getitem__):
+            prefix = prefixes[i]
+            if previous is not None and prefix == prefixes[previous]:
+                answers[i] = list(answers[previous])
+                continue
+            elif previous is not None:
+                shared = _shared_length(prefix, prefixes[previous])
+                while len(path) > 1 and path[-1][0] > shared:
+                    path.pop()
+            previous = i
+            depth, tree = path[-1]
+            while depth < len(prefix):
+                tree = tree._child_for(prefix, depth)
+                if tree is None:
+                    break
+                depth += tree._edge_length()
+                path.append((depth, tree))
+            if tree is not None:
+                answers[i] = tree._matches(limit, exact)
+        return answers
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a tuple (value, weight),
+        in non-increasing weight order.
+
+        Matches are found as they are needed, so a caller that stops early
+        does not pay for the rest. This tree must not be changed while the
+        matches are being yielded.
+        """
+        node = self._find(prefix, len(self.value))
+        if node is not None:
+            yield from node._best_first()
+
+    def _best_first(self) -> Iterator[Tuple[Any, float]]:
+        """
+        Helper for autocomplete and iter_autocomplete.
+        Yield the values in this tree as (value, weight) tuples in
+        non-increasing weight order.
+
+        Subtrees are explored in order of their largest leaf weight, so a
+        leaf is only reached once no unexplored leaf can be heavier, and
+        nothing more is explored than is needed for the values yielded.
+        """
+        # Ties go to the most recently pushed subtree, so that equally heavy
+        # subtrees are searched depth-first, in the order of self.subtrees.
+        order = count(0, -1)
+        heap = [(-self._max, next(order), self)]
+        while heap:
+            tree = heapq.heappop(heap)[2]
+            if tree.is_leaf():
+                yield tree.value, tree.weight
+            else:
+                for sub in reversed(tree.subtrees):
+                    if sub._num > 0:
+                        heapq.heappush(heap, (-sub._max, next(order), sub))
+
+    def _collect(self, limit: Optional[int]) -> List[Tuple[Any, float]]:
+        """
+        Helper for autocomplete.
+        Return up to <limit> values in this tree, taking subtrees in order,
+        as a list of (value, weight) tuples in non-increasing weight order.
+        """
         autocompleted = []
-        if self.is_leaf():
-            autocompleted.append((self.value, self.weight))
-        elif len(self.value) >= len(prefix):
-            if self.value[:len(prefix)] == prefix:
-                for sub in self.subtrees:
-                    temp = sub.autocomplete(prefix, limit)
-                    autocompleted = _merge(autocompleted, temp)
-                    if limit is not None:
-                        limit -= len(temp)
-        else:
-            if self.value == prefix[:len(self.value)]:
-                for sub in self.subtrees:
-                    if sub.value == prefix[:len(sub.value)]:
-                        autocompleted += sub.autocomplete(prefix, limit)
-                        break
+        stack = [self]
+        while stack and (limit is None or len(autocompleted) < limit):
+            tree = stack.pop()
+            if tree._num == 0:
+                continue
+            elif tree.is_leaf():
+                autocompleted.append((tree.value, tree.weight))
+            else:
+                stack.extend(reversed(tree.subtrees))
+        # A stable sort keeps equally heavy values in the order visited.
+        autocompleted.sort(key=lambda item: item[1], reverse=True)
         return autocompleted
 
-    def remove(self, prefix: List) -> None:
+    def remove(self, prefix: List, tombstone: bool = False) -> None:
         """
         Remove all nodes that could be autocompleted from this prefix
+
+        If <tombstone> is True, the tree for <prefix> is only marked as
+        removed, and the aggregates above it are updated, so that searches
+        skip it straight away. Taking it out of the tree, and re-sorting and
+        compressing the trees above it, is left for compact, so that many
+        removals can be done quickly and cleaned up together later. Until
+        then, autocomplete may visit subtrees in their order from before
+        the removal. Other changes to this tree call compact first.
         """
-        for sub in self.subtrees:
-            if sub.value == prefix:
-                self.subtrees.remove(sub)
-            elif sub.value == prefix[:len(sub.value)]:
-                sub.remove(prefix)
-                if sub.subtrees == []:
-                    self.subtrees.remove(sub)
-
-        if self.subtrees == []:
-            self.weight = 0.0
+        if tombstone:
+            self._tombstone(prefix, len(self.value))
         else:
-            num, weight = self._get_weight()
-            if self.weight_type == "sum":
-                self.weight = weight
+            self.compact()
+            self._remove(prefix, len(self.value))
+
+    def _remove(self, prefix: List, depth: int) -> None:
+        """
+        Helper method for remove.
+        Remove all values matching <prefix> below this tree, whose prefix
+        has length <depth>.
+        """
+        path = []
+        tree = self
+        while depth < len(prefix):
+            sub = tree._child_for(prefix, depth)
+            if sub is None:
+                return
+            path.append((tree, sub, prefix[depth]))
+            depth += sub._edge_length()
+            tree = sub
+
+        if path == []:
+            self.subtrees = []
+            self._children = None
+            self._max = 0.0
+            self._add_leaf_weight(-self._num, -self._total)
+            self._refresh_cache()
+            return
+        num, total = tree._num, tree._total
+        detach = True
+        for tree, sub, token in reversed(path):
+            tree.subtrees.remove(sub)
+            if detach:
+                tree._del_child(token)
+            else:
+                tree._insert_helper(tree._merge_child(sub, token))
+            tree._add_leaf_weight(-num, -total)
+            tree._max = max((other._max for other in tree.subtrees),
+                            default=0.0)
+            tree._refresh_cache()
+            detach = tree.is_empty()
+
+    def save(self, path: str) -> None:
+        """Write this tree to a snapshot file at <path>, which load can read
+        back.
+
+        The snapshot holds the shape of this tree and its aggregates in flat
+        arrays, in preorder, so it is written and read without recursion.
+        The values and edge tokens themselves are stored with pickle, and so
+        must be picklable.
+        """
+        self.compact()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            header, columns = self._snapshot()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        _write_snapshot(path, self, header, columns)
+
+    def _snapshot(self) -> Tuple[tuple, List[array]]:
+        """
+        Helper method for save.
+        Return the header and the node columns of a snapshot of this tree.
+        """
+        # For each leaf in preorder: its value and weight.
+        values = []
+        weights = []
+        # For each non-root, non-leaf tree in preorder: its edge, as stored
+        # in the second item of its _value.
+        edges = []
+        # For each tree in preorder: the position of its parent, and whether
+        # it is a leaf.
+        parents = array('i')
+        leaves = array('b')
+        # For each non-leaf tree in preorder: its aggregates.
+        nums = array('i')
+        totals = array('d')
+        maxes = array('d')
+        # The positions of the trees with an index of their subtrees.
+        indexed = array('i')
+
+        stack = [(self, -1)]
+        while stack:
+            tree, parent = stack.pop()
+            parents.append(parent)
+            if tree.is_leaf():
+                leaves.append(1)
+                values.append(tree._value)
+                weights.append(tree.weight)
+                continue
+            leaves.append(0)
+            if tree is not self:
+                edges.append(tree._value[1])
+            nums.append(tree._num)
+            totals.append(tree._total)
+            maxes.append(tree._max)
+            i = len(parents) - 1
+            if tree._children is not None:
+                indexed.append(i)
+            for sub in reversed(tree.subtrees):
+                stack.append((sub, i))
+
+        cache_size = 0 if self._cache is None else self._cache.size
+        header = (self.weight_type, cache_size, values, weights, edges)
+        return header, [parents, leaves, nums, totals, maxes, indexed]
+
+    @classmethod
+    def load(cls, path: str) -> SimplePrefixTree:
+        """Return the tree stored in the snapshot file at <path>, which
+        must have been written by save on a tree of this class.
+
+        Raise ValueError if <path> is not such a snapshot.
+        """
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            header, columns = _read_snapshot(path, cls, 'ibiddi')
+            weight_type, cache_size, values, weights, edges = header
+            tree = cls._from_snapshot(weight_type, values, weights, edges,
+                                      columns)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        if cache_size > 0:
+            tree.set_cache_size(cache_size)
+        return tree
+
+    @classmethod
+    def _from_snapshot(cls, weight_type: str, values: List, weights: List,
+                       edges: List, columns: List[array]) -> SimplePrefixTree:
+        """
+        Helper method for load.
+        Return the tree described by the snapshot columns <columns>, with
+        the given leaf values, leaf weights and edges.
+        """
+        parents, is_leaf, nums, totals, maxes, indexed = columns
+        root = cls(weight_type)
+        root._num = nums[0]
+        root._total = totals[0]
+        root._max = maxes[0]
+        root._update_weight()
+        trees = [root]
+        add_tree = trees.append
+        new_tree = object.__new__
+        is_sum = weight_type == 'sum'
+        leaves = zip(values, weights)
+        internals = zip(edges, nums[1:], totals[1:], maxes[1:])
+
+        # Every slot is set here directly rather than through __init__,
+        # since this loop runs once per node of the tree.
+        for parent, leaf in zip(islice(parents, 1, None),
+                                islice(is_leaf, 1, None)):
+            tree = new_tree(cls)
+            tree.weight_type = weight_type
+            tree._children = None
+            tree._cache = None
+            tree._tombstones = None
+            if leaf:
+                value, weight = next(leaves)
+                tree._value = value
+                tree.subtrees = _NO_SUBTREES
+                tree.weight = tree._total = tree._max = weight
+                tree._num = 1
+            else:
+                edge, num, total, max_weight = next(internals)
+                tree._value = (trees[parent]._value, edge)
+                tree.subtrees = []
+                tree._num = num
+                tree._total = total
+                tree._max = max_weight
+                tree.weight = total if is_sum else total / num
+            trees[parent].subtrees.append(tree)
+            add_tree(tree)
+
+        for i in indexed:
+            tree = trees[i]
+            tree._children = {sub._first_token(): sub
+                              for sub in tree.subtrees if not sub.is_leaf()}
+        return root
+
+    def freeze(self, path: str) -> FrozenPrefixTree:
+        """Write this tree to a frozen file at <path>, and return the
+        read-only FrozenPrefixTree that answers queries straight from it.
+
+        The frozen file holds the tree in flat arrays that are queried in
+        place, so it can be opened by any number of processes at almost no
+        cost. The values and tokens are stored with pickle, and so must be
+        picklable.
+        """
+        from frozen_prefix_tree import FrozenPrefixTree, _COLUMNS, \
+            _write_frozen
+
+        self.compact()
+        tokens = {}
+        values = []
+        columns = {name: array(typecode) for name, typecode in _COLUMNS}
+        # Trees are numbered in breadth-first order, so that the subtrees of
+        # each tree get consecutive numbers.
+        trees = [self]
+        i = 0
+        while i < len(trees):
+            tree = trees[i]
+            columns['first'].append(len(trees))
+            columns['edge'].append(len(columns['edge_tokens']))
+            columns['index'].append(len(columns['keys']))
+            columns['num'].append(tree._num)
+            columns['total'].append(tree._total)
+            columns['max'].append(tree._max)
+            if tree.is_leaf():
+                columns['value'].append(len(values))
+                values.append(pickle.dumps(tree._value,
+                                           pickle.HIGHEST_PROTOCOL))
             else:
-                self.weight = weight / num
+                columns['value'].append(-1)
+                if tree is not self:
+                    for token in tree._unpack((None, tree._value[1])):
+                        columns['edge_tokens'].append(
+                            tokens.setdefault(token, len(tokens)))
+                keys = []
+                for j, sub in enumerate(tree.subtrees):
+                    if not sub.is_leaf():
+                        token = tokens.setdefault(sub._first_token(),
+                                                  len(tokens))
+                        keys.append((token, len(trees) + j))
+                keys.sort()
+                for token, j in keys:
+                    columns['keys'].append(token)
+                    columns['key_nodes'].append(j)
+                trees.extend(tree.subtrees)
+            i += 1
+        columns['first'].append(len(trees))
+        columns['edge'].append(len(columns['edge_tokens']))
+        columns['index'].append(len(columns['keys']))
+
+        _write_frozen(path, self.weight_type, list(tokens), columns, values)
+        return FrozenPrefixTree(path)
 
+    def _merge_child(self, sub: SimplePrefixTree,
+                     token: Any) -> SimplePrefixTree:
+        """
+        Helper method for remove.
+        Return the subtree to keep in place of <sub>, the non-leaf subtree
+        of this tree whose edge starts with <token>, after values have been
+        removed from <sub>.
+        """
+        return sub
 
-def _merge(lst1: List, lst2: List) -> List:
+    def _tombstone(self, prefix: List, depth: int) -> None:
+        """
+        Helper method for remove.
+        Mark the tree for <prefix> below this tree, whose prefix has length
+        <depth>, as a tombstone, and update the aggregates above it.
+        """
+        path = []
+        tree = self
+        while depth < len(prefix):
+            sub = tree._child_for(prefix, depth)
+            if sub is None:
+                return
+            path.append((tree, depth, sub))
+            depth += sub._edge_length()
+            tree = sub
+        if path == []:
+            self._tombstones = None
+            self._remove(prefix, depth)
+            return
+
+        if self._tombstones is None:
+            self._tombstones = _Tombstones()
+        tombstones = self._tombstones
+        num, total = tree._num, tree._total
+        tree._add_leaf_weight(-num, -total)
+        for tree, depth, sub in reversed(path):
+            tree._add_leaf_weight(-num, -total)
+            tombstones.dirty[tree] = depth
+            tombstones.touched[sub] = tombstones.count
+            tree._refresh_cache()
+        tombstones.count += 1
+
+    def compact(self) -> None:
+        """Finish every removal made with tombstone=True on this tree since
+        the last call to compact.
+
+        Afterwards, this tree is the same as if those removals had not used
+        tombstones.
+        """
+        tombstones = self._tombstones
+        if tombstones is None:
+            return
+        self._tombstones = None
+        # Subtrees are finished before the trees above them.
+        for tree in sorted(tombstones.dirty, key=lambda tree:
+                           tombstones.dirty[tree], reverse=True):
+            if tree._num == 0 and tree is not self:
+                continue
+            for sub in [sub for sub in tree.subtrees if sub._num == 0]:
+                tree.subtrees.remove(sub)
+                tree._del_child(sub._first_token())
+            tree._sort_touched(tombstones.touched)
+            for i, sub in enumerate(tree.subtrees):
+                if sub in tombstones.touched and not sub.is_leaf():
+                    tree.subtrees[i] = tree._merge_child(
+                        sub, sub._first_token())
+            tree._max = max((sub._max for sub in tree.subtrees),
+                            default=0.0)
+            if tree._num == 0:
+                tree._children = None
+            tree._refresh_cache()
+
+
+def _replace_key(mapping: Dict, old: Any, new: Any) -> None:
+    """Move the entry for <old> in <mapping>, if there is one, to <new>."""
+    if old in mapping:
+        mapping[new] = mapping.pop(old)
+
+
+def _shared_length(prefix: List, other: List) -> int:
+    """Return the number of tokens at the start of <prefix> and <other> that
+    are the same.
     """
-    Merges two lists of tuples into one list in non-increasing order.
-    Precondition:
-        lst1 and lst2 are lists of tuples sorted in non-increasing order.
+    length = 0
+    end = min(len(prefix), len(other))
+    while length < end and prefix[length] == other[length]:
+        length += 1
+    return length
+
+
+def _build_snapshot(cls: type, weight_type: str,
+                    items: List[Tuple[Any, float, List]]
+                    ) -> Tuple[tuple, List[array]]:
+    """Return the header and node columns of a snapshot of the tree of
+    class <cls> with the given <weight_type> storing the triples in <items>.
+
+    This is run by the worker processes of from_items_parallel.
     """
-    lst = []
-    index1 = 0
-    index2 = 0
-    while index1 < len(lst1) and index2 < len(lst2):
-        if lst1[index1][1] >= lst2[index2][1]:
-            lst.append(lst1[index1])
-            index1 += 1
-        else:
-            lst.append(lst2[index2])
-            index2 += 1
-    if index1 == len(lst1):
-        lst += lst2[index2:]
-    else:
-        lst += lst1[index1:]
-    return lst
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return cls.from_items(weight_type, items)._snapshot()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _write_snapshot(path: str, tree: Autocompleter, header: Any,
+                    columns: List[array]) -> None:
+    """Write a snapshot of <tree> to the file at <path>.
+
+    The snapshot is made up of <header>, which is pickled, and the arrays in
+    <columns>, which are written out in little-endian byte order.
+    """
+    header = pickle.dumps((tree.__class__.__name__, header),
+                          pickle.HIGHEST_PROTOCOL)
+    with open(path, 'wb') as f:
+        f.write(_SNAPSHOT_START.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION,
+                                     len(header)))
+        f.write(header)
+        for column in columns:
+            if sys.byteorder == 'big':
+                column = array(column.typecode, column)
+                column.byteswap()
+            f.write(struct.pack('<Q', len(column)))
+            f.write(column.tobytes())
+
+
+def _read_snapshot(path: str, cls: type,
+                   typecodes: str) -> Tuple[Any, List[array]]:
+    """Return the header and the columns of the snapshot in the file at
+    <path>, which must hold a snapshot of a <cls> with one column for each
+    of the array typecodes in <typecodes>.
+
+    Raise ValueError if <path> is not such a snapshot.
+    """
+    with open(path, 'rb') as f:
+        start = f.read(_SNAPSHOT_START.size)
+        if len(start) < _SNAPSHOT_START.size:
+            raise ValueError(f'{path} is not a prefix tree snapshot')
+        magic, version, header_size = _SNAPSHOT_START.unpack(start)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError(f'{path} is not a prefix tree snapshot')
+        elif version != _SNAPSHOT_VERSION:
+            raise ValueError(f'{path} has snapshot version {version}, not '
+                             f'{_SNAPSHOT_VERSION}')
+        header = f.read(header_size)
+        if len(header) < header_size:
+            raise ValueError(f'{path} is a truncated snapshot')
+        name, header = pickle.loads(header)
+        if name != cls.__name__:
+            raise ValueError(f'{path} holds a {name}, not a {cls.__name__}')
+        columns = []
+        for typecode in typecodes:
+            column = array(typecode)
+            size = f.read(8)
+            if len(size) < 8:
+                raise ValueError(f'{path} is a truncated snapshot')
+            size = struct.unpack('<Q', size)[0] * column.itemsize
+            data = f.read(min(size, sys.maxsize))
+            if len(data) < size:
+                raise ValueError(f'{path} is a truncated snapshot')
+            column.frombytes(data)
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns.append(column)
+    return header, columns
+
+
+class _TopK(list):
+    """A list of at most <size> cached (value, weight) completions."""
+    __slots__ = ('size',)
+    size: int
+
+    def __init__(self, size: int) -> None:
+        """Initialize an empty cache that holds up to <size> completions."""
+        list.__init__(self)
+        self.size = size
+
+
+class _Tombstones:
+    """The trees below a prefix tree that are still to be compacted after
+    removals that used tombstones.
+
+    === Attributes ===
+    dirty:
+        Each tree with a tombstone or touched subtree below it, mapped to the
+        length of its prefix.
+    touched:
+        Each subtree on the path to a tombstone, mapped to the number of
+        the last removal that passed through it.
+    count:
+        The number of removals recorded.
+    """
+    __slots__ = ('dirty', 'touched', 'count')
+    dirty: Dict[SimplePrefixTree, int]
+    touched: Dict[SimplePrefixTree, int]
+    count: int
+
+    def __init__(self) -> None:
+        """Initialize a record of no removals."""
+        self.dirty = {}
+        self.touched = {}
+        self.count = 0
+
+
+class _NoSubtrees(list):
+    """A read-only empty list, shared as the subtrees of every leaf."""
+    __slots__ = ()
+
+    def _read_only(self, *args: Any) -> None:
+        """Refuse to modify this list."""
+        raise TypeError('a leaf has no subtrees')
+
+    append = extend = insert = remove = pop = clear = sort = reverse = \
+        __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+
+_NO_SUBTREES = _NoSubtrees()
 
 
 ################################################################################
@@ -346,14 +1553,28 @@ class CompressedPrefixTree(SimplePrefixTree):
     subtrees:
         A list of subtrees of this prefix tree.
 
+    === Private Attributes ===
+    _children:
+        A mapping from the first token of each compressed edge below this
+        tree to the non-leaf subtree in self.subtrees at the end of that edge,
+        or None if this tree has too few subtrees to be worth indexing.
+    _value:
+        If this tree is a leaf, the value stored in it. Otherwise, the
+        prefix of this tree as a chain of (parent prefix, edge) pairs that
+        ends in None, where each edge is a tuple of tokens.
+
     === Representation invariants ===
     - self.weight >= 0
 
     - (EMPTY TREE):
-        If self.weight == 0, then self.value == [] and self.subtrees == [].
+        If self.weight == 0, then self.value == [] and self.subtrees == [],
+        where self.subtrees is a list of this tree's own, not _NO_SUBTREES.
         This represents an empty simple prefix tree.
     - (LEAF):
-        If self.subtrees == [] and self.weight > 0, this tree is a leaf.
+        This tree is a leaf if and only if self.subtrees is _NO_SUBTREES,
+        the read-only empty list shared by every leaf, and then
+        self.weight > 0. Every leaf must use _NO_SUBTREES: a tree whose
+        subtrees are any other empty list is not a leaf.
         (self.value is a value that was inserted into this tree.)
     - (NON-EMPTY, NON-LEAF):
         If len(self.subtrees) > 0, then self.value is a list (*common prefix*),
@@ -370,13 +1591,41 @@ class CompressedPrefixTree(SimplePrefixTree):
       both can appear in the same self.subtrees list, and both have a `weight`
       attribute.
     """
+    __slots__ = ()
     value: Optional[Any]
     weight: float
     subtrees: List[CompressedPrefixTree]
+    _children: Dict[Any, CompressedPrefixTree]
 
     def __init__(self, weight_type: str) -> None:
         SimplePrefixTree.__init__(self, weight_type)
 
+    def _pack(self, prefix: List) -> Optional[tuple]:
+        """Return <prefix> as a chain of (parent prefix, edge) pairs."""
+        if prefix == []:
+            return None
+        return None, tuple(prefix)
+
+    def _unpack(self, cell: Optional[tuple]) -> List:
+        """Return the prefix list for the chain <cell> built by _pack."""
+        edges = []
+        while cell is not None:
+            edges.append(cell[1])
+            cell = cell[0]
+        prefix = []
+        for edge in reversed(edges):
+            prefix.extend(edge)
+        return prefix
+
+    def _edge_length(self) -> int:
+        """Return the number of tokens on the edge leading to this tree."""
+        return len(self._value[1])
+
+    def _first_token(self) -> Any:
+        """Return the first token on the edge leading to this non-leaf tree.
+        """
+        return self._value[1][0]
+
     def insert(self, value: Any, weight: float, prefix: List) -> None:
         """Insert the given value into this Autocompleter.
         >>> tree = CompressedPrefixTree('average')
@@ -390,56 +1639,133 @@ class CompressedPrefixTree(SimplePrefixTree):
         >>> tree.insert('copy', 2, ['c', 'o', 'p', 'y'])
         >>> tree.insert('cop', 2, ['c', 'o', 'p'])
         >>> print(tree._str_indented())
-        ''
+        [] (3.0)
+          ['c'] (3.1666666666666665)
+            ['c', 'a'] (3.3333333333333335)
+              ['c', 'a', 'r'] (3.5)
+                car (5)
+                ['c', 'a', 'r', 'e'] (2.0)
+                  care (2)
+              ['c', 'a', 't'] (3.0)
+                cat (3)
+            ['c', 'o', 'p'] (3.0)
+              cop (4)
+              ['c', 'o', 'p', 'e'] (3.0)
+                cope (3)
+              ['c', 'o', 'p', 'y'] (2.0)
+                copy (2)
+          ['d'] (2.5)
+            ['d', 'a', 'n', 'g', 'e', 'r'] (4.0)
+              danger (4)
+            ['d', 'o', 'o', 'r'] (1.0)
+              door (1)
+        <BLANKLINE>
         """
-        if self.value == prefix:
-            for sub in self.subtrees:
-                if sub.value == value:
-                    sub.weight += weight
-                    self._update_weight()
-                    return
-            new_node = CompressedPrefixTree(self.weight_type)
-            new_node.value = value
-            new_node.weight = weight
-            self._insert_helper(new_node)
-            self._update_weight()
-        else:
-            for sub in self.subtrees:
-                if isinstance(sub.value, str):
-                    continue
-                elif sub.value == prefix[:len(sub.value)]:
-                    sub.insert(value, weight, prefix)
-                    self._update_weight()
-                    self.subtrees.remove(sub)
-                    self._insert_helper(sub)
-                    return
-                else:
-                    i = len(self.value)
-                    while i < len(sub.value) and i < len(prefix) and \
-                            sub.value[i] == prefix[i]:
-                        i += 1
-                    if i != len(self.value):
-                        self.subtrees.remove(sub)
-                        new_node = CompressedPrefixTree(self.weight_type)
-                        new_node.value = prefix[:i]
-                        new_node.subtrees.append(sub)
-                        new_node.insert(value, weight, prefix)
-                        new_node._update_weight()
-                        self._insert_helper(new_node)
-                        self._update_weight()
-                        return
-
-            new_node = CompressedPrefixTree(self.weight_type)
-            new_node.weight = weight
-            new_node.value = prefix
-            new_node.insert(value, weight, prefix)
-            self._insert_helper(new_node)
-            self._update_weight()
+        SimplePrefixTree.insert(self, value, weight, prefix)
+
+    def _insert_step(self, prefix: List,
+                     depth: int) -> Tuple[CompressedPrefixTree, int, bool]:
+        """
+        Helper method for insert.
+        Return the subtree that prefix[depth:] continues into, creating it if
+        there is none, as a tuple (subtree, subtree depth, is new), where
+        "is new" is True if subtree is not in self.subtrees yet.
+
+        If prefix[depth:] leaves a compressed edge partway along, the edge
+        is split there, and the new tree at the split is returned.
+        Precondition: this tree's prefix is prefix[:depth], and
+                      depth < len(prefix)
+        """
+        sub = self._get_child(prefix[depth])
+        if sub is None:
+            new_node = self._new_node()
+            new_node._value = (self._value, tuple(prefix[depth:]))
+            self._set_child(prefix[depth], new_node)
+            return new_node, len(prefix), True
+        edge = sub._value[1]
+        i = 1
+        while i < len(edge) and depth + i < len(prefix) and \
+                edge[i] == prefix[depth + i]:
+            i += 1
+        if i == len(edge):
+            return sub, depth + i, False
+
+        self.subtrees.remove(sub)
+        new_node = self._new_node()
+        new_node._value = (self._value, edge[:i])
+        # sub is copied rather than changed, so that insert only changes the
+        # trees on its path. sub's own subtrees still refer to its old
+        # chain, which spells out the same prefix.
+        sub = sub._copy()
+        sub._value = (new_node._value, edge[i:])
+        new_node.subtrees.append(sub)
+        new_node._max = sub._max
+        new_node._add_leaf_weight(sub._num, sub._total)
+        self._set_child(prefix[depth], new_node)
+        return new_node, depth + i, True
+
+    def _build_edges(self, prefix: List, depth: int) -> List[Tuple[Any, int]]:
+        """
+        Helper method for from_items.
+        Return the edges of the new trees needed below the tree for
+        prefix[:depth] to reach the tree for <prefix>, each paired with the
+        length of the prefix at the end of the edge.
+
+        A single compressed edge is enough; from_items splits it later if
+        another prefix leaves it partway along.
+        """
+        if depth == len(prefix):
+            return []
+        return [(tuple(prefix[depth:]), len(prefix))]
+
+    def _merge_child(self, sub: CompressedPrefixTree,
+                     token: Any) -> CompressedPrefixTree:
+        """
+        Helper method for remove.
+        Return the subtree to keep in place of <sub>, the non-leaf subtree
+        of this tree whose edge starts with <token>, after values have been
+        removed from <sub>.
+
+        If <sub> is left with a single subtree, which is not a leaf, then
+        <sub> is compressible, and that subtree is returned instead, with
+        the edge to <sub> joined onto the front of its own edge.
+        """
+        if len(sub.subtrees) != 1 or sub.subtrees[0].is_leaf():
+            return sub
+        # As when an edge is split, the child is copied, and the subtrees of
+        # the child keep its old chain.
+        child = sub.subtrees[0]._copy()
+        child._value = (self._value, sub._value[1] + child._value[1])
+        if self._children is not None:
+            self._children[token] = child
+        return child
+
+    def _child_for(self, prefix: List,
+                   depth: int) -> Optional[CompressedPrefixTree]:
+        """
+        Return the subtree of this tree whose compressed edge agrees with
+        <prefix> for as long as both go on, or None if there is no such
+        subtree or it is a tombstone.
+        Precondition: this tree's prefix is prefix[:depth], and
+                      depth < len(prefix)
+        """
+        sub = self._get_child(prefix[depth])
+        if sub is None or sub._num == 0:
+            return None
+        edge = sub._value[1]
+        for i in range(1, min(len(edge), len(prefix) - depth)):
+            if edge[i] != prefix[depth + i]:
+                return None
+        return sub
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'max-nested-blocks': 4
+        'max-nested-blocks': 4,
+        'allowed-io': ['_write_snapshot', '_read_snapshot'],
+        'extra-imports': ['gc', 'heapq', 'os', 'pickle', 'struct', 'sys',
+                          'array', 'concurrent.futures', 'itertools',
+                          'frozen_prefix_tree']
     })
@@ -0,0 +1,408 @@
+"""CSC148 Assignment 2: String radix tree
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains StringRadixTree, an implementation of the Autocompleter
+interface whose prefix sequences are strings rather than lists, for the
+letter autocomplete engine. Every edge is labelled with a str, and prefixes
+are matched against edges with str.startswith, so neither building the tree
+nor querying it needs a list of one-character strings for each prefix.
+"""
+from __future__ import annotations
+import heapq
+from itertools import count, islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from prefix_tree import Autocompleter
+
+
+class StringRadixTree(Autocompleter):
+    """A compressed prefix tree over the characters of string prefixes.
+
+    Like in a CompressedPrefixTree, the prefix of each node is the prefix
+    of its parent followed by the label of the edge leading to it, and
+    only nodes with values or with more than one child are kept. The
+    children of each node are indexed by the first character of their edge,
+    which is different for every child.
+
+    === Attributes ===
+    weight_type:
+        A string representing the way to calculate the tree's weight.
+
+    === Private Attributes ===
+    _root:
+        The node for the empty string.
+
+    === Representation invariants ===
+    - weight_type == 'sum' or weight_type == 'average'
+    - Every node other than the root has values, or at least two children.
+    """
+    weight_type: str
+    _root: _RadixNode
+
+    def __init__(self, weight_type: str) -> None:
+        """Initialize an empty radix tree.
+
+        Precondition: weight_type == 'sum' or weight_type == 'average'.
+        """
+        self.weight_type = weight_type
+        self._root = _RadixNode('')
+
+    @classmethod
+    def from_items(cls, weight_type: str,
+                   items: Iterable[Tuple[Any, float, str]]
+                   ) -> StringRadixTree:
+        """Return a new StringRadixTree with the given <weight_type>,
+        storing every (value, weight, prefix) triple in <items> as if they
+        were inserted one at a time, in order.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        tree = cls(weight_type)
+        entries = {}
+        for value, weight, prefix in items:
+            pairs = entries.setdefault(prefix, [])
+            for pair in pairs:
+                if pair[0] == value:
+                    pair[1] += weight
+                    break
+            else:
+                pairs.append([value, weight])
+        tree._build(sorted(entries), entries)
+        return tree
+
+    def _build(self, keys: List[str], entries: Dict[str, List]) -> None:
+        """
+        Helper method for from_items.
+        Build the nodes for the sorted strings <keys>, with the values in
+        <entries>, below the root of this empty tree.
+        """
+        # Each node still to be filled in, with the range of <keys> below it
+        # and the length of its prefix. Every node is added after its parent.
+        nodes = [(self._root, 0, len(keys), 0)]
+        for node, lo, hi, depth in nodes:
+            if lo < hi and len(keys[lo]) == depth:
+                node.values = entries[keys[lo]]
+                lo += 1
+            if lo < hi:
+                node.children = {}
+            while lo < hi:
+                char = keys[lo][depth]
+                end = lo + 1
+                while end < hi and keys[end][depth] == char:
+                    end += 1
+                # The keys are sorted, so the prefix the keys in the range
+                # share is the prefix the first and last of them share.
+                length = _match(keys[end - 1], depth, keys[lo][depth:])
+                child = _RadixNode(keys[lo][depth:depth + length])
+                node.children[char] = child
+                nodes.append((child, lo, end, depth + length))
+                lo = end
+
+        for node, _, _, _ in reversed(nodes):
+            for pair in node.values or []:
+                node.num += 1
+                node.total += pair[1]
+                node.max = max(node.max, pair[1])
+            for child in (node.children or {}).values():
+                node.num += child.num
+                node.total += child.total
+                node.max = max(node.max, child.max)
+
+    @property
+    def weight(self) -> float:
+        """The aggregate weight of this tree, or 0.0 if it is empty."""
+        if self._root.num == 0:
+            return 0.0
+        elif self.weight_type == 'sum':
+            return self._root.total
+        else:
+            return self._root.total / self._root.num
+
+    def is_empty(self) -> bool:
+        """Return whether this tree is empty."""
+        return self._root.num == 0
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this tree."""
+        return self._root.num
+
+    def count(self, prefix: str) -> int:
+        """Return the number of values that match the given prefix."""
+        path = self._find(prefix)
+        if path == []:
+            return 0
+        return path[-1].num
+
+    def _find(self, prefix: str) -> List[_RadixNode]:
+        """Return the nodes from the root to the highest node whose values
+        all match <prefix>, or an empty list if no node matches <prefix>.
+        """
+        node = self._root
+        path = [node]
+        depth = 0
+        while depth < len(prefix):
+            if node.children is None or prefix[depth] not in node.children:
+                return []
+            node = node.children[prefix[depth]]
+            path.append(node)
+            if not prefix.startswith(node.edge, depth):
+                # <prefix> may end partway along the edge to <node>.
+                if node.edge.startswith(prefix[depth:]):
+                    return path
+                return []
+            depth += len(node.edge)
+        return path
+
+    def insert(self, value: Any, weight: float, prefix: str) -> None:
+        """Insert the given value into this Autocompleter.
+
+        The value is inserted with the given weight, and is associated with
+        the prefix string <prefix>.
+
+        If the value has already been inserted into this prefix tree
+        (compare values using ==), then the given weight should be *added* to
+        the existing weight of this value.
+
+        Preconditions:
+            weight > 0
+            The given value is either:
+                1) not in this Autocompleter
+                2) was previously inserted with the SAME prefix string
+        """
+        node = self._root
+        path = [node]
+        depth = 0
+        while depth < len(prefix):
+            char = prefix[depth]
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(char)
+            if child is None:
+                child = _RadixNode(prefix[depth:])
+                node.children[char] = child
+                path.append(child)
+                break
+            length = _match(prefix, depth, child.edge)
+            if length < len(child.edge):
+                # Split the edge where <prefix> leaves it.
+                middle = _RadixNode(child.edge[:length])
+                child.edge = child.edge[length:]
+                middle.children = {child.edge[0]: child}
+                middle.num = child.num
+                middle.total = child.total
+                middle.max = child.max
+                node.children[char] = middle
+                child = middle
+            node = child
+            path.append(node)
+            depth += length
+
+        node = path[-1]
+        if node.values is None:
+            node.values = []
+        for pair in node.values:
+            if pair[0] == value:
+                pair[1] += weight
+                added = 0
+                break
+        else:
+            pair = [value, weight]
+            node.values.append(pair)
+            added = 1
+        for node in path:
+            node.num += added
+            node.total += weight
+            node.max = max(node.max, pair[1])
+
+    def autocomplete(self, prefix: str,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        The return value is a list of tuples (value, weight), and must be
+        ordered in non-increasing weight. The <limit> heaviest matches are
+        returned.
+
+        If limit is None, return *every* match for the given prefix.
+
+        Precondition: limit is None or limit > 0.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        return list(islice(self.iter_autocomplete(prefix), limit))
+
+    def iter_autocomplete(self, prefix: str) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a tuple (value, weight),
+        in non-increasing weight order.
+
+        Nodes are explored in order of the largest weight below them, so
+        that only as much of the tree is visited as is needed for the
+        matches yielded. This tree must not be changed while the matches are
+        being yielded.
+        """
+        path = self._find(prefix)
+        if path != [] and path[-1].num > 0:
+            yield from self._search(path[-1])
+
+    def _search(self, node: _RadixNode) -> Iterator[Tuple[Any, float]]:
+        """
+        Helper method for iter_autocomplete and autocomplete_many.
+        Yield every value below <node> as a tuple (value, weight), in
+        non-increasing weight order.
+        """
+        # Ties go to the most recently pushed entry. Values are pushed as
+        # lists and nodes as themselves, and are told apart by type.
+        order = count(0, -1)
+        heap = [(-node.max, next(order), node)]
+        while heap:
+            _, _, entry = heapq.heappop(heap)
+            if isinstance(entry, list):
+                yield entry[0], entry[1]
+                continue
+            for pair in entry.values or []:
+                heapq.heappush(heap, (-pair[1], next(order), pair))
+            for child in (entry.children or {}).values():
+                heapq.heappush(heap, (-child.max, next(order), child))
+
+    def autocomplete_many(self, prefixes: List[str],
+                          limit: Optional[int] = None
+                          ) -> List[List[Tuple[Any, float]]]:
+        """Return the result of autocomplete with <limit> for each prefix in
+        <prefixes>, in the same order as <prefixes>.
+
+        The prefixes are taken in sorted order, and the nodes on the way to
+        the last prefix are kept, so the edges a prefix shares with the one
+        before it are not matched again.
+
+        Precondition: limit is None or limit > 0.
+        """
+        answers = [[] for _ in prefixes]
+        if limit is not None and limit <= 0:
+            return answers
+        # Each node on the way to the last prefix, with the length of the
+        # string up to the end of its edge.
+        path = [(0, self._root)]
+        previous = None
+        for i in sorted(range(len(prefixes)), key=prefixes.__getitem__):
+            prefix = prefixes[i]
+            if previous is not None and prefix == prefixes[previous]:
+                answers[i] = list(answers[previous])
+                continue
+            elif previous is not None:
+                shared = _match(prefix, 0, prefixes[previous])
+                while len(path) > 1 and path[-1][0] > shared:
+                    path.pop()
+            previous = i
+            depth, node = path[-1]
+            while depth < len(prefix):
+                if node.children is None or \
+                        prefix[depth] not in node.children:
+                    node = None
+                    break
+                node = node.children[prefix[depth]]
+                if not prefix.startswith(node.edge, depth) and \
+                        not node.edge.startswith(prefix[depth:]):
+                    node = None
+                    break
+                depth += len(node.edge)
+                path.append((depth, node))
+            if node is not None and node.num > 0:
+                answers[i] = list(islice(self._search(node), limit))
+        return answers
+
+    def remove(self, prefix: str) -> None:
+        """Remove all values that match the given prefix.
+        """
+        path = self._find(prefix)
+        if path == [] or path[-1].num == 0:
+            return
+        num, total = path[-1].num, path[-1].total
+        if len(path) == 1:
+            self._root = _RadixNode('')
+            return
+
+        # Cut off the highest node that has no values left.
+        cut = 1
+        while path[cut].num != num:
+            cut += 1
+        parent = path[cut - 1]
+        del parent.children[path[cut].edge[0]]
+        if parent.children == {}:
+            parent.children = None
+
+        for node in reversed(path[:cut]):
+            node.num -= num
+            node.total = node.total - total if node.num > 0 else 0.0
+            node.max = max([pair[1] for pair in node.values or []] +
+                           [child.max for child in
+                            (node.children or {}).values()], default=0.0)
+
+        # The parent may now be a node with one child and no values, which
+        # is merged into its child.
+        if cut > 1 and parent.values is None and len(parent.children) == 1:
+            child = next(iter(parent.children.values()))
+            child.edge = parent.edge + child.edge
+            path[cut - 2].children[child.edge[0]] = child
+
+
+class _RadixNode:
+    """A node of a StringRadixTree.
+
+    === Attributes ===
+    edge:
+        The label of the edge leading to this node, or the empty string for
+        the root.
+    children:
+        A mapping from the first character of the edge of each child of this
+        node to that child, or None if this node has no children.
+    values:
+        A list of [value, weight] pairs for the values whose prefix is the
+        prefix of this node, or None if there are none.
+    num:
+        The number of values that match the prefix of this node.
+    total:
+        The sum of the weights of those values.
+    max:
+        The largest weight of those values, or 0.0 if there are none.
+    """
+    __slots__ = ('edge', 'children', 'values', 'num', 'total', 'max')
+    edge: str
+    children: Optional[Dict[str, _RadixNode]]
+    values: Optional[List[List]]
+    num: int
+    total: float
+    max: float
+
+    def __init__(self, edge: str) -> None:
+        """Initialize a node with no values below it, reached by <edge>."""
+        self.edge = edge
+        self.children = None
+        self.values = None
+        self.num = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+def _match(s: str, start: int, edge: str) -> int:
+    """Return the length of the longest common prefix of <edge> and the
+    part of <s> from index <start>.
+    """
+    if s.startswith(edge, start):
+        return len(edge)
+    length = 0
+    end = min(len(edge), len(s) - start)
+    while length < end and s[start + length] == edge[length]:
+        length += 1
+    return length
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4,
+        'extra-imports': ['heapq', 'itertools', 'prefix_tree']
+    })
@@ -0,0 +1,299 @@
+"""CSC148 Assignment 2: Sharded autocompleter
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains ShardedAutocompleter, an Autocompleter that splits its
+values between several worker processes by the first token of their prefix,
+so that queries can use more than one core. Each worker holds a prefix tree
+of its own shard of the values. A query for a non-empty prefix only needs
+the shard for its first token, while a query for the empty prefix is sent
+to every shard at once, and their answers are merged.
+"""
+from __future__ import annotations
+import heapq
+import multiprocessing
+import os
+import threading
+from itertools import islice
+from typing import Any, Iterable, List, Optional, Tuple, Type
+
+from prefix_tree import Autocompleter, SimplePrefixTree, CompressedPrefixTree
+
+
+class ShardedAutocompleter(Autocompleter):
+    """An Autocompleter whose values are held by worker processes.
+
+    Values with a non-empty prefix go to the shard picked by the hash of
+    the first token of their prefix, and values with the empty prefix go to
+    shard 0. Every shard is served by its own process, which answers the
+    requests sent to it in order.
+
+    Requests to different shards can be answered at the same time, by
+    different threads of the calling process, and a request for the empty
+    prefix is answered by all of the shards at the same time.
+
+    === Attributes ===
+    weight_type:
+        A string representing the way to calculate the weight.
+
+    === Private Attributes ===
+    _connections:
+        The connection to the worker process for each shard.
+    _workers:
+        The worker process for each shard.
+    _locks:
+        A lock for each shard, held from the time a request is sent to its
+        worker until the answer is received. Requests to several shards
+        take their locks in order of shard.
+
+    === Representation invariants ===
+    - weight_type == 'sum' or weight_type == 'average'
+    - len(_connections) == len(_workers) == len(_locks) > 0
+    """
+    weight_type: str
+    _connections: List[Any]
+    _workers: List[multiprocessing.Process]
+    _locks: List[threading.Lock]
+
+    def __init__(self, weight_type: str, shards: Optional[int] = None,
+                 tree_class: Type[SimplePrefixTree] = CompressedPrefixTree,
+                 items: Iterable[Tuple[Any, float, List]] = ()) -> None:
+        """Initialize a sharded autocompleter with the given <weight_type>
+        and number of <shards>, storing every (value, weight, prefix) triple
+        in <items>. Each shard is held in a tree of class <tree_class>,
+        which is built by the shard's worker with from_items. Queries pass
+        the exact option of SimplePrefixTree.autocomplete on to the shards,
+        so <tree_class> must be SimplePrefixTree or a subclass of it.
+
+        If <shards> is None, there is one shard for each CPU.
+
+        Precondition: weight_type == 'sum' or weight_type == 'average',
+                      shards is None or shards > 0, and tree_class is
+                      SimplePrefixTree or a subclass of it.
+        """
+        self.weight_type = weight_type
+        if shards is None:
+            shards = os.cpu_count() or 1
+        self._connections = []
+        self._workers = []
+        self._locks = [threading.Lock() for _ in range(shards)]
+        split = [[] for _ in range(shards)]
+        for item in items:
+            split[self._shard(item[2])].append(item)
+        for shard_items in split:
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_serve, daemon=True,
+                args=(worker_connection, tree_class, weight_type,
+                      shard_items))
+            worker.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._workers.append(worker)
+
+    @classmethod
+    def from_items(cls, weight_type: str,
+                   items: Iterable[Tuple[Any, float, List]]
+                   ) -> ShardedAutocompleter:
+        """Return a new ShardedAutocompleter with the given <weight_type>
+        and one shard for each CPU, storing every (value, weight, prefix)
+        triple in <items> as if they were inserted one at a time, in order.
+
+        The shards are built at the same time, each by its own worker.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        return cls(weight_type, items=items)
+
+    def close(self) -> None:
+        """Stop the worker processes. This autocompleter can no longer be
+        used afterwards.
+        """
+        for connection, worker in zip(self._connections, self._workers):
+            connection.send(None)
+            connection.close()
+            worker.join()
+
+    def _shard(self, prefix: List) -> int:
+        """Return the shard that holds the values with prefix <prefix>."""
+        if prefix == []:
+            return 0
+        return hash(prefix[0]) % len(self._locks)
+
+    def _request(self, shard: int, method: str, args: tuple) -> Any:
+        """Return the result of calling <method> with <args> on the tree of
+        <shard>.
+        """
+        with self._locks[shard]:
+            self._connections[shard].send((method, args))
+            return _answer(self._connections[shard].recv())
+
+    def _request_all(self, method: str, args: tuple) -> List[Any]:
+        """Return the results of calling <method> with <args> on the tree of
+        every shard, in order of shard.
+
+        The request is sent to every shard before any answer is waited for,
+        so that the shards answer it at the same time.
+        """
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            for connection in self._connections:
+                connection.send((method, args))
+            return [_answer(connection.recv())
+                    for connection in self._connections]
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    @property
+    def weight(self) -> float:
+        """The aggregate weight of the values in every shard, or 0.0 if
+        there are none.
+        """
+        num = 0
+        total = 0.0
+        for shard_num, shard_weight in self._request_all('_aggregates', ()):
+            num += shard_num
+            total += shard_weight
+        if num == 0:
+            return 0.0
+        elif self.weight_type == 'sum':
+            return total
+        else:
+            return total / num
+
+    def is_empty(self) -> bool:
+        """Return whether this autocompleter is empty."""
+        return len(self) == 0
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this autocompleter."""
+        return sum(self._request_all('__len__', ()))
+
+    def count(self, prefix: List) -> int:
+        """Return the number of values that match the given prefix."""
+        if prefix == []:
+            return len(self)
+        return self._request(self._shard(prefix), 'count', (prefix,))
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value into this Autocompleter.
+
+        The value is inserted with the given weight, and is associated with
+        the prefix sequence <prefix>.
+
+        If the value has already been inserted into this prefix tree
+        (compare values using ==), then the given weight should be *added* to
+        the existing weight of this value.
+
+        Preconditions:
+            weight > 0
+            The given value is either:
+                1) not in this Autocompleter
+                2) was previously inserted with the SAME prefix sequence
+        """
+        self._request(self._shard(prefix), 'insert', (value, weight, prefix))
+
+    def insert_many(self, items: Iterable[Tuple[Any, float, List]]) -> None:
+        """Insert every (value, weight, prefix) triple in <items> into this
+        Autocompleter, as if insert were called on each of them in order.
+
+        Each shard is sent its triples in one request.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        split = [[] for _ in self._locks]
+        for item in items:
+            split[self._shard(item[2])].append(item)
+        for shard, shard_items in enumerate(split):
+            if shard_items:
+                self._request(shard, 'insert_many', (shard_items,))
+
+    def autocomplete(self, prefix: List, limit: Optional[int] = None,
+                     exact: bool = False) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        The return value is a list of tuples (value, weight), and must be
+        ordered in non-increasing weight.
+
+        If limit is None, return *every* match for the given prefix.
+
+        The matches for a non-empty prefix are found as by the autocomplete
+        method of the tree of its shard, with <exact>. For the empty prefix,
+        every shard finds its <limit> heaviest matches, and the heaviest
+        <limit> of them all are returned, so the <limit> heaviest values
+        are always returned, whatever <exact> is.
+
+        Precondition: limit is None or limit > 0.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        elif prefix != []:
+            return self._request(self._shard(prefix), 'autocomplete',
+                                 (prefix, limit, exact))
+        # The heaviest values of all may each be in any shard, so every
+        # shard must return its own heaviest values.
+        results = self._request_all('autocomplete', (prefix, limit, True))
+        return list(islice(heapq.merge(*results, key=lambda item: item[1],
+                                       reverse=True), limit))
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix.
+        """
+        if prefix == []:
+            self._request_all('remove', (prefix,))
+        else:
+            self._request(self._shard(prefix), 'remove', (prefix,))
+
+
+def _serve(connection: Any, tree_class: Type[SimplePrefixTree],
+           weight_type: str, items: List[Tuple[Any, float, List]]) -> None:
+    """Serve the requests received on <connection> with a tree of class
+    <tree_class>, holding the triples in <items>, until None is received.
+
+    Each request is a tuple (method, args), and is answered with a tuple
+    (True, result) or, if the request raised an exception, (False,
+    exception). The request '_aggregates' is answered with the number of
+    values in the tree and their total weight, as stored by the tree.
+    """
+    tree = tree_class.from_items(weight_type, items)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        method, args = request
+        try:
+            if method == '_aggregates':
+                # The stored total, rather than one worked back out of an
+                # average weight, which would carry its rounding error.
+                result = tree._num, tree._total
+            else:
+                result = getattr(tree, method)(*args)
+            connection.send((True, result))
+        except Exception as error:  # pylint: disable=broad-except
+            connection.send((False, error))
+    connection.close()
+
+
+def _answer(answer: Tuple[bool, Any]) -> Any:
+    """Return the result in the <answer> of a worker, or raise the exception
+    in it.
+    """
+    succeeded, result = answer
+    if not succeeded:
+        raise result
+    return result
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4,
+        'extra-imports': ['heapq', 'multiprocessing', 'os', 'threading',
+                          'itertools', 'prefix_tree']
+    })
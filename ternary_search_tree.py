@@ -0,0 +1,387 @@
+"""CSC148 Assignment 2: Ternary search tree
+
+=== CSC148 Fall 2018 ===
+Department of Computer Science,
+University of Toronto
+
+=== Module Description ===
+This file contains TernarySearchTree, an implementation of the Autocompleter
+interface for prefix sequences over large alphabets, such as the words of the
+sentence engine. Instead of a list of subtrees, the children of each prefix
+are kept in a binary search tree ordered by token, so that following a token
+takes O(log s) comparisons for a prefix with s children, rather than a scan.
+"""
+from __future__ import annotations
+import heapq
+from itertools import count, islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from prefix_tree import Autocompleter
+
+# The kinds of entry in the heap used to search a TernarySearchTree.
+_VALUE = 0
+_PREFIX = 1
+_SPAN = 2
+
+
+class TernarySearchTree(Autocompleter):
+    """A prefix tree in which the children of each prefix are kept in a
+    binary search tree, ordered by their last token.
+
+    Each node stands for one prefix sequence, the prefix of its parent in
+    the search tree it belongs to plus its own token. Its eq child is the
+    root of the search tree of the prefixes one token longer, and its lo
+    and hi children are the nodes for tokens smaller and larger than its
+    own, for the same parent prefix.
+
+    === Attributes ===
+    weight_type:
+        A string representing the way to calculate the tree's weight.
+
+    === Private Attributes ===
+    _root:
+        The node for the empty prefix sequence. Its token is None, and it
+        has no lo or hi children.
+
+    === Representation invariants ===
+    - weight_type == 'sum' or weight_type == 'average'
+    - Every token is comparable with every other token using <.
+    """
+    weight_type: str
+    _root: _Node
+
+    def __init__(self, weight_type: str) -> None:
+        """Initialize an empty ternary search tree.
+
+        Precondition: weight_type == 'sum' or weight_type == 'average'.
+        """
+        self.weight_type = weight_type
+        self._root = _Node(None)
+
+    @classmethod
+    def from_items(cls, weight_type: str,
+                   items: Iterable[Tuple[Any, float, List]]
+                   ) -> TernarySearchTree:
+        """Return a new TernarySearchTree with the given <weight_type>,
+        storing every (value, weight, prefix) triple in <items> as if they
+        were inserted one at a time, in order.
+
+        Each search tree is built balanced, from the middle token of its
+        sorted tokens outwards, so it has depth O(log s) however the items
+        are ordered.
+
+        Precondition: every triple satisfies the preconditions of insert.
+        """
+        tree = cls(weight_type)
+        entries = {}
+        for value, weight, prefix in items:
+            pairs = entries.setdefault(tuple(prefix), [])
+            for pair in pairs:
+                if pair[0] == value:
+                    pair[1] += weight
+                    break
+            else:
+                pairs.append([value, weight])
+        tree._build(sorted(entries), entries)
+        return tree
+
+    def _build(self, keys: List[tuple], entries: Dict[tuple, List]) -> None:
+        """
+        Helper method for from_items.
+        Build the nodes for the sorted prefix sequences <keys>, with the
+        values in <entries>, below the root of this empty tree.
+        """
+        # Each prefix node still to be filled in, with the range of <keys>
+        # below it and its depth, in breadth-first order.
+        queue = [(self._root, 0, len(keys), 0)]
+        # Each prefix node in the same order, with the nodes of its search
+        # tree in the order they were linked, each after its parent.
+        built = []
+        for node, lo, hi, depth in queue:
+            if lo < hi and len(keys[lo]) == depth:
+                node.values = entries[keys[lo]]
+                lo += 1
+            groups = []
+            while lo < hi:
+                end = lo + 1
+                while end < hi and keys[end][depth] == keys[lo][depth]:
+                    end += 1
+                groups.append((_Node(keys[lo][depth]), lo, end))
+                queue.append((groups[-1][0], lo, end, depth + 1))
+                lo = end
+            links = []
+            ranges = [(0, len(groups), node, 'eq')]
+            while ranges:
+                start, end, parent, side = ranges.pop()
+                if start < end:
+                    middle = (start + end) // 2
+                    child = groups[middle][0]
+                    setattr(parent, side, child)
+                    links.append(child)
+                    ranges.append((start, middle, child, 'lo'))
+                    ranges.append((middle + 1, end, child, 'hi'))
+            built.append((node, links))
+
+        # Every search tree is below its parent prefix node, so its nodes
+        # are finished before that node is.
+        for node, links in reversed(built):
+            for child in reversed(links):
+                child.refresh()
+                node.num += child.num
+                node.total += child.total
+            if node.values is not None:
+                node.num += len(node.values)
+                node.total += sum(pair[1] for pair in node.values)
+            node.refresh()
+
+    @property
+    def weight(self) -> float:
+        """The aggregate weight of this tree, or 0.0 if it is empty."""
+        if self._root.num == 0:
+            return 0.0
+        elif self.weight_type == 'sum':
+            return self._root.total
+        else:
+            return self._root.total / self._root.num
+
+    def is_empty(self) -> bool:
+        """Return whether this tree is empty."""
+        return self._root.num == 0
+
+    def __len__(self) -> int:
+        """Return the number of values stored in this tree."""
+        return self._root.num
+
+    def count(self, prefix: List) -> int:
+        """Return the number of values that match the given prefix."""
+        path = self._find(prefix)
+        if path == []:
+            return 0
+        return path[-1][0].num
+
+    def _find(self, prefix: List) -> List[Tuple[_Node, str]]:
+        """Return every node visited on the way from the root to the node
+        for <prefix>, each with the attribute of the previous node that
+        leads to it, or an empty list if <prefix> has no node.
+        """
+        node = self._root
+        path = [(node, '')]
+        for token in prefix:
+            side = 'eq'
+            node = node.eq
+            while node is not None and node.token != token:
+                path.append((node, side))
+                side = 'lo' if token < node.token else 'hi'
+                node = getattr(node, side)
+            if node is None:
+                return []
+            path.append((node, side))
+        return path
+
+    def insert(self, value: Any, weight: float, prefix: List) -> None:
+        """Insert the given value into this Autocompleter.
+
+        The value is inserted with the given weight, and is associated with
+        the prefix sequence <prefix>.
+
+        If the value has already been inserted into this prefix tree
+        (compare values using ==), then the given weight should be *added* to
+        the existing weight of this value.
+
+        Preconditions:
+            weight > 0
+            The given value is either:
+                1) not in this Autocompleter
+                2) was previously inserted with the SAME prefix sequence
+        """
+        node = self._root
+        visited = [node]
+        prefixes = [node]
+        for token in prefix:
+            side = 'eq'
+            parent = node
+            node = node.eq
+            while node is not None and node.token != token:
+                visited.append(node)
+                side = 'lo' if token < node.token else 'hi'
+                parent = node
+                node = getattr(node, side)
+            if node is None:
+                node = _Node(token)
+                setattr(parent, side, node)
+            visited.append(node)
+            prefixes.append(node)
+
+        if node.values is None:
+            node.values = []
+        for pair in node.values:
+            if pair[0] == value:
+                pair[1] += weight
+                added = 0
+                break
+        else:
+            pair = [value, weight]
+            node.values.append(pair)
+            added = 1
+        for node in prefixes:
+            node.num += added
+            node.total += weight
+            node.max = max(node.max, pair[1])
+        for node in visited:
+            node.span = max(node.span, pair[1])
+
+    def autocomplete(self, prefix: List,
+                     limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """Return up to <limit> matches for the given prefix.
+
+        The return value is a list of tuples (value, weight), and must be
+        ordered in non-increasing weight. The <limit> heaviest matches are
+        returned.
+
+        If limit is None, return *every* match for the given prefix.
+
+        Precondition: limit is None or limit > 0.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        return list(islice(self.iter_autocomplete(prefix), limit))
+
+    def iter_autocomplete(self, prefix: List) -> Iterator[Tuple[Any, float]]:
+        """Yield every match for the given prefix as a tuple (value, weight),
+        in non-increasing weight order.
+
+        The search takes the entries with the largest weights below them
+        first, where an entry is a value, the node for a prefix, or a whole
+        search tree of nodes, so that only as much of the tree is visited as
+        is needed for the matches yielded. This tree must not be changed
+        while the matches are being yielded.
+        """
+        path = self._find(prefix)
+        if path == [] or path[-1][0].num == 0:
+            return
+        # Ties go to the most recently pushed entry.
+        order = count(0, -1)
+        heap = [(-path[-1][0].max, next(order), _PREFIX, path[-1][0])]
+        while heap:
+            _, _, kind, entry = heapq.heappop(heap)
+            if kind == _VALUE:
+                yield entry[0], entry[1]
+            elif kind == _PREFIX:
+                for pair in entry.values or []:
+                    heapq.heappush(heap, (-pair[1], next(order), _VALUE,
+                                          pair))
+                if entry.eq is not None:
+                    heapq.heappush(heap, (-entry.eq.span, next(order), _SPAN,
+                                          entry.eq))
+            else:
+                if entry.num > 0:
+                    heapq.heappush(heap, (-entry.max, next(order), _PREFIX,
+                                          entry))
+                for child in [entry.lo, entry.hi]:
+                    if child is not None:
+                        heapq.heappush(heap, (-child.span, next(order), _SPAN,
+                                              child))
+
+    def remove(self, prefix: List) -> None:
+        """Remove all values that match the given prefix.
+        """
+        path = self._find(prefix)
+        if path == []:
+            return
+        node = path[-1][0]
+        num, total = node.num, node.total
+        node.values = None
+        node.eq = None
+        node.num = 0
+        node.total = 0.0
+
+        # Fix the aggregates on the way back up, and take out each node that
+        # no value matches any more, unless it is needed to join the two
+        # halves of its search tree.
+        for i in range(len(path) - 1, -1, -1):
+            node, side = path[i]
+            if i < len(path) - 1 and path[i + 1][1] == 'eq':
+                node.num -= num
+                node.total = node.total - total if node.num > 0 else 0.0
+            if node.num == 0:
+                node.eq = None
+            node.refresh()
+            if i > 0 and node.num == 0 and \
+                    (node.lo is None or node.hi is None):
+                setattr(path[i - 1][0], side,
+                        node.lo if node.lo is not None else node.hi)
+
+
+class _Node:
+    """A node of a TernarySearchTree.
+
+    === Attributes ===
+    token:
+        The last token of the prefix sequence of this node.
+    lo:
+        The root of the search tree of the nodes for smaller tokens, or
+        None.
+    eq:
+        The root of the search tree of the nodes for the prefix sequence of
+        this node followed by one more token, or None.
+    hi:
+        The root of the search tree of the nodes for larger tokens, or None.
+    values:
+        A list of [value, weight] pairs for the values whose prefix sequence
+        is that of this node, or None if there are none.
+    num:
+        The number of values that match the prefix sequence of this node.
+    total:
+        The sum of the weights of those values.
+    max:
+        The largest weight of those values, or 0.0 if there are none.
+    span:
+        The largest weight of a value that matches the prefix sequence of
+        this node or of any node below it in its search tree, or 0.0.
+    """
+    __slots__ = ('token', 'lo', 'eq', 'hi', 'values', 'num', 'total', 'max',
+                 'span')
+    token: Any
+    lo: Optional[_Node]
+    eq: Optional[_Node]
+    hi: Optional[_Node]
+    values: Optional[List[List]]
+    num: int
+    total: float
+    max: float
+    span: float
+
+    def __init__(self, token: Any) -> None:
+        """Initialize a node for <token> with no values below it."""
+        self.token = token
+        self.lo = None
+        self.eq = None
+        self.hi = None
+        self.values = None
+        self.num = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.span = 0.0
+
+    def refresh(self) -> None:
+        """Recompute max and span from the values of this node and the spans
+        of its children.
+        """
+        self.max = self.eq.span if self.eq is not None else 0.0
+        for pair in self.values or []:
+            if pair[1] > self.max:
+                self.max = pair[1]
+        self.span = self.max
+        if self.lo is not None and self.lo.span > self.span:
+            self.span = self.lo.span
+        if self.hi is not None and self.hi.span > self.span:
+            self.span = self.hi.span
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-nested-blocks': 4,
+        'extra-imports': ['heapq', 'itertools', 'prefix_tree']
+    })